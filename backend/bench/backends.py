@@ -0,0 +1,144 @@
+"""
+The state backends side by side: sqlite, memory and redis.
+
+For every backend one process plays --rooms rooms of --players players through
+a Who am I? round (join, controls, every game action, scoring) and a second,
+fresh process then asks every room for its /state, the way a restarted or
+second worker would. Reported per backend:
+
+    p50 / p95    request latency while playing
+    flush        one write-behind flush of everything still queued
+    reload       first /state per room in the fresh process (redis loads the
+                 room from the server here, sqlite loaded the file at startup)
+    survived     rooms the fresh process found where the first one left them
+
+redis runs against bench/resp_server.py on a free local port, or a real server
+with --redis redis://host:port (flushed first, use a scratch server).
+
+Usage (from backend/):
+    python bench/backends.py [--rooms 20] [--players 8] [--redis redis://127.0.0.1:6379]
+    python bench/backends.py --json > backends.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from resp_server import RespServer
+
+PLAY = """
+import json, statistics, sys, time
+sys.path.insert(0, "bench")
+from fastapi.testclient import TestClient
+import main
+from loadgen import GAME_ACTIONS
+
+rooms, players = int(sys.argv[1]), int(sys.argv[2])
+times = []
+
+def timed(call, *args, **kwargs):
+    start = time.perf_counter()
+    response = call(*args, **kwargs)
+    times.append((time.perf_counter() - start) * 1000)
+    response.raise_for_status()
+    return response
+
+with TestClient(main.app) as client:
+    for r in range(rooms):
+        room = f"room-{r}"
+        ids = [timed(client.post, "/join", params={"name": f"p{i}", "room": room}).json()["player_id"]
+               for i in range(players)]
+        control = lambda action: timed(client.post, "/control", params={"action": action, "room": room})
+        for action in ("start_game", "explain_round", "start_timer"):
+            control(action)
+        for pid in ids:
+            for action, payload in GAME_ACTIONS["who-am-i"]:
+                timed(client.post, "/game_action", params={"player_id": pid, "action": action, "room": room}, json=payload)
+            timed(client.get, "/state", params={"player_id": pid, "room": room})
+        control("end_game_early")
+        control("submit_score")
+    start = time.perf_counter()
+    main.store.flush()
+    flush = (time.perf_counter() - start) * 1000
+
+times.sort()
+print(json.dumps({"requests": len(times), "p50_ms": times[len(times) // 2],
+                  "p95_ms": times[int(len(times) * 0.95)], "flush_ms": flush}))
+"""
+
+RELOAD = """
+import json, sys, time
+from fastapi.testclient import TestClient
+import main
+
+rooms, players = int(sys.argv[1]), int(sys.argv[2])
+survived, total = 0, 0.0
+with TestClient(main.app) as client:
+    for r in range(rooms):
+        start = time.perf_counter()
+        response = client.get("/state", params={"room": f"room-{r}"})
+        total += (time.perf_counter() - start) * 1000
+        survived += response.status_code == 200 and response.json()["phase"] == "QUIZ_INTRO"
+print(json.dumps({"reload_ms": total / rooms, "survived": survived}))
+"""
+
+
+def run(code, env, rooms, players):
+    out = subprocess.run([sys.executable, "-c", code, str(rooms), str(players)], cwd=BACKEND_DIR,
+                         env={**os.environ, **env}, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def start_stand_in():
+    """RespServer on a free port, on an event loop thread of its own."""
+    loop = asyncio.new_event_loop()
+    server = RespServer()
+    port = loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}"
+
+
+def bench_backend(spec, rooms, players):
+    workdir = tempfile.mkdtemp()
+    env = {"GAME_BACKEND": spec, "GAME_DB": os.path.join(workdir, "game.db")}
+    result = {"backend": spec.split(":")[0], **run(PLAY, env, rooms, players)}
+    result.update(run(RELOAD, env, rooms, players))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--redis", help="real server to use instead of the stand-in")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    redis = args.redis
+    if redis:
+        from state_backend import make_backend
+        make_backend(redis, None).client.call("FLUSHALL")
+    else:
+        redis = start_stand_in()
+
+    results = [bench_backend(spec, args.rooms, args.players) for spec in ("sqlite", "memory", redis)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'backend':<8} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8} {'flush ms':>9} {'reload ms':>10} {'survived':>9}")
+    for r in results:
+        print(f"{r['backend']:<8} {r['requests']:>8} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['flush_ms']:>9.2f} "
+              f"{r['reload_ms']:>10.3f} {r['survived']:>5}/{args.rooms}")
+
+
+if __name__ == "__main__":
+    main()
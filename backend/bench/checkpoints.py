@@ -0,0 +1,119 @@
+"""
+Size and speed of room checkpoints.
+
+--rooms rooms of --players players are played into a running Chess Challenges
+round (the game with the most rows per player), then for one room:
+
+    snapshot   dump_room + encode, what the checkpoint thread and GET /checkpoint do
+    decode     the file back to rows
+    restore    restore_room over the existing room, in one transaction
+
+and the bulk loader (Checkpointer.load_all) restores every room into an empty
+database, the way a backend starts after losing its database file.
+
+Usage (from backend/):
+    python bench/checkpoints.py [--rooms 200] [--players 10] [--repeat 20]
+    python bench/checkpoints.py --json > checkpoints.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(times), 3)
+
+
+def seed(client, rooms, players):
+    for r in range(rooms):
+        room = f"room-{r}"
+        for i in range(players):
+            client.post("/join", params={"name": f"p{i}", "room": room}).raise_for_status()
+        # Who am I?, then Chess Challenges
+        for action in ("start_game", "explain_round", "start_timer", "end_game_early", "submit_score",
+                       "start_quiz", "advance_round", "start_timer"):
+            client.post("/control", params={"action": action, "room": room}).raise_for_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["GAME_DB"] = os.path.join(workdir, "checkpoints.db")
+    os.environ["GAME_CHECKPOINTS"] = os.path.join(workdir, "checkpoints")
+    from fastapi.testclient import TestClient
+    import main as app_main
+    from checkpoint import checkpoints, decode, dump_room, restore_room
+    from database import get_db_connection
+
+    with TestClient(app_main.app) as client:
+        seed(client, args.rooms, args.players)
+
+    data = checkpoints.snapshot("room-0")
+    checkpoint = decode(data)
+
+    def restore():
+        conn = get_db_connection()
+        try:
+            conn.execute("BEGIN")
+            restore_room(conn.cursor(), checkpoint, app_main.clear_room)
+            conn.commit()
+        finally:
+            conn.close()
+
+    conn = get_db_connection()
+    try:
+        rows = sum(len(t["rows"]) for t in dump_room(conn, "room-0")["tables"].values())
+    finally:
+        conn.close()
+
+    result = {
+        "players": args.players,
+        "rows": rows,
+        "bytes": len(data),
+        "snapshot_ms": median_ms(lambda: checkpoints.snapshot("room-0"), args.repeat),
+        "decode_ms": median_ms(lambda: decode(data), args.repeat),
+        "restore_ms": median_ms(restore, args.repeat),
+    }
+
+    for r in range(args.rooms):
+        checkpoints.save(f"room-{r}")
+    conn = get_db_connection()
+    try:
+        for r in range(args.rooms):
+            app_main.clear_room(conn.cursor(), f"room-{r}")
+        conn.commit()
+    finally:
+        conn.close()
+    start = time.perf_counter()
+    restored = checkpoints.load_all(app_main.clear_room)
+    result["bulk_rooms"] = len(restored)
+    result["bulk_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"one room of {result['players']} players: {result['rows']} rows, {result['bytes']} bytes")
+    print(f"  snapshot {result['snapshot_ms']} ms, decode {result['decode_ms']} ms, restore {result['restore_ms']} ms")
+    print(f"bulk load: {result['bulk_rooms']} rooms in {result['bulk_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
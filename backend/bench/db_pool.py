@@ -0,0 +1,150 @@
+"""
+/state latency while 20 players spam add_question (Who am I?) and add_move (Chess).
+
+Runs every mode in its own process against a fresh database file and prints the
+/state latency percentiles next to each other:
+
+    current - database.get_db_connection as it is now
+    legacy  - a new rollback-journal connection per request, as before the pool
+
+Usage (from backend/):  python bench/db_pool.py [--players 20] [--seconds 5]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ["legacy", "current"]
+POLLERS = 4
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class LegacyConnection(sqlite3.Connection):
+    """Plain file connection with the savepoint helpers RoomWriter expects."""
+
+    def savepoint(self):
+        self.execute("SAVEPOINT command")
+        return 0
+
+    def release_savepoint(self):
+        self.execute("RELEASE command")
+
+    def rollback_savepoint(self, mark):
+        self.execute("ROLLBACK TO command")
+        self.execute("RELEASE command")
+
+
+def legacy_connection():
+    from database import DB_NAME
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, factory=LegacyConnection)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def measure_round(client, room, player_ids, action, seconds):
+    stop = threading.Event()
+    latencies = []
+    writes = {}
+
+    def spam(pid):
+        writes[pid] = 0
+        while not stop.is_set():
+            client.post("/game_action", params={"player_id": pid, "action": action, "room": room}, json={})
+            writes[pid] += 1
+
+    def poll(pid):
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get("/state", params={"player_id": pid, "room": room})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=spam, args=(pid,)) for pid in player_ids]
+    threads += [threading.Thread(target=poll, args=(pid,)) for pid in player_ids[:POLLERS]]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        "action": action,
+        "writes_per_s": round(sum(writes.values()) / seconds, 1),
+        "state_requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def run_mode(mode, players, seconds):
+    """Runs inside the child process, GAME_DB already points at a fresh file."""
+    sys.path.insert(0, BACKEND_DIR)
+    from fastapi.testclient import TestClient
+    import database
+
+    # Swap before main is imported so init_system never switches the file to WAL
+    if mode == "legacy":
+        database.get_db_connection = legacy_connection
+    import main
+
+    room = "bench"
+    results = []
+    with TestClient(main.app) as client:
+        ids = [client.post("/join", params={"name": f"p{i}", "room": room}).json()["player_id"] for i in range(players)]
+        control = lambda action, **payload: client.post("/control", params={"action": action, "room": room}, json=payload)
+
+        # Round 1: Who am I?
+        control("start_game")
+        control("explain_round")
+        control("start_timer")
+        results.append(measure_round(client, room, ids, "add_question", seconds))
+
+        # Round 2: Chess Challenges
+        control("end_game_early")
+        control("submit_score")
+        control("start_quiz")
+        control("advance_round")
+        control("start_timer")
+        results.append(measure_round(client, room, ids, "add_move", seconds))
+
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.players, args.seconds)
+        return
+
+    print(f"{'mode':<8} {'action':<13} {'writes/s':>9} {'/state n':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, GAME_DB=os.path.join(tmp, "bench.db"))
+            out = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--players", str(args.players), "--seconds", str(args.seconds)],
+                env=env, cwd=tmp, capture_output=True, text=True, check=True,
+            ).stdout
+        for r in json.loads(out.strip().splitlines()[-1]):
+            print(f"{mode:<8} {r['action']:<13} {r['writes_per_s']:>9} {r['state_requests']:>9} "
+                  f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Micro-benchmarks of the game hooks at growing lobby sizes.
+
+For every game in GAME_LIST and every player count, a room is seeded with that
+many players the way start_game deals them: one table with one mole by default,
+like a room started without a table_size, or tables of --table-size with a mole
+each. These hooks are timed on the in-memory database:
+
+    generate_secret_state  whole room, once per repeat
+    get_player_view        per call, for a sample of players
+    handle_action          per call, the actions the load generator sends
+    calculate_scores       whole room, once per repeat
+
+Every result has the median time, the number of SQL statements per call and
+`growth`, the exponent k in time ~ players^k against the previous size. For a
+whole-room hook k > 1 means super-linear, for a per-call hook k > 0 means the
+call gets slower as the room grows.
+
+Usage (from backend/):
+    python bench/game_hooks.py [--sizes 4 20 100 1000] [--repeat 5] [--seed 1] [--table-size 10]
+    python bench/game_hooks.py --json > hooks.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from games import tables
+from loadgen import GAME_ACTIONS
+
+SIZES = [4, 20, 100, 1000]
+VIEW_SAMPLE = 20  # players whose view and actions are timed per size
+
+
+class QueryCounter:
+    """Counts the statements SQLite runs on the connection."""
+
+    def __init__(self, conn):
+        self.count = 0
+        conn.set_trace_callback(self.trace)
+
+    def trace(self, sql):
+        self.count += 1
+
+
+def measure(counter, calls):
+    """Median ms and statements per call over a list of zero-argument callables."""
+    times, queries = [], []
+    for call in calls:
+        before = counter.count
+        start = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count - before)
+    return {"ms": round(statistics.median(times), 3), "queries": round(statistics.median(queries), 1)}
+
+
+def seed_room(cur, room, players, table_size=None):
+    import main as app_main
+
+    app_main.clear_room(cur, room)
+    cur.execute("INSERT INTO game_state (room_id, phase) VALUES (?, 'EXPLANATION')", (room,))
+    cur.executemany("INSERT INTO players (room_id, name) VALUES (?, ?)", [(room, f"p{i}") for i in range(players)])
+    ids = [row["id"] for row in cur.execute("SELECT id FROM players WHERE room_id = ? ORDER BY id", (room,))]
+    # The first player of every table is its mole
+    rows = []
+    for table_idx, table in enumerate(tables.deal_tables(ids, table_size)):
+        rows += [(table_idx, i == 0, pid) for i, pid in enumerate(table)]
+    cur.executemany("UPDATE players SET table_idx = ?, is_mole = ? WHERE id = ?", rows)
+    return {pid: (table_idx, bool(is_mole)) for table_idx, is_mole, pid in rows}
+
+
+def bench_game(conn, counter, game, players, repeat, table_size=None):
+    """All hooks of one game at one size. Everything is rolled back afterwards."""
+    cur = conn.cursor()
+    room = f"bench-{players}"
+    results = []
+
+    def record(hook, fn):
+        try:
+            results.append({"game": game.id, "players": players, "hook": hook, **fn()})
+            return True
+        except Exception as e:
+            results.append({"game": game.id, "players": players, "hook": hook, "error": repr(e)})
+            return False
+
+    try:
+        seats = seed_room(cur, room, players, table_size)
+        ids = sorted(seats)
+        sample = ids[::max(1, len(ids) // VIEW_SAMPLE)][:VIEW_SAMPLE]
+        secret = {}
+
+        def generate():
+            secret["raw"] = game.generate_secret_state(cur, room)
+            return secret["raw"]
+
+        if not record("generate_secret_state", lambda: measure(counter, [generate] * repeat)):
+            return results
+        # The views get their table's secret the way main stores and reads it back
+        parsed = json.loads(json.dumps(secret["raw"]))
+
+        record("get_player_view", lambda: measure(counter, [
+            lambda pid=pid: game.get_player_view(cur, pid, seats[pid][1], parsed.get(str(seats[pid][0]), {}))
+            for pid in sample
+        ]))
+
+        actions = GAME_ACTIONS.get(game.id, [])
+        if actions:
+            record("handle_action", lambda: measure(counter, [
+                lambda pid=pid, a=a, p=p: game.handle_action(cur, pid, a, dict(p)) for pid in sample for a, p in actions
+            ]))
+
+        if hasattr(game, "calculate_scores"):
+            record("calculate_scores", lambda: measure(counter, [lambda: game.calculate_scores(cur, room)] * repeat))
+    finally:
+        conn.rollback()
+    return results
+
+
+def add_growth(results):
+    previous = {}
+    for r in results:
+        key = (r["game"], r["hook"])
+        prev = previous.get(key)
+        if "ms" in r and prev and prev["ms"] > 0 and r["ms"] > 0:
+            r["growth"] = round(math.log(r["ms"] / prev["ms"]) / math.log(r["players"] / prev["players"]), 2)
+        if "ms" in r:
+            previous[key] = r
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--table-size", type=int, default=None,
+                        help=f"split the room into tables of this size (e.g. {tables.TABLE_SIZE}), one table when left out")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    os.environ["GAME_DB"] = os.path.join(tempfile.mkdtemp(), "hooks.db")
+    import main as app_main  # creates the schema
+    from database import get_db_connection
+    from games.registry import GAME_LIST
+
+    conn = get_db_connection()
+    counter = QueryCounter(conn)
+    results = []
+    try:
+        for game in GAME_LIST:
+            for players in sorted(args.sizes):
+                random.seed(args.seed)
+                results += bench_game(conn, counter, game, players, args.repeat, args.table_size)
+    finally:
+        conn.set_trace_callback(None)
+        conn.close()
+    add_growth(results)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'game':<18} {'hook':<22} {'players':>7} {'ms':>9} {'queries':>8} {'growth':>7}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['game']:<18} {r['hook']:<22} {r['players']:>7}  ERROR {r['error']}")
+            continue
+        growth = r.get("growth", "")
+        print(f"{r['game']:<18} {r['hook']:<22} {r['players']:>7} {r['ms']:>9} {r['queries']:>8} {growth:>7}")
+
+
+if __name__ == "__main__":
+    main()
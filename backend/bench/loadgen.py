@@ -0,0 +1,289 @@
+"""
+Load generator for the whole backend: how many players and rooms can it carry?
+
+Every room gets a host that walks the /control phase sequence through all games
+in GAME_LIST, and N simulated players that behave like the frontend:
+- /join, then poll /state about once a second (with If-None-Match, like the
+  frontend does when its WebSocket is down, and since= patches with --delta)
+- bursts of /game_action while a game is running (add_question, guess,
+  toggle_task, add_move, toggle_group, ...)
+- one /submit_quiz per quiz
+
+Prints throughput and p50/p95/p99 latency per endpoint and per phase. A run can
+be saved as a baseline and later runs compared against it.
+
+By default main.app runs in-process against a temporary database. --url drives
+a server that is already running instead, e.g. `uvicorn main:app --port 8000`.
+
+Usage (from backend/):
+    python bench/loadgen.py [--rooms 1] [--players 20] [--game-seconds 10]
+    python bench/loadgen.py --save bench/baselines/local.json
+    python bench/loadgen.py --compare bench/baselines/local.json [--tolerance 20]
+    python bench/loadgen.py --url http://127.0.0.1:8000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from delta import apply_patch
+
+# Bursts sent by every player per poll while a game is running
+GAME_ACTIONS = {
+    "who-am-i": [("add_question", {}), ("guess", {"guess": "nobody"}), ("toggle_task", {"task_index": 0})],
+    "chess-challenges": [("add_move", {}), ("toggle_group", {"index": 0}), ("toggle_indiv", {"index": 1})],
+    "risky-business": [("toggle_task", {"index": 1})],
+    "dictionary-dudes": [],
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class Recorder:
+    """Collects (endpoint, phase, ms, status) for every request of the run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def add(self, endpoint, phase, ms, status):
+        with self.lock:
+            self.samples.append((endpoint, phase, ms, status))
+
+    def summary(self, wall_seconds):
+        def group(key):
+            groups = {}
+            for sample in self.samples:
+                groups.setdefault(sample[key], []).append(sample)
+            return {name: stats(rows) for name, rows in sorted(groups.items())}
+
+        def stats(rows):
+            latencies = [r[2] for r in rows]
+            return {
+                "requests": len(rows),
+                "errors": sum(1 for r in rows if r[3] >= 400),
+                "rps": round(len(rows) / wall_seconds, 1),
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+            }
+
+        return {
+            "total": stats(self.samples),
+            "endpoints": group(0),
+            "phases": group(1),
+        }
+
+
+class Room:
+    def __init__(self, client, recorder, room_id, args):
+        self.client = client
+        self.recorder = recorder
+        self.room_id = room_id
+        self.args = args
+        self.phase = "LOBBY"
+        self.done = threading.Event()
+
+    def request(self, method, path, label=None, **kwargs):
+        start = time.perf_counter()
+        r = self.client.request(method, path, **kwargs)
+        self.recorder.add(label or f"{method} {path}", self.phase, (time.perf_counter() - start) * 1000, r.status_code)
+        return r
+
+    # --- HOST ---
+    def control(self, action, **payload):
+        # A failed transition is counted as an error, the host carries on with the next one
+        self.request("POST", "/control", params={"action": action, "room": self.room_id}, json=payload)
+
+    def enter(self, phase, seconds):
+        self.phase = phase
+        time.sleep(seconds)
+
+    def host(self, game_ids):
+        args = self.args
+        try:
+            self.enter("LOBBY", args.idle_seconds)
+            self.control("start_game")
+            self.enter("REVEAL", args.idle_seconds)
+            self.control("explain_round")
+            for game_id in game_ids:
+                self.enter(f"EXPLANATION {game_id}", args.idle_seconds)
+                self.control("start_timer")
+                self.enter(f"GAME_RUNNING {game_id}", args.game_seconds)
+                self.control("end_game_early")
+                self.enter(f"SCORING {game_id}", args.idle_seconds)
+                self.control("submit_score", points=800)
+                self.enter(f"QUIZ_INTRO {game_id}", args.idle_seconds)
+                self.control("start_quiz")
+                self.enter(f"QUIZ {game_id}", args.quiz_seconds)
+                self.control("advance_round")
+            self.enter("FINAL_REVEAL", args.idle_seconds)
+        finally:
+            # Players poll until this is set, never leave them hanging
+            self.done.set()
+
+    # --- PLAYER ---
+    def player(self, name):
+        room = self.room_id
+        player_id = self.request("POST", "/join", params={"name": name, "room": room}).json()["player_id"]
+        etag, state, version = None, None, None
+        quizzes_done = set()
+        interval = 1 / self.args.poll_hz
+        next_poll = time.perf_counter() + random.uniform(0, interval)
+
+        while not self.done.is_set():
+            time.sleep(max(0, next_poll - time.perf_counter()))
+            next_poll += interval
+
+            headers = {"If-None-Match": etag} if etag else {}
+            params = {"player_id": player_id, "room": room}
+            if self.args.delta:
+                params["since"] = version or ""
+            r = self.request("GET", "/state", params=params, headers=headers)
+            if r.status_code == 200:
+                etag, body = r.headers.get("etag"), r.json()
+                if self.args.delta:
+                    version = body["version"]
+                    body = apply_patch(state, body["patch"]) if "patch" in body else body["state"]
+                state = body
+            if state is None:
+                continue
+
+            if state["phase"] == "GAME_RUNNING" and "game_specific" in state:
+                actions = GAME_ACTIONS.get(state["game_specific"].get("game_id"), [])
+                for action, payload in random.sample(actions, k=len(actions))[:self.args.burst]:
+                    self.request("POST", "/game_action", label=f"POST /game_action {action}",
+                                 params={"player_id": player_id, "action": action, "room": room}, json=payload)
+
+            elif state["phase"] == "QUIZ" and state["round_info"]["current"] not in quizzes_done and state.get("quiz_data"):
+                answers = {str(q["id"]): random.choice(q["options"]) for q in state["quiz_data"] if q["options"]}
+                self.request("POST", "/submit_quiz", params={"player_id": player_id, "room": room}, json=answers)
+                quizzes_done.add(state["round_info"]["current"])
+
+
+def run(client, args):
+    from games.registry import GAME_LIST
+
+    game_ids = [game.id for game in GAME_LIST]
+    recorder = Recorder()
+    rooms = [Room(client, recorder, f"load-{r}", args) for r in range(args.rooms)]
+    for room in rooms:
+        client.post("/reset", params={"room": room.room_id}).raise_for_status()
+
+    threads = []
+    for room in rooms:
+        threads.append(threading.Thread(target=room.host, args=(game_ids,)))
+        threads += [threading.Thread(target=room.player, args=(f"p{i}",)) for i in range(args.players)]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    report = recorder.summary(wall)
+    report["config"] = {
+        "target": args.url or "in-process",
+        "rooms": args.rooms,
+        "players": args.players,
+        "poll_hz": args.poll_hz,
+        "burst": args.burst,
+        "delta": args.delta,
+        "game_seconds": args.game_seconds,
+        "wall_seconds": round(wall, 1),
+    }
+    return report
+
+
+def print_table(title, rows, baseline=None):
+    print(f"\n{title:<36} {'n':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          + (f" {'base p95':>9} {'change':>8}" if baseline is not None else ""))
+    for name, r in rows.items():
+        line = (f"{name:<36} {r['requests']:>7} {r['errors']:>5} {r['rps']:>8} "
+                f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}")
+        if baseline is not None and name in baseline:
+            base = baseline[name]["p95_ms"]
+            change = (r["p95_ms"] - base) / base * 100 if base else 0
+            line += f" {base:>9} {change:>+7.0f}%"
+        print(line)
+
+
+def regressions(report, baseline, tolerance):
+    """p95 latencies that got more than tolerance percent slower than the baseline."""
+    found = []
+    for section in ("endpoints", "phases"):
+        for name, r in report[section].items():
+            base = baseline[section].get(name)
+            if base and base["p95_ms"] and r["p95_ms"] > base["p95_ms"] * (1 + tolerance / 100):
+                found.append(f"{section[:-1]} {name}: p95 {base['p95_ms']} -> {r['p95_ms']} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="drive a running server instead of main.app in-process")
+    parser.add_argument("--rooms", type=int, default=1)
+    parser.add_argument("--players", type=int, default=20, help="players per room")
+    parser.add_argument("--poll-hz", type=float, default=1.0)
+    parser.add_argument("--burst", type=int, default=3, help="game actions per player per poll")
+    parser.add_argument("--game-seconds", type=float, default=10)
+    parser.add_argument("--quiz-seconds", type=float, default=3)
+    parser.add_argument("--idle-seconds", type=float, default=1, help="time spent in every other phase")
+    parser.add_argument("--delta", action="store_true", help="poll /state with since= and apply the patches")
+    parser.add_argument("--save", metavar="FILE", help="write the report as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=20, help="allowed p95 slowdown in percent")
+    args = parser.parse_args()
+
+    if args.url:
+        import httpx
+        with httpx.Client(base_url=args.url, timeout=30) as client:
+            report = run(client, args)
+    else:
+        tmp = tempfile.mkdtemp()
+        os.environ["GAME_DB"] = os.path.join(tmp, "loadgen.db")
+        from fastapi.testclient import TestClient
+        import main as app_main
+        with TestClient(app_main.app) as client:
+            report = run(client, args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print(json.dumps(report["config"]))
+    print_table("endpoint", report["endpoints"], baseline and baseline["endpoints"])
+    print_table("phase", report["phases"], baseline and baseline["phases"])
+    print_table("total", {"all": report["total"]}, baseline and {"all": baseline["total"]})
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+
+    if baseline is not None:
+        found = regressions(report, baseline, args.tolerance)
+        if found:
+            print(f"\nRegressions beyond {args.tolerance:.0f}%:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo p95 regressions beyond {args.tolerance:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Encode time and size of the /state payloads, per phase.
+
+One room is played through every game in GAME_LIST (with the load generator's
+game actions and a quiz answer from everyone) and the /state of every player
+is captured in each phase. Those states are then encoded with:
+
+    json      jsonable_encoder + json.dumps, what FastAPI did before
+    orjson    serialization.dumps, what the app sends now
+    msgpack   serialization.pack, for clients that send Accept: application/msgpack
+
+and the orjson bodies compressed with gzip and brotli at the levels the app uses.
+Times are the median µs per state, sizes the mean bytes per state.
+
+Usage (from backend/):
+    python bench/payloads.py [--players 8] [--repeat 50] [--seed 1]
+    python bench/payloads.py --json > payloads.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from loadgen import GAME_ACTIONS
+
+
+def stdlib_json(state):
+    from fastapi.encoders import jsonable_encoder
+
+    # Same arguments as starlette's JSONResponse.render
+    return json.dumps(jsonable_encoder(state), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def capture_phases(client, app_main, players):
+    """{phase: [state of every player]} over a whole game."""
+    room = "payloads"
+    client.post("/reset", params={"room": room}).raise_for_status()
+    ids = [client.post("/join", params={"name": f"p{i}", "room": room}).json()["player_id"] for i in range(players)]
+    phases = {}
+
+    def control(action, **payload):
+        client.post("/control", params={"action": action, "room": room}, json=payload).raise_for_status()
+
+    def capture(phase):
+        phases[phase] = [app_main.build_game_state(pid, room) for pid in ids]
+
+    capture("LOBBY")
+    control("start_game")
+    capture("REVEAL")
+    control("explain_round")
+    for game in app_main.GAME_LIST:
+        capture(f"EXPLANATION {game.id}")
+        control("start_timer")
+        for pid in ids:
+            for action, payload in GAME_ACTIONS.get(game.id, []):
+                client.post("/game_action", params={"player_id": pid, "action": action, "room": room}, json=payload)
+        capture(f"GAME_RUNNING {game.id}")
+        control("end_game_early")
+        capture(f"SCORING {game.id}")
+        control("submit_score", points=800)
+        control("start_quiz")
+        capture(f"QUIZ {game.id}")
+        for pid, state in zip(ids, phases[f"QUIZ {game.id}"]):
+            answers = {str(q["id"]): random.choice(q["options"]) for q in state["quiz_data"] if q["options"]}
+            client.post("/submit_quiz", params={"player_id": pid, "room": room}, json=answers)
+        control("advance_round")  # Straight to the next EXPLANATION
+    capture("FINAL_REVEAL")
+    return phases
+
+
+def median_us(encode, states, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for state in states:
+            encode(state)
+        times.append((time.perf_counter() - start) / len(states) * 1e6)
+    return round(statistics.median(times), 1)
+
+
+def bench_phase(phase, states, repeat):
+    import serialization
+
+    bodies = [serialization.dumps(state) for state in states]
+    mean = lambda values: round(sum(values) / len(values))
+    result = {
+        "phase": phase,
+        "bytes": mean([len(body) for body in bodies]),
+        "json_us": median_us(stdlib_json, states, repeat),
+        "orjson_us": median_us(serialization.dumps, states, repeat),
+    }
+    if serialization.msgpack is not None:
+        result["msgpack_bytes"] = mean([len(serialization.pack(state)) for state in states])
+        result["msgpack_us"] = median_us(serialization.pack, states, repeat)
+    codings = ["gzip"] + (["br"] if serialization.brotli is not None else [])
+    for coding in codings:
+        result[f"{coding}_bytes"] = mean([len(serialization.compress(body, coding)) for body in bodies])
+        result[f"{coding}_us"] = median_us(lambda body: serialization.compress(body, coding), bodies, repeat)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    os.environ["GAME_DB"] = os.path.join(tempfile.mkdtemp(), "payloads.db")
+    random.seed(args.seed)
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    with TestClient(app_main.app) as client:
+        phases = capture_phases(client, app_main, args.players)
+    results = [bench_phase(phase, states, args.repeat) for phase, states in phases.items()]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    columns = [("bytes", "bytes"), ("json_us", "json µs"), ("orjson_us", "orjson µs"),
+               ("msgpack_bytes", "msgpack B"), ("msgpack_us", "msgpack µs"),
+               ("gzip_bytes", "gzip B"), ("gzip_us", "gzip µs"), ("br_bytes", "br B"), ("br_us", "br µs")]
+    columns = [(key, title) for key, title in columns if key in results[0]]
+    print(f"{'phase':<32}" + "".join(f" {title:>11}" for _, title in columns))
+    for r in results:
+        print(f"{r['phase']:<32}" + "".join(f" {r[key]:>11}" for key, _ in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Replays recorded games from an event log, as benchmark input.
+
+Every room in the log is rebuilt from its first event (or last reset) on an
+empty in-memory database, applying each event the way the backend applied it
+(same random seed and time). Prints the median and worst time per event kind
+and action, and the events per second of the whole replay, so changes to the
+commands can be measured against real traffic instead of synthetic load.
+
+Usage (from backend/):
+    python bench/replay.py --events game-events.db [--room CODE] [--snapshots]
+    python bench/replay.py --events game-events.db --json > replay.json
+
+--snapshots starts each room at its last snapshot instead, what GET /replay does.
+"""
+import argparse
+import contextvars
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import orjson
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def load_events(path, room, snapshots):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        rooms = [room] if room else [r[0] for r in conn.execute("SELECT DISTINCT room_id FROM room_events")]
+        starts = ("snapshot", "reset") if snapshots else ("reset",)
+        logs = {}
+        for room_id in rooms:
+            start = conn.execute(f"""
+                SELECT COALESCE(MAX(seq), 0) FROM room_events
+                WHERE room_id = ? AND kind IN ({', '.join('?' * len(starts))})
+            """, (room_id, *starts)).fetchone()[0]
+            rows = conn.execute("""
+                SELECT * FROM room_events WHERE room_id = ? AND seq >= ? ORDER BY seq
+            """, (room_id, start)).fetchall()
+            # Snapshots only count where a replay starts
+            logs[room_id] = [dict(r) for i, r in enumerate(rows) if i == 0 or r["kind"] != "snapshot"]
+        return logs
+    finally:
+        conn.close()
+
+
+def replay(app_main, migrations, run_command, logs):
+    timings = {}  # "kind action" -> [ms]
+    errors = 0
+    total = 0.0
+    for room_id, log in logs.items():
+        scratch = sqlite3.connect(":memory:")
+        scratch.row_factory = sqlite3.Row
+        migrations.migrate(scratch)
+        for event in log:
+            if event["kind"] != "snapshot":
+                event["payload"] = orjson.loads(event["payload"])
+            key = f"{event['kind']} {event['action'] or ''}".strip()
+            start = time.perf_counter()
+            try:
+                contextvars.copy_context().run(run_command, event["seed"], event["at"],
+                                               app_main.apply_event, scratch.cursor(), event)
+                scratch.commit()
+            except Exception:
+                scratch.rollback()
+                errors += 1
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            total += elapsed
+            timings.setdefault(key, []).append(elapsed)
+        scratch.close()
+    return timings, errors, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", required=True, help="event log file, GAME_EVENTS of the backend that recorded it")
+    parser.add_argument("--room", help="only this room")
+    parser.add_argument("--snapshots", action="store_true", help="start every room at its last snapshot")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    logs = load_events(os.path.abspath(args.events), args.room, args.snapshots)
+
+    # The app needs a database of its own, the replays don't touch it
+    workdir = tempfile.mkdtemp()
+    os.environ["GAME_DB"] = os.path.join(workdir, "replay.db")
+    import main as app_main
+    import migrations
+    from events import run_command
+
+    timings, errors, total = replay(app_main, migrations, run_command, logs)
+    count = sum(len(t) for t in timings.values())
+    results = {
+        "rooms": len(logs),
+        "events": count,
+        "errors": errors,
+        "total_ms": round(total, 1),
+        "events_per_s": round(count / total * 1000) if total else 0,
+        "by_event": [
+            {"event": key, "count": len(t), "median_ms": round(statistics.median(t), 3), "max_ms": round(max(t), 3)}
+            for key, t in sorted(timings.items(), key=lambda kv: -sum(kv[1]))
+        ],
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['rooms']} rooms, {count} events ({errors} failed) in {results['total_ms']} ms, "
+          f"{results['events_per_s']} events/s")
+    print(f"{'event':<32} {'count':>7} {'median ms':>10} {'max ms':>9}")
+    for r in results["by_event"]:
+        print(f"{r['event']:<32} {r['count']:>7} {r['median_ms']:>10} {r['max_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Stand-in Redis server for running GAME_BACKEND=redis://... locally.
+
+Speaks RESP2 and keeps everything in memory, with only the commands the
+backend uses: PING, GET, SET, DEL, INCR, EXISTS, DBSIZE and FLUSHALL, and
+transactions with WATCH, UNWATCH, MULTI, EXEC and DISCARD.
+Not a Redis replacement: no persistence, expiry or pub/sub.
+
+Usage (from backend/):
+    python bench/resp_server.py [--port 6399]
+    GAME_BACKEND=redis://127.0.0.1:6399 uvicorn main:app
+"""
+import argparse
+import asyncio
+
+
+# Commands that write, they change the keys' revisions for WATCH
+WRITES = {"SET", "DEL", "INCR"}
+
+
+class Session:
+    """Transaction state of one connection."""
+
+    def __init__(self):
+        self.watched = {}   # key -> its revision when WATCHed
+        self.queued = None  # commands since MULTI, None outside a transaction
+
+
+class RespServer:
+    def __init__(self):
+        self.data = {}
+        self.revisions = {}  # key -> times written, what WATCH compares
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.serve, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # Inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    @staticmethod
+    def encode(value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, Exception):
+            return b"-ERR %s\r\n" % str(value).encode()
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(RespServer.encode(item) for item in value)
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def transact(self, session, name, args):
+        """Runs a command for a connection, with its transaction state."""
+        if name == "MULTI":
+            if session.queued is not None:
+                return ValueError("MULTI calls can not be nested")
+            session.queued = []
+            return "OK"
+        if name in ("EXEC", "DISCARD"):
+            if session.queued is None:
+                return ValueError(f"{name} without MULTI")
+            queued, session.queued = session.queued, None
+            watched, session.watched = session.watched, {}
+            if name == "DISCARD":
+                return "OK"
+            if any(self.revisions.get(key, 0) != revision for key, revision in watched.items()):
+                return None  # Aborted, a watched key was written
+            return [self.execute(*command) for command in queued]
+        if session.queued is not None:
+            if name == "WATCH":
+                return ValueError("WATCH inside MULTI is not allowed")
+            session.queued.append((name, args))
+            return "QUEUED"
+        if name == "WATCH":
+            session.watched.update((key, self.revisions.get(key, 0)) for key in args)
+            return "OK"
+        if name == "UNWATCH":
+            session.watched = {}
+            return "OK"
+        return self.execute(name, args)
+
+    def execute(self, name, args):
+        if name in WRITES:
+            for key in args if name == "DEL" else args[:1]:
+                self.revisions[key] = self.revisions.get(key, 0) + 1
+        if name == "PING":
+            return "PONG"
+        if name == "GET":
+            return self.data.get(args[0])
+        if name == "SET":
+            self.data[args[0]] = args[1]
+            return "OK"
+        if name == "DEL":
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if name == "EXISTS":
+            return sum(key in self.data for key in args)
+        if name == "INCR":
+            value = int(self.data.get(args[0], b"0")) + 1
+            self.data[args[0]] = b"%d" % value
+            return value
+        if name == "DBSIZE":
+            return len(self.data)
+        if name == "FLUSHALL":
+            for key in self.data:
+                self.revisions[key] = self.revisions.get(key, 0) + 1
+            self.data.clear()
+            return "OK"
+        return ValueError(f"unknown command '{name}'")
+
+    async def serve(self, reader, writer):
+        session = Session()
+        try:
+            while True:
+                command = await self.read_command(reader)
+                if not command:
+                    break
+                try:
+                    reply = self.transact(session, command[0].decode().upper(), command[1:])
+                except (IndexError, ValueError) as e:
+                    reply = e
+                writer.write(self.encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+
+    async def run():
+        server = RespServer()
+        port = await server.start(args.host, args.port)
+        print(f"RESP stand-in listening on {args.host}:{port}", flush=True)
+        await server.server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
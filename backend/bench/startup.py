@@ -0,0 +1,110 @@
+"""
+Time from starting the backend to its first answered /state.
+
+Every start runs in a fresh process, the way uvicorn starts a worker:
+
+    cold  - empty database file, every migration runs
+    warm  - the file of a previous run, with --rooms rooms of --players players
+            (half of them mid-game), nothing to migrate
+
+Each start reports `import` (python start to `import main` done: loading the
+file into memory and migrating), `startup` (the startup hooks, reattaching the
+rooms) and `first_state` (one /state of a reattached room), and the total
+against TARGET_MS.
+
+Usage (from backend/):
+    python bench/startup.py [--rooms 100] [--players 10] [--repeat 5]
+    python bench/startup.py --json > startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A worker should be serving within this long, even with a full day of rooms on disk
+TARGET_MS = 1000
+
+SEED = """
+from fastapi.testclient import TestClient
+import main
+with TestClient(main.app) as client:
+    for r in range({rooms}):
+        room = f"room-{{r}}"
+        for i in range({players}):
+            client.post("/join", params={{"name": f"p{{i}}", "room": room}}).raise_for_status()
+        if r % 2:
+            for action in ("start_game", "explain_round", "start_timer"):
+                client.post("/control", params={{"action": action, "room": room}}).raise_for_status()
+main.store.flush()
+"""
+
+START = """
+import json, sys, time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+import main
+imported = time.perf_counter()
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    client.get("/state", params={"room": "room-1", "player_id": int(sys.argv[1])})
+    answered = time.perf_counter()
+print(json.dumps({"import": (imported - start) * 1000, "startup": (started - imported) * 1000,
+                  "first_state": (answered - started) * 1000}))
+"""
+
+
+def run(code, db, *args):
+    env = dict(os.environ, GAME_DB=db)
+    return subprocess.run([sys.executable, "-c", code, *map(str, args)], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, check=True).stdout
+
+
+def start(db, player_id):
+    return json.loads(run(START, db, player_id).strip().splitlines()[-1])
+
+
+def summarize(mode, samples):
+    result = {"mode": mode}
+    for key in ("import", "startup", "first_state"):
+        result[f"{key}_ms"] = round(statistics.median(s[key] for s in samples), 1)
+    result["total_ms"] = round(statistics.median(sum(s.values()) for s in samples), 1)
+    result["within_target"] = result["total_ms"] <= TARGET_MS
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    cold = []
+    for i in range(args.repeat):
+        cold.append(start(os.path.join(workdir, f"cold-{i}.db"), 0))
+
+    warm_db = os.path.join(workdir, "warm.db")
+    run(SEED.format(rooms=args.rooms, players=args.players), warm_db)
+    # The first player of room-1, a room that is mid-game
+    warm = [start(warm_db, args.players + 1) for _ in range(args.repeat)]
+
+    results = [summarize("cold", cold), summarize(f"warm ({args.rooms} rooms)", warm)]
+    if args.json:
+        print(json.dumps({"target_ms": TARGET_MS, "results": results}, indent=2))
+        return
+
+    print(f"{'mode':<20} {'import':>9} {'startup':>9} {'1st state':>9} {'total':>9}   target {TARGET_MS} ms")
+    for r in results:
+        print(f"{r['mode']:<20} {r['import_ms']:>9} {r['startup_ms']:>9} {r['first_state_ms']:>9} {r['total_ms']:>9}   "
+              f"{'ok' if r['within_target'] else 'MISSED'}")
+
+
+if __name__ == "__main__":
+    main()
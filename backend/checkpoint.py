@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+
+from database import DB_NAME, get_db_connection, store
+
+try:
+    import msgpack
+except ImportError:  # Optional, checkpoints are written as JSON instead
+    msgpack = None
+
+# Next to the database file by default, so every database has its own checkpoints
+CHECKPOINT_DIR = os.environ.get("GAME_CHECKPOINTS", os.path.splitext(DB_NAME)[0] + "-checkpoints")
+
+# Rooms that changed are checkpointed at least this often, phase changes right away
+CHECKPOINT_INTERVAL = 30.0
+
+# File layout: MAGIC, one codec byte, then the zlib compressed room
+MAGIC = b"MOLE1"
+CODEC_MSGPACK = b"m"
+CODEC_JSON = b"j"
+ZLIB_LEVEL = 6
+SUFFIX = ".ckpt"
+
+# Decoding runs in threads, zlib releases the GIL while it inflates
+LOAD_WORKERS = 8
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def room_tables(conn):
+    """Every table with a room_id column: the core tables, player_tasks and the games' own."""
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+    return {
+        name: columns for name in names
+        if "room_id" in (columns := [row[1] for row in conn.execute(f"PRAGMA table_info({name})")])
+    }
+
+
+def dump_room(conn, room_id):
+    """Every row of one room, as {table: {"columns": [...], "rows": [[...]]}}."""
+    if not conn.execute("SELECT 1 FROM game_state WHERE room_id = ?", (room_id,)).fetchone():
+        raise CheckpointError(f"Room '{room_id}' not found")
+    tables = {}
+    for name, columns in room_tables(conn).items():
+        rows = conn.execute(f"SELECT {', '.join(columns)} FROM {name} WHERE room_id = ?", (room_id,)).fetchall()
+        if rows:
+            tables[name] = {"columns": columns, "rows": [list(row) for row in rows]}
+    schema = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+    return {"room_id": room_id, "schema": schema, "created": time.time(), "tables": tables}
+
+
+def encode(checkpoint):
+    if msgpack is not None:
+        codec, body = CODEC_MSGPACK, msgpack.packb(checkpoint, use_bin_type=True)
+    else:
+        codec, body = CODEC_JSON, orjson.dumps(checkpoint)
+    return MAGIC + codec + zlib.compress(body, ZLIB_LEVEL)
+
+
+def decode(data):
+    if not data.startswith(MAGIC):
+        raise CheckpointError("Not a room checkpoint")
+    codec, body = data[len(MAGIC):len(MAGIC) + 1], zlib.decompress(data[len(MAGIC) + 1:])
+    if codec == CODEC_JSON:
+        return orjson.loads(body)
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise CheckpointError("Checkpoint needs msgpack, which is not installed")
+        return msgpack.unpackb(body, raw=False)
+    raise CheckpointError(f"Unknown checkpoint codec {codec!r}")
+
+
+def restore_room(cur, checkpoint, clear_room, room_id=None):
+    """
+    Replaces a room with the one in the checkpoint. Call inside a transaction.
+    clear_room(cur, room_id) removes what the room has now. Columns the schema
+    gained since the checkpoint keep their defaults. Player ids are restored as
+    they were, the secrets refer to them, so they must not belong to another room.
+    """
+    room_id = room_id or checkpoint["room_id"]
+    schema = cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+    if checkpoint["schema"] > schema:
+        raise CheckpointError(f"Checkpoint has schema {checkpoint['schema']}, this backend only {schema}")
+
+    clear_room(cur, room_id)
+    player_ids = [row[0] for row in checkpoint["tables"].get("players", {}).get("rows", [])]
+    taken = cur.execute(
+        f"SELECT COUNT(*) FROM players WHERE id IN ({', '.join('?' * len(player_ids))})", player_ids
+    ).fetchone()[0] if player_ids else 0
+    if taken:
+        raise CheckpointError(f"{taken} player ids of the checkpoint belong to another room")
+
+    existing = room_tables(cur.connection)
+    for name, table in checkpoint["tables"].items():
+        if name not in existing:
+            raise CheckpointError(f"Unknown table '{name}'")
+        keep = [i for i, column in enumerate(table["columns"]) if column in existing[name]]
+        columns = [table["columns"][i] for i in keep]
+        room_idx = columns.index("room_id")
+        rows = [[room_id if i == room_idx else row[k] for i, k in enumerate(keep)] for row in table["rows"]]
+        cur.executemany(f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return decode(f.read())
+
+
+class Checkpointer:
+    """
+    Keeps a checkpoint file per room in CHECKPOINT_DIR: one compact file with
+    every row of the room (game_state, players, quiz answers, score history and
+    the game tables), so a crashed or moved backend restores a running game
+    from one read instead of replaying its requests.
+
+    Rooms are marked after every committed write. A background thread writes
+    the marked ones every CHECKPOINT_INTERVAL, and urgent ones (phase changes)
+    as soon as it wakes. Files are replaced atomically, a crash mid-write
+    leaves the previous checkpoint.
+    """
+
+    def __init__(self, directory=CHECKPOINT_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.urgent = set()
+        self.generations = {}  # room_id -> times it was forgotten, see save
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stats = {"written": 0, "restored": 0, "errors": 0}
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name="checkpoints", daemon=True)
+        self.thread.start()
+
+    def path(self, room_id):
+        # Room codes come from clients, keep them inside the directory
+        safe = "".join(c if c.isalnum() or c in "-_" else f"%{ord(c):02x}" for c in room_id)
+        return os.path.join(self.directory, safe + SUFFIX)
+
+    def mark(self, room_id, urgent=False):
+        with self.lock:
+            self.dirty.add(room_id)
+            if urgent:
+                self.urgent.add(room_id)
+        if urgent:
+            self.wakeup.set()
+
+    def forget(self, room_id):
+        """For /reset: the room is gone, so is its checkpoint."""
+        with self.lock:
+            self.dirty.discard(room_id)
+            self.urgent.discard(room_id)
+            # A save already running has the room from before, it must not write it back
+            self.generations[room_id] = self.generations.get(room_id, 0) + 1
+            try:
+                os.remove(self.path(room_id))
+            except FileNotFoundError:
+                pass
+
+    def run(self):
+        deadline = time.monotonic() + CHECKPOINT_INTERVAL
+        while True:
+            self.wakeup.wait(max(0.0, deadline - time.monotonic()))
+            self.wakeup.clear()
+            with self.lock:
+                if time.monotonic() >= deadline:
+                    rooms, self.dirty, self.urgent = self.dirty, set(), set()
+                    deadline = time.monotonic() + CHECKPOINT_INTERVAL
+                else:
+                    rooms, self.urgent = self.urgent, set()
+                    self.dirty -= rooms
+            for room_id in rooms:
+                try:
+                    self.save(room_id)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"Checkpoint Error ({room_id}): {e}")
+
+    def snapshot(self, room_id):
+        """The encoded checkpoint of a room, as stored in its file."""
+        conn = get_db_connection()
+        try:
+            checkpoint = dump_room(conn, room_id)
+        finally:
+            conn.close()
+        # Encoding and compressing happen without the connection
+        return encode(checkpoint)
+
+    def save(self, room_id):
+        with self.lock:
+            generation = self.generations.get(room_id, 0)
+        try:
+            data = self.snapshot(room_id)
+        except CheckpointError:
+            return  # Reset in the meantime
+        path = self.path(room_id)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        with self.lock:
+            if self.generations.get(room_id, 0) != generation:
+                # Reset while this was written: the file would bring the old room back
+                os.remove(tmp)
+                return
+            os.replace(tmp, path)
+        self.stats["written"] += 1
+
+    def load_all(self, clear_room, skip=()):
+        """
+        Restores every checkpointed room not in skip (the rooms the database
+        still has) in one transaction. Files are read and decoded in parallel.
+        Returns the restored room ids.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(SUFFIX)]
+        with ThreadPoolExecutor(LOAD_WORKERS) as pool:
+            checkpoints = [c for c in pool.map(self.read_or_skip, paths) if c and c["room_id"] not in skip]
+        if not checkpoints:
+            return []
+
+        restored = []
+        conn = get_db_connection()
+        try:
+            conn.execute("BEGIN")
+            for checkpoint in checkpoints:
+                mark = conn.savepoint()
+                try:
+                    restore_room(conn.cursor(), checkpoint, clear_room)
+                    conn.release_savepoint()
+                    restored.append(checkpoint["room_id"])
+                    store.touch(checkpoint["room_id"])
+                except Exception as e:
+                    conn.rollback_savepoint(mark)
+                    self.stats["errors"] += 1
+                    print(f"Checkpoint Error ({checkpoint['room_id']}): {e}")
+            conn.commit()
+        finally:
+            conn.close()
+        self.stats["restored"] += len(restored)
+        return restored
+
+    def read_or_skip(self, path):
+        try:
+            return read_file(path)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Checkpoint Error ({path}): {e}")
+            return None
+
+
+checkpoints = Checkpointer()
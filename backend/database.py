@@ -1,8 +1,274 @@
+import atexit
+import os
 import sqlite3
+import threading
+import time
 
-DB_NAME = "game.db"
+from profiler import QueryProfiler
+from state_backend import make_backend
+
+DB_NAME = os.environ.get("GAME_DB", "game.db")
+
+# sqlite (the DB_NAME file), memory or redis://host:port, see state_backend.py
+BACKEND = os.environ.get("GAME_BACKEND", "sqlite")
+
+# Record every statement with its timing and caller, see GET /profile
+PROFILE = os.environ.get("GAME_PROFILE") == "1"
+
+# How often committed writes are handed to the state backend. This is also the
+# most that can be lost when the process dies.
+FLUSH_INTERVAL = 0.2
+
+# Flushes in a row a batch may fail before it is written one statement and one
+# room at a time, and whatever still fails is dropped
+MAX_FLUSH_ATTEMPTS = 5
+
+WRITE_KEYWORDS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+
+def is_write(sql):
+    return sql.lstrip()[:7].upper().startswith(WRITE_KEYWORDS)
+
+
+class RecordingCursor(sqlite3.Cursor):
+    """Remembers every statement that changes the database, for the write-behind."""
+
+    def execute(self, sql, params=()):
+        result = super().execute(sql, params)
+        if is_write(sql):
+            self.connection.record(sql, [params])
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        result = super().executemany(sql, seq_of_params)
+        if is_write(sql):
+            self.connection.record(sql, seq_of_params)
+        return result
+
+
+class ProfilingCursor(RecordingCursor):
+    """RecordingCursor that also reports to the store's profiler, used with GAME_PROFILE=1."""
+    profile_key = None
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        result = super().execute(sql, params)
+        self.profile_key = self.connection.store.profiler.record(sql, params, time.perf_counter() - start, self.rowcount)
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_params)
+        self.profile_key = self.connection.store.profiler.record(
+            sql, seq_of_params[0] if seq_of_params else (), time.perf_counter() - start, self.rowcount, len(seq_of_params))
+        return result
+
+    # Rows read by a SELECT are only known once they are fetched
+    def fetched(self, rows):
+        if self.profile_key is not None and rows:
+            self.connection.store.profiler.add_rows(self.profile_key, rows)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self.fetched(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size or self.arraysize)
+        self.fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self.fetched(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self.fetched(1)
+        return row
+
+
+class MemoryConnection(sqlite3.Connection):
+    """
+    The one connection to the in-memory database.
+    Writes are only handed to the write-behind once they are committed, and
+    close() gives the connection back instead of closing it.
+    """
+    store = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.store.cursor_factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def record(self, sql, seq_of_params):
+        self.store.pending.append((sql, seq_of_params))
+        # DDL and writes outside a transaction are committed straight away
+        if not self.in_transaction:
+            self.store.committed()
+
+    def commit(self):
+        super().commit()
+        self.store.committed()
+
+    def rollback(self):
+        super().rollback()
+        self.store.pending.clear()
+
+    # Savepoints let one command of a batch fail without undoing the others
+    def savepoint(self):
+        super().execute("SAVEPOINT command")
+        return len(self.store.pending)
+
+    def release_savepoint(self):
+        super().execute("RELEASE command")
+
+    def rollback_savepoint(self, mark):
+        super().execute("ROLLBACK TO command")
+        super().execute("RELEASE command")
+        del self.store.pending[mark:]
+
+    def close(self):
+        self.store.release()
+
+
+class MemoryStore:
+    """
+    Authoritative game state for every room, kept in an in-memory SQLite database
+    so requests never wait for the disk. A background thread hands committed
+    writes to the state backend in batches (for the default SQLite file: one
+    transaction and one fsync per batch), and the backend's state is loaded back
+    into memory on startup to recover from a crash.
+
+    Queries on memory take microseconds, so a single connection behind a lock
+    is faster than a pool and keeps every reader out of half finished writes.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.RLock()
+        self.depth = 0      # nested borrows by the thread holding the lock
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False, factory=MemoryConnection)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.store = self
+        self.pending = []   # written by the current transaction
+        self.queue = []     # committed, waiting for the flush
+        self.touched = set()  # rooms with committed writes since the last flush, see touch()
+        self.queue_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.failures = 0   # flushes failed in a row
+        self.flusher = None
+        self.load_ms = 0.0  # how long start() took to load the file into memory
+        self.profiler = QueryProfiler() if PROFILE else None
+        self.cursor_factory = ProfilingCursor if PROFILE else RecordingCursor
+
+    def start(self):
+        """Loads the last flushed state and starts the write-behind thread."""
+        start = time.perf_counter()
+        with self.lock:
+            self.backend.load(self.conn)
+        self.load_ms = (time.perf_counter() - start) * 1000
+        self.flusher = threading.Thread(target=self.run, name="write-behind", daemon=True)
+        self.flusher.start()
+        atexit.register(self.flush)
+
+    def acquire(self):
+        self.lock.acquire()
+        self.depth += 1
+        return self.conn
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            # Never hand out the connection with a half finished transaction
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            if self.profiler:
+                self.profiler.end_borrow()
+        self.lock.release()
+
+    def committed(self):
+        if not self.pending:
+            return
+        with self.queue_lock:
+            self.queue.extend(self.pending)
+        self.pending = []
+
+    def touch(self, room_id):
+        """Marks a room as written, call after the commit. Backends that store whole rooms save these."""
+        with self.queue_lock:
+            self.touched.add(room_id)
+
+    def flush(self):
+        """Hands everything committed so far to the backend, in one batch."""
+        with self.flush_lock:
+            # Only hold queue_lock for the swap, requests must never wait on the backend
+            with self.queue_lock:
+                batch, self.queue = self.queue, []
+                rooms, self.touched = self.touched, set()
+            if not batch and not rooms:
+                return 0
+            try:
+                self.backend.persist(self, batch, rooms)
+            except Exception as e:
+                self.failures += 1
+                print(f"Write-behind Error (attempt {self.failures}): {e}")
+                if self.failures < MAX_FLUSH_ATTEMPTS:
+                    # Keep the batch, the next flush tries again
+                    with self.queue_lock:
+                        self.queue = batch + self.queue
+                        self.touched |= rooms
+                    return 0
+                # One bad write must not hold back everyone else's forever
+                self.failures = 0
+                return self.persist_each(batch, rooms)
+            self.failures = 0
+        return len(batch)
+
+    def persist_each(self, batch, rooms):
+        """Persists a batch that keeps failing piece by piece, dropping the pieces that fail."""
+        written = 0
+        for statement in batch:
+            try:
+                self.backend.persist(self, [statement], set())
+                written += 1
+            except Exception as e:
+                print(f"Write-behind Error, dropped {statement[0].split()[0]} of {len(statement[1])} rows: {e}")
+        for room_id in rooms:
+            try:
+                self.backend.persist(self, [], {room_id})
+            except Exception as e:
+                print(f"Write-behind Error, dropped room {room_id}: {e}")
+        return written
+
+    def refresh(self, room_id):
+        """
+        For shared backends: reloads the room if another worker wrote a newer
+        version. True when it did. Call without holding the connection.
+        """
+        return self.backend.refresh(self, room_id)
+
+    def run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+
+store = MemoryStore(make_backend(BACKEND, DB_NAME))
+store.start()
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
\ No newline at end of file
+    """
+    Borrow the in-memory connection, call close() to give it back.
+    Nobody else can use it until it is closed, so always close it in a finally.
+    Never await while holding it: coroutines on the event loop share one thread,
+    so the lock would not keep them apart.
+    """
+    return store.acquire()
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+
+from realtime import BOOT_ID
+
+# Versions per room a client can be behind and still get a patch
+HISTORY_LENGTH = 16
+
+
+def diff(old, new, path=(), ops=None):
+    """
+    Operations that turn old into new, each [path] (remove) or [path, value] (set).
+    A path is the list of keys and list indexes down to the changed value. Dicts
+    and lists are compared item by item, a list that grew gets its new items
+    set at the end, one that shrank is sent whole.
+    """
+    if ops is None:
+        ops = []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append([[*path, key]])
+        for key, value in new.items():
+            if key not in old:
+                ops.append([[*path, key], value])
+            elif old[key] != value:
+                diff(old[key], value, (*path, key), ops)
+    elif isinstance(old, list) and isinstance(new, list) and len(old) <= len(new):
+        for i, value in enumerate(new):
+            if i >= len(old):
+                ops.append([[*path, i], value])
+            elif old[i] != value:
+                diff(old[i], value, (*path, i), ops)
+    else:
+        ops.append([list(path), new])
+    return ops
+
+
+def apply_patch(state, ops):
+    """Applies diff() ops in place and returns the result. Clients do the same."""
+    for op in ops:
+        path = op[0]
+        if not path:
+            state = op[1]
+            continue
+        node = state
+        for key in path[:-1]:
+            node = node[key]
+        if len(op) == 1:
+            del node[path[-1]]
+        elif isinstance(node, list) and path[-1] == len(node):
+            node.append(op[1])
+        else:
+            node[path[-1]] = op[1]
+    return state
+
+
+def version_token(version):
+    # Versions restart at 0 with the process, the boot id keeps old ones from matching
+    return f"{BOOT_ID}-{version}"
+
+
+class StateHistory:
+    """
+    The last HISTORY_LENGTH versions of each room, with the /state each player
+    was served at that version, so `/state?since=<version>` can answer with a
+    patch against what the client already holds. Older or unknown versions
+    get a full snapshot.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rooms = {}  # room_id -> OrderedDict(version -> {player_id: state}), oldest first
+
+    def record(self, room_id, version, player_id, state):
+        with self.lock:
+            versions = self.rooms.setdefault(room_id, OrderedDict())
+            if version not in versions:
+                versions[version] = {}
+                while len(versions) > HISTORY_LENGTH:
+                    versions.popitem(last=False)
+            versions[version][player_id] = state
+
+    def get(self, room_id, token, player_id):
+        boot_id, _, version = (token or "").rpartition("-")
+        if boot_id != BOOT_ID or not version.isdigit():
+            return None
+        with self.lock:
+            return self.rooms.get(room_id, {}).get(int(version), {}).get(player_id)
+
+    def respond(self, room_id, version, player_id, state, since):
+        """Patch against the state at `since` when it's still known, else the full state."""
+        base = self.get(room_id, since, player_id)
+        self.record(room_id, version, player_id, state)
+        if base is None:
+            return {"version": version_token(version), "state": state}
+        return {"version": version_token(version), "since": since, "patch": diff(base, state)}
+
+    def clear_room(self, room_id):
+        with self.lock:
+            self.rooms.pop(room_id, None)
+
+
+state_history = StateHistory()
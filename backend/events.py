@@ -0,0 +1,229 @@
+import atexit
+import contextvars
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import orjson
+
+import migrations
+from database import DB_NAME
+from state_backend import PRAGMAS
+
+# A file of its own, the in-memory database only ever holds the current state
+EVENTS_DB = os.environ.get("GAME_EVENTS", os.path.splitext(DB_NAME)[0] + "-events.db")
+
+# Appends are buffered and written in one transaction this often
+FLUSH_INTERVAL = 0.2
+
+# Events of a room between two snapshots, the most a replay has to apply
+SNAPSHOT_EVERY = 200
+
+# Time of the event being applied, see now()
+event_time = contextvars.ContextVar("event_time", default=None)
+
+# Commands draw from the module-level random: a replay in a thread must not
+# reseed it while a live command on the event loop is drawing, or vice versa
+random_lock = threading.Lock()
+
+
+def now():
+    """
+    time.time() for commands. While an event is applied it is the time the event
+    was first applied, so a replay computes the same timers as the original.
+    """
+    at = event_time.get()
+    return time.time() if at is None else at
+
+
+def stamp():
+    """(seed, at) for a command that is about to run for the first time."""
+    return int.from_bytes(os.urandom(7), "big"), time.time()
+
+
+def run_command(seed, at, command, *args):
+    """
+    Runs command(*args) the way it ran (or will run) in the log: random seeded
+    with the event's seed and now() at its time. Call from a copied context.
+    """
+    event_time.set(at)
+    with random_lock:
+        random.seed(seed)
+        return command(*args)
+
+
+class EventLog:
+    """
+    Append-only log of every mutation of every room: joins, controls, game
+    actions, quiz answers, timers and resets, in the order they were committed.
+    Each event keeps what it needs to run again (its arguments, random seed and
+    time), so replaying a room's events on an empty database rebuilds the room.
+
+    Appends only go to a buffer, a background thread writes it to EVENTS_DB in
+    one transaction per flush. Every SNAPSHOT_EVERY events of a room a snapshot
+    (its checkpoint, see checkpoint.py) is logged too, replays start from the
+    last one before the point they rebuild.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.buffer = []       # rows waiting for the flush
+        self.since_snapshot = {}  # room_id -> events logged since its last snapshot
+        self.last_active = {}  # room_id -> time of its last event, see expiry.py
+        self.snapshot = None   # callable(room_id) -> checkpoint bytes, set by main
+        self.conn = None
+        self.stats = {"events": 0, "snapshots": 0, "flushes": 0}
+
+    def start(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS room_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                room_id TEXT,
+                kind TEXT,         -- join, control, action, quiz, timer, reset, snapshot, expire
+                action TEXT,
+                player_id INTEGER,
+                payload BLOB,      -- JSON arguments, the checkpoint for a snapshot
+                seed INTEGER,
+                at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_room_events_room ON room_events (room_id, kind, seq)")
+        # The last event of every room, from the index: rooms stay idle across restarts
+        self.last_active.update(self.conn.execute("""
+            SELECT room_id, at FROM room_events
+            WHERE seq IN (SELECT MAX(seq) FROM room_events GROUP BY room_id)
+        """).fetchall())
+        threading.Thread(target=self.run, name="event-log", daemon=True).start()
+        atexit.register(self.flush)
+
+    def append(self, room_id, kind, action=None, player_id=None, payload=None, seed=None, at=None):
+        if kind != "snapshot":
+            payload = orjson.dumps(payload)
+        at = at or time.time()
+        with self.lock:
+            self.buffer.append((room_id, kind, action, player_id, payload, seed, at))
+            self.last_active[room_id] = at
+            self.stats["events"] += 1
+            # Snapshots and resets are where replays start, an expired room has nothing to snapshot
+            if kind in ("snapshot", "reset", "expire"):
+                count = self.since_snapshot[room_id] = 0
+            else:
+                count = self.since_snapshot[room_id] = self.since_snapshot.get(room_id, 0) + 1
+        if count >= SNAPSHOT_EVERY and self.snapshot:
+            self.take_snapshot(room_id)
+
+    def take_snapshot(self, room_id):
+        """Logs the room as it is now. Only call while no write of the room is in between."""
+        try:
+            data = self.snapshot(room_id)
+        except Exception as e:
+            print(f"Event Log Error ({room_id}): {e}")
+            return
+        self.stats["snapshots"] += 1
+        self.append(room_id, "snapshot", payload=data)
+
+    def reset(self, room_id):
+        self.append(room_id, "reset")
+
+    def expire(self, room_id):
+        """
+        Marks where an expired room ended. Its events stay for /events and /replay,
+        a game started later under the same name replays from here, not the old one.
+        """
+        self.append(room_id, "expire")
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+            if not batch:
+                return 0
+            try:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("""
+                    INSERT INTO room_events (room_id, kind, action, player_id, payload, seed, at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, batch)
+                self.conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                # Keep the order, the next flush tries again
+                with self.lock:
+                    self.buffer = batch + self.buffer
+                print(f"Event Log Error: {e}")
+                return 0
+            self.stats["flushes"] += 1
+        return len(batch)
+
+    def run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def read(self):
+        """A connection for reading the log, with everything appended so far flushed."""
+        self.flush()
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def events(self, room_id, since=0, until=None, limit=None):
+        conn = self.read()
+        try:
+            return conn.execute("""
+                SELECT * FROM room_events
+                WHERE room_id = ? AND seq > ? AND seq <= ?
+                ORDER BY seq LIMIT ?
+            """, (room_id, since, until if until is not None else 2 ** 62, limit or -1)).fetchall()
+        finally:
+            conn.close()
+
+    def replay(self, room_id, apply, until=None):
+        """
+        Rebuilds a room as it was right after event `until` (the last one when None)
+        on a new in-memory database, which is returned with the last seq applied.
+        apply(cur, event) applies one event, payloads already decoded.
+        """
+        conn = self.read()
+        try:
+            # The room's last event up to until
+            until = conn.execute("""
+                SELECT COALESCE(MAX(seq), 0) FROM room_events WHERE room_id = ? AND seq <= ?
+            """, (room_id, until if until is not None else 2 ** 62)).fetchone()[0]
+            # Start from the last snapshot or reset, whatever came before doesn't matter.
+            # Up to its expire event a room replays as it was, after it a new game starts.
+            start = conn.execute("""
+                SELECT COALESCE(MAX(seq), 0) FROM room_events
+                WHERE room_id = ? AND (kind IN ('snapshot', 'reset') AND seq <= ? OR kind = 'expire' AND seq < ?)
+            """, (room_id, until, until)).fetchone()[0]
+            rows = conn.execute("""
+                SELECT * FROM room_events WHERE room_id = ? AND seq >= ? AND seq <= ? ORDER BY seq
+            """, (room_id, start, until)).fetchall()
+        finally:
+            conn.close()
+
+        scratch = sqlite3.connect(":memory:")
+        scratch.row_factory = sqlite3.Row
+        migrations.migrate(scratch)
+        last = 0
+        for row in rows:
+            event = dict(row)
+            if event["kind"] != "snapshot":
+                event["payload"] = orjson.loads(event["payload"])
+            cur = scratch.cursor()
+            contextvars.copy_context().run(run_command, event["seed"], event["at"], apply, cur, event)
+            scratch.commit()
+            last = event["seq"]
+        return scratch, last
+
+
+event_log = EventLog(EVENTS_DB)
+event_log.start()
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+
+from database import get_db_connection
+
+# Rooms nobody wrote to for this long are removed, whatever their phase (seconds)
+IDLE_TTL = float(os.environ.get("GAME_IDLE_TTL", 6 * 3600))
+
+# Finished games only stay this long after their last write, for the final reveal
+FINISHED_TTL = float(os.environ.get("GAME_FINISHED_TTL", 3600))
+
+# How often the rooms are checked, the first time right after startup
+SWEEP_INTERVAL = float(os.environ.get("GAME_SWEEP_INTERVAL", 60))
+
+
+class RoomExpiry:
+    """
+    Removes rooms nobody plays anymore. Rooms survive restarts and only /reset
+    deleted them, so without this the database, the checkpoints and with them
+    memory and the cold start grew with every game ever played. The event log
+    keeps the room's history: /events and /replay still work after it expired.
+
+    A room's last activity is its last event in the log (EventLog.last_active),
+    which is read back on startup. Rooms without events (restored from an old
+    checkpoint) count from when the sweep first saw them.
+
+    main sets remove: this module can't import the app.
+    """
+
+    def __init__(self, last_active):
+        self.last_active = last_active  # room_id -> time of the last write
+        self.first_seen = {}   # room_id -> time, for rooms without events
+        self.remove = None     # callable(room_id), runs on the event loop
+        self.task = None
+        self.stats = {"expired": 0}
+
+    def start(self):
+        """Call on the event loop."""
+        self.task = asyncio.create_task(self.run())
+
+    def expired(self, now):
+        """Rooms past their TTL."""
+        conn = get_db_connection()
+        try:
+            rooms = conn.execute("SELECT room_id, phase FROM game_state").fetchall()
+        finally:
+            conn.close()
+        stale = []
+        for room_id, phase in rooms:
+            at = self.last_active.get(room_id) or self.first_seen.setdefault(room_id, now)
+            ttl = FINISHED_TTL if phase == 'FINAL_REVEAL' else IDLE_TTL
+            if now - at > ttl:
+                stale.append(room_id)
+        return stale
+
+    def sweep(self):
+        # Nothing awaits in between: no write can reach a room between the check and its removal
+        now = time.time()
+        for room_id in self.expired(now):
+            try:
+                self.remove(room_id)
+            except Exception as e:
+                print(f"Expiry Error ({room_id}): {e}")
+                continue
+            self.first_seen.pop(room_id, None)
+            self.stats["expired"] += 1
+
+    async def run(self):
+        while True:
+            self.sweep()
+            await asyncio.sleep(SWEEP_INTERVAL)
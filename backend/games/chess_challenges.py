@@ -1,6 +1,8 @@
 import random
 import json
 
+from games import tables, tasks
+
 class ChessChallenges:
     id = "chess-challenges"
     title = "Chess Challenges"
@@ -111,42 +113,74 @@ Everyone will get 3 team challenges and 2 individual challenges, the points gain
     
     # --- SETUP ---
     def setup_db(self, cursor):
-        # We store challenges as JSON strings
+        # Group and individual challenges live in the shared player_tasks table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS chess_state (
                 player_id INTEGER PRIMARY KEY,
-                group_tasks TEXT,      -- JSON list of {desc, points}
-                indiv_tasks TEXT,      -- JSON list of {desc, points}
-                group_complete TEXT,   -- JSON list of booleans
-                indiv_complete TEXT,   -- JSON list of booleans
+                room_id TEXT,
+                anonymous_tasks TEXT,  -- JSON list of {desc, points}, 3 group tasks of others
                 moves_made INTEGER DEFAULT 0,
                 game_won BOOLEAN DEFAULT 0
             )
         """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chess_state_room ON chess_state (room_id)")
 
     # --- LOGIC ---
-    def generate_secret_state(self, cursor):
-        cursor.execute("DELETE FROM chess_state")
-        players = cursor.execute("SELECT id, name FROM players").fetchall()
-        num_players = len(players)
-        
+    def clear_room(self, cursor, room_id):
+        cursor.execute("DELETE FROM chess_state WHERE room_id = ?", (room_id,))
+        tasks.clear_tasks(cursor, room_id, self.id)
+
+    def generate_secret_state(self, cursor, room_id):
+        self.clear_room(cursor, room_id)
+        mole_intel_data = {}  # table_idx -> intel for that table's mole
+        assignments = []
+        anonymous = {}
+
+        # Every table gets its own draw from the challenges
+        for table_idx, players in tables.players_by_table(cursor, room_id, "id, name").items():
+            table_assignments, mole_intel_data[table_idx] = self.deal_challenges(players)
+            assignments += table_assignments
+
+            # Anonymous Intel from the same table, picked once here instead of on every poll
+            anonymous.update(self.pick_anonymous_tasks({pid: group for pid, group, _ in table_assignments}))
+
+        cursor.executemany("""
+            INSERT INTO chess_state (player_id, room_id, anonymous_tasks)
+            VALUES (?, ?, ?)
+        """, [(pid, room_id, json.dumps(anonymous[pid])) for pid, _, _ in assignments])
+
+        task_rows = []
+        for pid, group, indiv in assignments:
+            task_rows += [(pid, "group", idx, t['desc'], t['points'], None) for idx, t in enumerate(group)]
+            task_rows += [(pid, "indiv", idx, t['desc'], t['points'], None) for idx, t in enumerate(indiv)]
+        tasks.insert_tasks(cursor, room_id, self.id, task_rows)
+
+        return mole_intel_data
+
+    def deal_challenges(self, players):
+        """(player_id, group tasks, indiv tasks) per player of one table, and its mole intel."""
         # 1. Resource Calculation
         # We need 3 Group + 2 Indiv per player.
         # Total needed = 5 * NumPlayers.
-        total_needed = 5 * num_players
+        total_needed = 5 * len(players)
         keys = list(self.challenges.keys())
-        
+
         if len(keys) < total_needed:
-            # Fallback if we somehow run out of unique challenges (unlikely with ~70 challenges)
-            random.shuffle(keys)
-            selected_keys = (keys * 2)[:total_needed]
+            # Only tables of 18+ players run out of unique challenges: deal whole
+            # shuffled decks, so a challenge repeats as few times as possible
+            selected_keys = []
+            while len(selected_keys) < total_needed:
+                random.shuffle(keys)
+                selected_keys += keys
+            selected_keys = selected_keys[:total_needed]
         else:
             selected_keys = random.sample(keys, total_needed)
-            
+
         mole_intel_data = {}
 
         # 2. Distribution
         # Slice the massive list of keys into chunks for each player
+        assignments = []
         for i, p in enumerate(players):
             start = i * 5
             # First 3 are Group, Next 2 are Individual
@@ -155,21 +189,7 @@ Everyone will get 3 team challenges and 2 individual challenges, the points gain
             
             group_tasks_data = [{"desc": k, "points": self.challenges[k]} for k in p_group_keys]
             indiv_tasks_data = [{"desc": k, "points": self.challenges[k]} for k in p_indiv_keys]
-            
-            group_complete_init = [False] * 3 
-            indiv_complete_init = [False] * 2
-
-            cursor.execute("""
-                INSERT INTO chess_state 
-                (player_id, group_tasks, indiv_tasks, group_complete, indiv_complete)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                p['id'], 
-                json.dumps(group_tasks_data), 
-                json.dumps(indiv_tasks_data), 
-                json.dumps(group_complete_init), 
-                json.dumps(indiv_complete_init)
-            ))
+            assignments.append((p['id'], group_tasks_data, indiv_tasks_data))
             
             # Store data for the Mole Explanation Screen
             mole_intel_data[p['id']] = {
@@ -177,7 +197,36 @@ Everyone will get 3 team challenges and 2 individual challenges, the points gain
                 "group": p_group_keys
             }
 
-        return mole_intel_data
+        return assignments, mole_intel_data
+
+    def pick_anonymous_tasks(self, group_tasks):
+        """
+        Every player sees 3 group tasks of the others (BUT NOT THEIR STATUS): the other
+        players' tasks sorted by description, starting at index player_id * 3.
+        All tasks are sorted once, a player's own tasks are skipped by shifting the index.
+        """
+        everything = sorted(
+            (task['desc'], pid, k, task) for pid, group in group_tasks.items() for k, task in enumerate(group)
+        )
+        own_positions = {pid: [] for pid in group_tasks}
+        for pos, (_, pid, _, _) in enumerate(everything):
+            own_positions[pid].append(pos)
+
+        picked = {}
+        for pid, own in own_positions.items():
+            total = len(everything) - len(own)
+            seen_tasks = []
+            if total:
+                start_idx = (pid * 3) % total
+                for i in range(3):
+                    idx = (start_idx + i) % total
+                    for pos in own:
+                        if pos <= idx:
+                            idx += 1
+                    _, _, _, task = everything[idx]
+                    seen_tasks.append({"desc": task['desc'], "points": task['points']})
+            picked[pid] = seen_tasks
+        return picked
 
     # --- TEXT GENERATORS ---
     def get_mole_text(self, dynamic_secret):
@@ -197,41 +246,17 @@ Everyone will get 3 team challenges and 2 individual challenges, the points gain
         row = cursor.execute("SELECT * FROM chess_state WHERE player_id = ?", (player_id,)).fetchone()
         
         # 1. My Tasks
-        g_tasks = json.loads(row['group_tasks'])
-        i_tasks = json.loads(row['indiv_tasks'])
-        g_done = json.loads(row['group_complete'])
-        i_done = json.loads(row['indiv_complete'])
-        
-        group_view = []
-        for idx, t in enumerate(g_tasks):
-            group_view.append({**t, "done": g_done[idx], "idx": idx})
-            
-        indiv_view = []
-        for idx, t in enumerate(i_tasks):
-            indiv_view.append({**t, "done": i_done[idx], "idx": idx})
+        group_view = [
+            {"desc": t['desc'], "points": t['points'], "done": t['done'], "idx": t['idx']}
+            for t in tasks.get_tasks(cursor, player_id, self.id, "group")
+        ]
+        indiv_view = [
+            {"desc": t['desc'], "points": t['points'], "done": t['done'], "idx": t['idx']}
+            for t in tasks.get_tasks(cursor, player_id, self.id, "indiv")
+        ]
 
-        # 2. Anonymous Intel (See 3 tasks from others, BUT HIDE STATUS)
-        others_rows = cursor.execute("SELECT group_tasks FROM chess_state WHERE player_id != ?", (player_id,)).fetchall()
-        
-        all_other_tasks = []
-        for r in others_rows:
-            tasks = json.loads(r['group_tasks'])
-            for k in range(len(tasks)):
-                all_other_tasks.append({
-                    "desc": tasks[k]['desc'],
-                    "points": tasks[k]['points']
-                    # REMOVED "done" status to keep it a mystery
-                })
-        
-        all_other_tasks.sort(key=lambda x: x['desc'])
-        
-        seen_tasks = []
-        if all_other_tasks:
-            total = len(all_other_tasks)
-            start_idx = (player_id * 3) % total
-            for i in range(3):
-                idx = (start_idx + i) % total
-                seen_tasks.append(all_other_tasks[idx])
+        # 2. Anonymous Intel (See 3 tasks from others, picked in generate_secret_state)
+        seen_tasks = json.loads(row['anonymous_tasks'])
 
         view = {
             "game_id": self.id,
@@ -252,89 +277,52 @@ Everyone will get 3 team challenges and 2 individual challenges, the points gain
         return view
 
     # --- INTERACTION ---
+    # Every action handle_action knows, /metrics labels the rest as "other"
+    actions = ("add_move", "toggle_win", "toggle_group", "toggle_indiv")
+
     def handle_action(self, cursor, player_id, action, payload):
         if action == "add_move":
             cursor.execute("UPDATE chess_state SET moves_made = moves_made + 1 WHERE player_id = ?", (player_id,))
             return {"status": "updated"}
 
         if action == "toggle_win":
-            curr = cursor.execute("SELECT game_won FROM chess_state WHERE player_id = ?", (player_id,)).fetchone()[0]
-            new_val = 0 if curr else 1
-            cursor.execute("UPDATE chess_state SET game_won = ? WHERE player_id = ?", (new_val, player_id))
+            cursor.execute("UPDATE chess_state SET game_won = NOT game_won WHERE player_id = ?", (player_id,))
             return {"status": "updated"}
         
         if action == "toggle_group":
             # LOCAL ONLY UPDATE
-            idx = payload.get("index")
-            row = cursor.execute("SELECT group_complete FROM chess_state WHERE player_id = ?", (player_id,)).fetchone()
-            g_list = json.loads(row['group_complete'])
-            g_list[idx] = not g_list[idx]
-            cursor.execute("UPDATE chess_state SET group_complete = ? WHERE player_id = ?", 
-                           (json.dumps(g_list), player_id))
+            tasks.toggle_task(cursor, player_id, self.id, "group", payload.get("index"))
             return {"status": "updated"}
 
         if action == "toggle_indiv":
-            idx = payload.get("index")
-            row = cursor.execute("SELECT indiv_complete FROM chess_state WHERE player_id = ?", (player_id,)).fetchone()
-            i_list = json.loads(row['indiv_complete'])
-            i_list[idx] = not i_list[idx]
-            cursor.execute("UPDATE chess_state SET indiv_complete = ? WHERE player_id = ?", 
-                           (json.dumps(i_list), player_id))
+            tasks.toggle_task(cursor, player_id, self.id, "indiv", payload.get("index"))
             return {"status": "updated"}
 
         return {"error": "Unknown action"}
 
     # --- SCORING ---
-    def calculate_scores(self, cursor):
+    def calculate_scores(self, cursor, room_id):
         """
+        Per table:
         1. Calculate Group Pot: Sum of ALL completed Group Tasks from ALL players.
+        2. Everyone gets their completed Individual Tasks + Chess Win Bonus, plus the pot
+           (the mole gets the part of the pot the group missed).
         """
-        # Fetch all rows to sum up the pot
-        all_rows = cursor.execute("SELECT group_tasks, group_complete, game_won FROM chess_state").fetchall()
-        
-        group_pot_earned = 0
-        group_pot_max = 0
-        
-        # Calculate Pot
-        for r in all_rows:
-            g_tasks = json.loads(r['group_tasks'])
-            g_complete = json.loads(r['group_complete'])
-            
-            for i, task in enumerate(g_tasks):
-                pts = task['points']
-                group_pot_max += pts
-                if g_complete[i]:
-                    group_pot_earned += pts
-
-        # Mole Pot
-        mole_pot_earned = group_pot_max - group_pot_earned
-
-        # Distribute
-        players = cursor.execute("SELECT id, is_mole FROM players").fetchall()
-        for p in players:
-            pid = p['id']
-            # Get individual state
-            st = cursor.execute("SELECT indiv_tasks, indiv_complete, game_won FROM chess_state WHERE player_id = ?", (pid,)).fetchone()
-            
-            i_tasks = json.loads(st['indiv_tasks'])
-            i_complete = json.loads(st['indiv_complete'])
-            game_won = bool(st['game_won'])
-            
-            personal_score = 0
-            
-            # A. Individual Challenges
-            for i, task in enumerate(i_tasks):
-                if i_complete[i]:
-                    personal_score += task['points']
-            
-            # B. Chess Win Bonus
-            if game_won:
-                personal_score += 400
-            
-            # C. Add Pot
-            if p['is_mole']:
-                final_score = personal_score + mole_pot_earned
-            else:
-                final_score = personal_score + group_pot_earned
-                
-            cursor.execute("UPDATE players SET score = score + ? WHERE id = ?", (final_score, pid))
\ No newline at end of file
+        cursor.execute("""
+            UPDATE players SET score = score + s.personal
+                + CASE WHEN players.is_mole THEN pot.pot_max - pot.pot_earned ELSE pot.pot_earned END
+            FROM (
+                SELECT c.player_id, c.game_won * 400 + COALESCE(SUM(t.points * t.done), 0) AS personal
+                FROM chess_state c
+                LEFT JOIN player_tasks t ON t.player_id = c.player_id AND t.game_id = :game_id AND t.kind = 'indiv'
+                WHERE c.room_id = :room_id
+                GROUP BY c.player_id
+            ) AS s, (
+                SELECT p.table_idx, COALESCE(SUM(t.points), 0) AS pot_max, COALESCE(SUM(t.points * t.done), 0) AS pot_earned
+                FROM player_tasks t
+                JOIN players p ON p.id = t.player_id
+                WHERE t.room_id = :room_id AND t.game_id = :game_id AND t.kind = 'group'
+                GROUP BY p.table_idx
+            ) AS pot
+            WHERE players.id = s.player_id AND pot.table_idx = players.table_idx
+        """, {"room_id": room_id, "game_id": self.id})
@@ -1,5 +1,7 @@
 import random
 
+from games import tables
+
 class DictionaryDudes:
     id = "dictionary-dudes"
     title = "Dictionary Dudes"
@@ -59,15 +61,23 @@ There are no hidden tasks in this game."""
         "nose", "ocean", "oil", "onion", "orange", "paint", "palace", "pan", "pants", "parrot"
     ]
 
+    # Same for the whole round, main.py sends it as a reference (see hoist_static)
+    static_view_fields = ("word_list",)
+
     def setup_db(self, cursor):
         pass # No state tracking needed
 
-    def generate_secret_state(self, cursor):
-        # Pick 70 unique words
-        words_no_dup = list(set(self.words))
-        selected = random.sample(words_no_dup, 80)
-        # Store as simple list
-        return {"words": selected}
+    def clear_room(self, cursor, room_id):
+        pass
+
+    def generate_secret_state(self, cursor, room_id):
+        # Pick 70 unique words, a list of its own for every table
+        # Sorted, set order changes with the process and a replay must draw the same words
+        words_no_dup = sorted(set(self.words))
+        return {
+            table_idx: {"words": random.sample(words_no_dup, 80)}
+            for table_idx in tables.players_by_table(cursor, room_id)
+        }
 
     def get_mole_text(self, dynamic_secret):
         # Mole gets a sneak peek
@@ -95,10 +105,13 @@ There are no hidden tasks in this game."""
         return view
 
     # --- INTERACTION ---
+    # Every action handle_action knows, /metrics labels the rest as "other"
+    actions = ()
+
     def handle_action(self, cursor, player_id, action, payload):
         return {"error": "No actions supported"}
 
     # --- SCORING ---
-    def calculate_scores(self, cursor):
+    def calculate_scores(self, cursor, room_id):
         # Manual input handled by main.py logic (submit_score)
         pass
\ No newline at end of file
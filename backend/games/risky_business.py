@@ -1,5 +1,6 @@
 import random
-import json
+
+from games import tables, tasks
 
 class RiskyBusiness:
     id = "risky-business"
@@ -150,38 +151,42 @@ class RiskyBusiness:
 
     # --- SETUP ---
     def setup_db(self, cursor):
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS risk_state (
-                player_id INTEGER PRIMARY KEY,
-                tasks TEXT,      -- JSON list of {desc, points, type}
-                complete TEXT    -- JSON list of booleans
-            )
-        """)
+        # Everything this game stores is a task, kept in the shared player_tasks table
+        pass
 
     # --- LOGIC ---
-    def generate_secret_state(self, cursor):
-        cursor.execute("DELETE FROM risk_state")
-        players = cursor.execute("SELECT id, name FROM players").fetchall()
-        
+    def clear_room(self, cursor, room_id):
+        tasks.clear_tasks(cursor, room_id, self.id)
+
+    def generate_secret_state(self, cursor, room_id):
+        self.clear_room(cursor, room_id)
+        mole_intel_data = {}  # table_idx -> intel for that table's mole
+        task_rows = []
+
+        for table_idx, players in tables.players_by_table(cursor, room_id, "id, name").items():
+            table_rows, mole_intel_data[table_idx] = self.deal_tasks(players)
+            task_rows += table_rows
+
+        tasks.insert_tasks(cursor, room_id, self.id, task_rows)
+        return mole_intel_data
+
+    def deal_tasks(self, players):
+        """player_tasks rows for one table, and its mole intel."""
         # 1. Pool Management (Prevent repeats)
-        pool_medium_end = list(self.medium_end_of_game_tasks)
-        pool_hard_end = list(self.hard_end_of_game_tasks)
-        pool_medium = list(self.medium_tasks)
-        pool_hard = list(self.hard_tasks)
-        
-        random.shuffle(pool_medium_end)
-        random.shuffle(pool_hard_end)
-        random.shuffle(pool_medium)
-        random.shuffle(pool_hard)
+        pool_medium_end = TaskPool(self.medium_end_of_game_tasks)
+        pool_hard_end = TaskPool(self.hard_end_of_game_tasks)
+        pool_medium = TaskPool(self.medium_tasks)
+        pool_hard = TaskPool(self.hard_tasks)
         
         mole_intel_data = {}
+        task_rows = []
 
         for p in players:
             player_tasks = []
             
             # Logic: 1 End Game Task + 2 Others
             # Chance for Hard End Task
-            if random.random() < 0.5 and pool_hard_end:
+            if random.random() < 0.5:
                 # Scenario A: Hard End Task + 2 Mediums
                 t1 = pool_hard_end.pop()
                 player_tasks.append({"desc": t1, "points": 300, "type": "Hard (End Game)"})
@@ -197,16 +202,13 @@ class RiskyBusiness:
                 player_tasks.append({"desc": pool_medium.pop(), "points": 150, "type": "Medium"})
                 player_tasks.append({"desc": pool_hard.pop(), "points": 300, "type": "Hard"})
             
-            complete_init = [False] * 3
-            
-            cursor.execute("INSERT INTO risk_state (player_id, tasks, complete) VALUES (?, ?, ?)", 
-                           (p['id'], json.dumps(player_tasks), json.dumps(complete_init)))
+            task_rows += [(p['id'], "task", idx, t['desc'], t['points'], t['type']) for idx, t in enumerate(player_tasks)]
             
             # Mole Intel: One random task from this player
             random_intel = random.choice(player_tasks)
             mole_intel_data[p['id']] = {"name": p['name'], "task": random_intel['desc']}
 
-        return mole_intel_data
+        return task_rows, mole_intel_data
 
     # --- TEXT GENERATORS ---
     def get_mole_text(self, dynamic_secret):
@@ -220,18 +222,9 @@ class RiskyBusiness:
 
     # --- VIEW ---
     def get_player_view(self, cursor, player_id, is_mole, dynamic_secret):
-        row = cursor.execute("SELECT * FROM risk_state WHERE player_id = ?", (player_id,)).fetchone()
-        
-        tasks = json.loads(row['tasks'])
-        complete = json.loads(row['complete'])
-        
-        view_tasks = []
-        for i, t in enumerate(tasks):
-            view_tasks.append({**t, "done": complete[i], "idx": i})
-            
         view = {
             "game_id": self.id,
-            "tasks": view_tasks
+            "tasks": tasks.get_tasks(cursor, player_id, self.id, "task")
         }
         
         if is_mole:
@@ -242,19 +235,18 @@ class RiskyBusiness:
         return view
 
     # --- INTERACTION --- 
+    # Every action handle_action knows, /metrics labels the rest as "other"
+    actions = ("toggle_task",)
+
     def handle_action(self, cursor, player_id, action, payload):
         if action == "toggle_task":
-            idx = payload.get("index")
-            row = cursor.execute("SELECT complete FROM risk_state WHERE player_id = ?", (player_id,)).fetchone()
-            c_list = json.loads(row['complete'])
-            c_list[idx] = not c_list[idx]
-            cursor.execute("UPDATE risk_state SET complete = ? WHERE player_id = ?", (json.dumps(c_list), player_id))
+            tasks.toggle_task(cursor, player_id, self.id, "task", payload.get("index"))
             return {"status": "updated"}
 
         return {"error": "Unknown action"}
 
     # --- SCORING ---
-    def calculate_scores(self, cursor):
+    def calculate_scores(self, cursor, room_id):
         """
         Since we need the Game Master to input the total number of troops alive
         (5 points per troop), this calculation relies on the GM inputting that total 
@@ -262,16 +254,35 @@ class RiskyBusiness:
         
         However, we CAN calculate the individual task points here.
         """
-        # Fetch individual states
-        rows = cursor.execute("SELECT player_id, tasks, complete FROM risk_state").fetchall()
-        
-        for r in rows:
-            tasks = json.loads(r['tasks'])
-            complete = json.loads(r['complete'])
-            
-            bonus_points = 0
-            for i, t in enumerate(tasks):
-                if complete[i]:
-                    bonus_points += t['points']
-            
-            cursor.execute("UPDATE players SET score = score + ? WHERE id = ?", (bonus_points, r['player_id']))
\ No newline at end of file
+        cursor.execute("""
+            UPDATE players SET score = score + r.bonus_points
+            FROM (
+                SELECT player_id, SUM(points * done) AS bonus_points
+                FROM player_tasks
+                WHERE room_id = ? AND game_id = ?
+                GROUP BY player_id
+            ) AS r
+            WHERE players.id = r.player_id
+        """, (room_id, self.id))
+
+
+class TaskPool:
+    """
+    Shuffled tasks handed out without repeats. An empty pool is refilled and
+    reshuffled instead of running dry, so a task only repeats once every task
+    of the pool has been dealt.
+    """
+
+    def __init__(self, descriptions):
+        self.descriptions = list(descriptions)
+        self.pool = []
+        self.refill()
+
+    def refill(self):
+        self.pool = list(self.descriptions)
+        random.shuffle(self.pool)
+
+    def pop(self):
+        if not self.pool:
+            self.refill()
+        return self.pool.pop()
@@ -0,0 +1,32 @@
+# Large lobbies can be split into tables (players.table_idx) when the game starts,
+# if the VIP asks for it with a table_size. Every table has its own mole and plays
+# its own copy of each game: its own characters, task pools and word list, and
+# every view only lists its table. Without a table_size the room is one table.
+import math
+import random
+
+# Players per table the start flow suggests, small enough for every task pool
+TABLE_SIZE = 10
+
+def deal_tables(players, table_size=None):
+    """
+    Splits players into tables of at most table_size, as even as possible and
+    never smaller than 2. No table_size means one table. A single table keeps
+    the join order, more are shuffled so friends who joined together don't all
+    end up at the same one.
+    """
+    if not table_size:
+        return [list(players)]
+    count = max(1, min(math.ceil(len(players) / max(table_size, 2)), len(players) // 2))
+    if count == 1:
+        return [list(players)]
+    players = list(players)
+    random.shuffle(players)
+    return [players[i::count] for i in range(count)]
+
+def players_by_table(cursor, room_id, columns="id"):
+    """{table_idx: [rows]} of a room, in join order. Games generate their secrets per table."""
+    tables = {}
+    for row in cursor.execute(f"SELECT table_idx, {columns} FROM players WHERE room_id = ? ORDER BY table_idx, id", (room_id,)):
+        tables.setdefault(row['table_idx'], []).append(row)
+    return tables
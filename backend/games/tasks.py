@@ -0,0 +1,46 @@
+# Shared storage for the secret/group tasks of Who am I?, Chess Challenges and Risky Business.
+# One row per task, so toggling is a single atomic UPDATE and scoring a single SUM.
+
+def setup_db(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS player_tasks (
+            room_id TEXT,
+            player_id INTEGER,
+            game_id TEXT,
+            kind TEXT,           -- what the game groups tasks by, e.g. 'group' / 'indiv'
+            idx INTEGER,         -- position within the kind, as sent to the frontend
+            description TEXT,
+            points INTEGER,
+            type TEXT,           -- label shown next to the task, e.g. 'easy' / 'Hard (End Game)'
+            done BOOLEAN DEFAULT 0,
+            PRIMARY KEY (player_id, game_id, kind, idx)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_tasks_room ON player_tasks (room_id, game_id, kind)")
+
+def clear_tasks(cursor, room_id, game_id):
+    cursor.execute("DELETE FROM player_tasks WHERE room_id = ? AND game_id = ?", (room_id, game_id))
+
+def insert_tasks(cursor, room_id, game_id, rows):
+    """rows: (player_id, kind, idx, description, points, type)"""
+    cursor.executemany("""
+        INSERT INTO player_tasks (room_id, game_id, player_id, kind, idx, description, points, type)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(room_id, game_id) + tuple(row) for row in rows])
+
+def get_tasks(cursor, player_id, game_id, kind):
+    rows = cursor.execute("""
+        SELECT idx, description, points, type, done FROM player_tasks
+        WHERE player_id = ? AND game_id = ? AND kind = ?
+        ORDER BY idx
+    """, (player_id, game_id, kind)).fetchall()
+    return [
+        {"desc": r['description'], "points": r['points'], "type": r['type'], "done": bool(r['done']), "idx": r['idx']}
+        for r in rows
+    ]
+
+def toggle_task(cursor, player_id, game_id, kind, idx):
+    cursor.execute("""
+        UPDATE player_tasks SET done = NOT done
+        WHERE player_id = ? AND game_id = ? AND kind = ? AND idx = ?
+    """, (player_id, game_id, kind, idx))
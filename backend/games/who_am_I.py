@@ -1,6 +1,8 @@
 import random
 import sqlite3
 
+from games import tables, tasks
+
 class WhoAmI:
     id = "who-am-i"
     title = "Who am I?"
@@ -79,39 +81,48 @@ Everyone will also get an easy secret task worth 100 points and a hard secret ta
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS whoami_state (
                 player_id INTEGER PRIMARY KEY,
+                room_id TEXT,
                 character TEXT,
-                easy_task TEXT,
-                hard_task TEXT,
-                easy_complete BOOLEAN DEFAULT 0,
-                hard_complete BOOLEAN DEFAULT 0,
                 questions_asked INTEGER DEFAULT 0,
                 wrong_guesses INTEGER DEFAULT 0,
                 is_solved BOOLEAN DEFAULT 0,
                 points_earned INTEGER DEFAULT 0
             )
         """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_whoami_state_room ON whoami_state (room_id)")
 
-    def generate_secret_state(self, cursor):
-        cursor.execute("DELETE FROM whoami_state")
-        
-        # Cursor comes from main, which already has Row factory set
-        players = cursor.execute("SELECT id FROM players").fetchall()
+    def clear_room(self, cursor, room_id):
+        cursor.execute("DELETE FROM whoami_state WHERE room_id = ?", (room_id,))
+        tasks.clear_tasks(cursor, room_id, self.id)
+
+    def generate_secret_state(self, cursor, room_id):
+        self.clear_room(cursor, room_id)
         
-        random.shuffle(self.characters)
-        mole_intel = {}
+        mole_intel = {}  # table_idx -> intel for that table's mole
+        task_rows = []
 
-        for i, p in enumerate(players):
-            char = self.characters[i % len(self.characters)]
-            easy = random.choice(self.easy_tasks)
-            hard = random.choice(self.hard_tasks)
-            
-            cursor.execute("""
-                INSERT INTO whoami_state (player_id, character, easy_task, hard_task) 
-                VALUES (?, ?, ?, ?)
-            """, (p['id'], char, easy, hard))
-            
-            mole_intel[p['id']] = {"char": char, "easy": easy, "hard": hard}
+        # Every table deals from the full character list, only tables get unique characters
+        for table_idx, players in tables.players_by_table(cursor, room_id).items():
+            # A shuffled copy, the order of the class list must not depend on earlier rooms (replays)
+            characters = random.sample(self.characters, len(self.characters))
+            table_intel = mole_intel[table_idx] = {}
+
+            for i, p in enumerate(players):
+                char = characters[i % len(characters)]
+                easy = random.choice(self.easy_tasks)
+                hard = random.choice(self.hard_tasks)
 
+                cursor.execute("""
+                    INSERT INTO whoami_state (player_id, room_id, character) 
+                    VALUES (?, ?, ?)
+                """, (p['id'], room_id, char))
+                # Task index 0 is the easy one, 1 the hard one
+                task_rows.append((p['id'], "secret", 0, easy, 100, "easy"))
+                task_rows.append((p['id'], "secret", 1, hard, 250, "hard"))
+
+                table_intel[p['id']] = {"char": char, "easy": easy, "hard": hard}
+
+        tasks.insert_tasks(cursor, room_id, self.id, task_rows)
         return mole_intel
 
     # --- VIEW ---
@@ -121,8 +132,8 @@ Everyone will also get an easy secret task worth 100 points and a hard secret ta
         view = {
             "game_id": self.id,
             "tasks": [
-                {"desc": my_state['easy_task'], "done": bool(my_state['easy_complete']), "type": "easy"},
-                {"desc": my_state['hard_task'], "done": bool(my_state['hard_complete']), "type": "hard"}
+                {"desc": t['desc'], "done": t['done'], "type": t['type']}
+                for t in tasks.get_tasks(cursor, player_id, self.id, "secret")
             ],
             "stats": {
                 "questions": my_state['questions_asked'],
@@ -132,11 +143,13 @@ Everyone will also get an easy secret task worth 100 points and a hard secret ta
             }
         }
 
+        # Only the player's own table, a view never grows with the room
         others_rows = cursor.execute("""
             SELECT p.name, w.character 
-            FROM whoami_state w 
-            JOIN players p ON w.player_id = p.id 
-            WHERE w.player_id != ?
+            FROM players me
+            JOIN players p ON p.room_id = me.room_id AND p.table_idx = me.table_idx AND p.id != me.id
+            JOIN whoami_state w ON w.player_id = p.id 
+            WHERE me.id = ?
         """, (player_id,)).fetchall()
         
         view['others'] = [{"name": r['name'], "char": r['character']} for r in others_rows]
@@ -150,6 +163,9 @@ Everyone will also get an easy secret task worth 100 points and a hard secret ta
         return view
 
     # --- INTERACTION ---
+    # Every action handle_action knows, /metrics labels the rest as "other"
+    actions = ("add_question", "toggle_task", "guess")
+
     def handle_action(self, cursor, player_id, action, payload):
         if action == "add_question":
             cursor.execute("UPDATE whoami_state SET questions_asked = questions_asked + 1 WHERE player_id = ?", (player_id,))
@@ -157,14 +173,8 @@ Everyone will also get an easy secret task worth 100 points and a hard secret ta
         
         if action == "toggle_task":
             # Payload: { "task_index": 0 } (0 for easy, 1 for hard)
-            idx = payload.get("task_index")
-            col = "easy_complete" if idx == 0 else "hard_complete"
-            
-            # Toggle logic
-            current = cursor.execute(f"SELECT {col} FROM whoami_state WHERE player_id = ?", (player_id,)).fetchone()[0]
-            new_val = 0 if current else 1
-            
-            cursor.execute(f"UPDATE whoami_state SET {col} = ? WHERE player_id = ?", (new_val, player_id))
+            idx = 0 if payload.get("task_index") == 0 else 1
+            tasks.toggle_task(cursor, player_id, self.id, "secret", idx)
             return {"status": "updated"}
 
         if action == "guess":
@@ -190,55 +200,38 @@ Everyone will also get an easy secret task worth 100 points and a hard secret ta
         return {"error": "Unknown action"}
 
     # --- SCORING ---
-    def calculate_scores(self, cursor):
+    def calculate_scores(self, cursor, room_id):
         """
+        Per table:
         1. Sum up all character guessing points -> Give to Innocents.
         2. Give (Max - Sum) -> To Mole.
         3. Add individual task points to specific players.
         """
-        rows = cursor.execute("SELECT * FROM whoami_state").fetchall()
-        num_players = len(rows)
-        
-        # 1. Calculate The Pot
-        total_pot_earned = 0
-        total_pot_possible = num_players * 300
-        
-        for r in rows:
-            if r['is_solved']:
-                total_pot_earned += r['points_earned']
-            else:
-                # Unsolved penalty still applies to the pot contribution
-                penalty = r['wrong_guesses'] * 25
-                total_pot_earned -= penalty
-        
-        # Ensure pot isn't negative
-        total_pot_earned = max(0, total_pot_earned)
-        mole_pot_earned = max(0, total_pot_possible - total_pot_earned)
-
-        # 2. Distribute Pot & Task Points
-        players = cursor.execute("SELECT id, is_mole FROM players").fetchall()
-        
-        for p in players:
-            pid = p['id']
-            # Find specific task state
-            state = next((r for r in rows if r['player_id'] == pid), None)
-            
-            round_score = 0
-            
-            # A. Pot Score
-            if p['is_mole']:
-                round_score += mole_pot_earned
-            else:
-                round_score += total_pot_earned
-            
-            # B. Task Score (Individual)
-            if state['easy_complete']:
-                round_score += 100
-            if state['hard_complete']:
-                round_score += 250
-            
-            # Update
-            cursor.execute("UPDATE players SET score = score + ? WHERE id = ?", (round_score, pid))
+        # Pot: 300 possible per player of the table, the earned part never negative.
+        # Unsolved characters still cost their wrong guess penalty
+        cursor.execute("""
+            UPDATE players SET score = score
+                + CASE WHEN players.is_mole THEN pot.mole_pot ELSE pot.earned END
+                + w.task_points
+            FROM (
+                SELECT w.player_id, COALESCE(SUM(t.points * t.done), 0) AS task_points
+                FROM whoami_state w
+                LEFT JOIN player_tasks t ON t.player_id = w.player_id AND t.game_id = :game_id
+                WHERE w.room_id = :room_id
+                GROUP BY w.player_id
+            ) AS w, (
+                SELECT table_idx, earned, MAX(0, num_players * 300 - earned) AS mole_pot
+                FROM (
+                    SELECT p.table_idx, COUNT(*) AS num_players,
+                           MAX(0, COALESCE(SUM(CASE WHEN w.is_solved THEN w.points_earned ELSE -w.wrong_guesses * 25 END), 0)) AS earned
+                    FROM whoami_state w
+                    JOIN players p ON p.id = w.player_id
+                    WHERE w.room_id = :room_id
+                    GROUP BY p.table_idx
+                )
+            ) AS pot
+            WHERE w.player_id = players.id AND pot.table_idx = players.table_idx
+        """, {"room_id": room_id, "game_id": self.id})
             
             
     characters = [
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# How long a result is kept for retries, and how many per room
+REPLAY_TTL = 300
+MAX_PER_ROOM = 256
+
+
+class ReplayCache:
+    """
+    Results of requests sent with an Idempotency-Key, per room, so a retried
+    /control, /game_action or /submit_quiz returns the first result instead of
+    applying its side effects again. A key only matches the same route and
+    player: the same key sent to another route, or by another player, runs.
+
+    The entry is made before the command runs and holds its task, so a retry
+    that arrives while the first attempt is still queued waits for the same
+    outcome. Failed attempts are forgotten, nothing was applied so a retry
+    may run again. Runs on the event loop only, no locking needed.
+    """
+
+    def __init__(self):
+        self.rooms = {}  # room_id -> OrderedDict((route, player_id, key) -> (created, task)), oldest first
+        self.stats = {"replays": 0, "misses": 0}
+
+    def evict(self, room_id):
+        entries = self.rooms.get(room_id)
+        if entries is None:
+            return
+        deadline = time.monotonic() - REPLAY_TTL
+        while entries and next(iter(entries.values()))[0] < deadline:
+            entries.popitem(last=False)
+        while len(entries) > MAX_PER_ROOM:
+            entries.popitem(last=False)
+        if not entries:
+            del self.rooms[room_id]
+
+    async def run(self, room_id, route, player_id, key, call):
+        """Result of call(), or of the earlier call made with the same route, player and key."""
+        if not key:
+            return await call()
+        key = (route, player_id, key)
+
+        self.evict(room_id)
+        entry = self.rooms.get(room_id, {}).get(key)
+        if entry is not None:
+            self.stats["replays"] += 1
+            return await asyncio.shield(entry[1])
+
+        self.stats["misses"] += 1
+        task = asyncio.ensure_future(call())
+        self.rooms.setdefault(room_id, OrderedDict())[key] = (time.monotonic(), task)
+        task.add_done_callback(lambda t: self.forget_failure(room_id, key, t))
+        # Shielded, a client hanging up must not cancel the command for its retries
+        return await asyncio.shield(task)
+
+    def forget_failure(self, room_id, key, task):
+        if task.cancelled() or task.exception() is not None:
+            entries = self.rooms.get(room_id)
+            if entries and entries.get(key, (None, None))[1] is task:
+                del entries[key]
+
+    def clear_room(self, room_id):
+        self.rooms.pop(room_id, None)
+
+
+replays = ReplayCache()
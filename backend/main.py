@@ -1,15 +1,36 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import sqlite3
 import random
 import json
 import time
 
-from database import get_db_connection
+from checkpoint import CheckpointError, checkpoints, decode, dump_room, encode, restore_room
+from database import get_db_connection, store
+from delta import diff, state_history
+from events import event_log, now
+from expiry import RoomExpiry
+from games import tables
 from games.registry import GAME_LIST, get_game_by_index
+from idempotency import replays
+from metrics import metrics
+import migrations
+from profiler import SORT_KEYS
 from questions import QUESTION_POOL
+from realtime import hub
+from room_writer import writer
+from scheduler import scheduler
+from serialization import FastJSONResponse, dumps, negotiated_response
+from state_backend import RedisError
+from static_content import IMMUTABLE, content_hash, static_content
+from view_cache import view_cache
 
-app = FastAPI()
+# orjson for every JSON body, the hot endpoints skip jsonable_encoder too (negotiated_response)
+app = FastAPI(default_response_class=FastJSONResponse)
+
+# Clients that don't send a room code all share this one
+DEFAULT_ROOM = "default"
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,66 +38,89 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+metrics.watch(store.conn)
+
+# Snapshots in the event log are room checkpoints
+event_log.snapshot = checkpoints.snapshot
+
+# Rooms expire after their last logged event, see RoomExpiry
+expiry = RoomExpiry(event_log.last_active)
+
+# Routes that don't serve a room, a shared backend isn't asked about them
+ROOMLESS_PATHS = ("/metrics", "/cache_stats", "/profile", "/games/")
+
+@app.middleware("http")
+async def refresh_shared_room(request: Request, call_next):
+    # Shared backends: pick up what other workers wrote to the room before serving it
+    if store.backend.shared and not request.url.path.startswith(ROOMLESS_PATHS):
+        room = request.query_params.get("room", DEFAULT_ROOM)
+        try:
+            if await asyncio.to_thread(store.refresh, room):
+                reload_room(room)
+        except (OSError, RedisError) as e:
+            # Memory has the room as this worker last saw it, serve that
+            print(f"Shared Backend Error ({room}): {e}")
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    labels = metrics.begin(request.query_params.get("action"))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.observe(labels, route.path if route else "unmatched", request.method, status, time.perf_counter() - start)
+
 def init_system():
+    """
+    Brings the schema up to date without touching the rooms, see migrations.py.
+    The database file survives reloads and restarts, rooms are only removed by
+    /reset and once they expire (see expiry.py).
+    """
     conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("DROP TABLE IF EXISTS players")
-    cur.execute("DROP TABLE IF EXISTS game_state")
-    cur.execute("DROP TABLE IF EXISTS quiz_answers")
-    cur.execute("DROP TABLE IF EXISTS score_history")
-
-    cur.execute("""
-        CREATE TABLE game_state (
-            id INTEGER PRIMARY KEY,
-            phase TEXT DEFAULT 'LOBBY', 
-            current_game_idx INTEGER DEFAULT 0,
-            dynamic_secret TEXT DEFAULT '{}',
-            timer_end REAL DEFAULT 0,
-            quiz_questions TEXT DEFAULT '[]',
-            used_questions TEXT DEFAULT '[]'
-        )
-    """)
-    cur.execute("INSERT INTO game_state (id, phase) VALUES (1, 'LOBBY')")
-
-    cur.execute("""
-        CREATE TABLE players (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE,
-            score INTEGER DEFAULT 0,
-            is_mole BOOLEAN DEFAULT 0,
-            is_vip BOOLEAN DEFAULT 0,
-            has_finished_quiz BOOLEAN DEFAULT 0
-        )
-    """)
-    cur.execute("CREATE TABLE quiz_answers (player_id INTEGER, question_id INTEGER, answer TEXT)")
-    cur.execute("""
-        CREATE TABLE score_history (
-            round_idx REAL,  -- Changed to REAL for decimals (0.5, 1.0)
-            player_id INTEGER,
-            score INTEGER
-        )
-    """)
-
-    # Run game specific setups
-    for game in GAME_LIST:
-        game.setup_db(cur)
-
-    conn.commit()
-    conn.close()
+    try:
+        applied = migrations.migrate(conn)
+    finally:
+        conn.close()
+    if applied:
+        # The new schema is on disk before the first request is served
+        store.flush()
+        print(f"Schema migrated to version {applied[-1]}")
 
 init_system()
 
 # --- HELPERS ---
 
-def pre_generate_quiz(cur):
+def get_room(cur, room_id):
+    game = cur.execute("SELECT * FROM game_state WHERE room_id = ?", (room_id,)).fetchone()
+    if not game:
+        raise HTTPException(status_code=404, detail=f"Room '{room_id}' not found")
+    current_game = get_game_by_index(game['current_game_idx'])
+    metrics.label(game=current_game.id if current_game else "", phase=game['phase'])
+    return game
+
+def clear_room(cur, room_id):
+    """Removes every row belonging to a room, including the game specific tables."""
+    cur.execute("DELETE FROM game_state WHERE room_id = ?", (room_id,))
+    cur.execute("DELETE FROM players WHERE room_id = ?", (room_id,))
+    cur.execute("DELETE FROM quiz_answers WHERE room_id = ?", (room_id,))
+    cur.execute("DELETE FROM score_history WHERE room_id = ?", (room_id,))
+    for game in GAME_LIST:
+        game.clear_room(cur, room_id)
+
+def pre_generate_quiz(cur, room_id):
     """
     Selects 4 random questions + the Mole Identity question.
     Updates the DB so we know what the upcoming quiz is.
     """
-    state = cur.execute("SELECT used_questions FROM game_state WHERE id=1").fetchone()
+    state = cur.execute("SELECT used_questions FROM game_state WHERE room_id = ?", (room_id,)).fetchone()
     used_ids = json.loads(state['used_questions'])
     
     # Pool excludes ID 5 (Who is Mole?) and already used questions
@@ -97,96 +141,108 @@ def pre_generate_quiz(cur):
     cur.execute("""
         UPDATE game_state 
         SET quiz_questions = ?, used_questions = ? 
-        WHERE id = 1
-    """, (json.dumps(selected), json.dumps(used_ids)))
+        WHERE room_id = ?
+    """, (json.dumps(selected), json.dumps(used_ids), room_id))
 
-def snapshot_scores(cur, round_val):
-    players = cur.execute("SELECT id, score FROM players").fetchall()
-    for p in players:
-        cur.execute("INSERT INTO score_history (round_idx, player_id, score) VALUES (?, ?, ?)",
-                    (round_val, p['id'], p['score']))
-
-def calculate_quiz_and_snapshot(cur, round_idx):
+def snapshot_scores(cur, room_id, round_val):
+    cur.execute("""
+        INSERT INTO score_history (room_id, round_idx, player_id, score)
+        SELECT room_id, ?, id, score FROM players WHERE room_id = ?
+    """, (round_val, room_id))
+
+# Points per quiz answer of an innocent player, for them and for the mole of their table.
+# Identity question (ID 5): +100 / -50 when they named the mole.
+# Any other question: +50 / +35 when they gave the same answer as the mole.
+QUIZ_POINTS_SQL = """
+    SELECT a.player_id, mole.id AS mole_id,
+        SUM(CASE WHEN a.question_id = 5 THEN (a.answer = mole.name) * 100
+                 WHEN EXISTS (SELECT 1 FROM quiz_answers m
+                              WHERE m.player_id = mole.id AND m.question_id = a.question_id AND m.answer = a.answer) THEN 50
+                 ELSE 0 END) AS points,
+        SUM(CASE WHEN a.question_id = 5 THEN (a.answer = mole.name) * -50
+                 WHEN EXISTS (SELECT 1 FROM quiz_answers m
+                              WHERE m.player_id = mole.id AND m.question_id = a.question_id AND m.answer = a.answer) THEN 35
+                 ELSE 0 END) AS mole_points
+    FROM quiz_answers a
+    JOIN players p ON p.id = a.player_id
+    JOIN players mole ON mole.room_id = p.room_id AND mole.table_idx = p.table_idx AND mole.is_mole = 1
+    WHERE a.room_id = :room_id AND p.is_mole = 0
+    GROUP BY a.player_id
+"""
+
+def calculate_quiz_and_snapshot(cur, room_id, round_idx):
     # 1. Mole Logic
-    mole_row = cur.execute("SELECT id, name FROM players WHERE is_mole = 1").fetchone()
-    if not mole_row: 
-        cur.execute("DELETE FROM quiz_answers")
+    if not cur.execute("SELECT 1 FROM players WHERE room_id = ? AND is_mole = 1", (room_id,)).fetchone():
+        cur.execute("DELETE FROM quiz_answers WHERE room_id = ?", (room_id,))
         return
 
-    mole_id = mole_row['id']
-    mole_name = mole_row['name']
-    mole_answers = cur.execute("SELECT question_id, answer FROM quiz_answers WHERE player_id = ?", (mole_id,)).fetchall()
-    mole_map = {row['question_id']: row['answer'] for row in mole_answers}
+    params = {"room_id": room_id}
 
-    innocents = cur.execute("SELECT id FROM players WHERE is_mole = 0").fetchall()
-    mole_points_change = 0
-
-    for p in innocents:
-        p_answers = cur.execute("SELECT question_id, answer FROM quiz_answers WHERE player_id = ?", (p['id'],)).fetchall()
-        p_points_change = 0
-        
-        for ans in p_answers:
-            qid = ans['question_id']
-            val = ans['answer']
-            if qid == 5: # Identity question
-                if val == mole_name:
-                    p_points_change += 100
-                    mole_points_change -= 50
-            elif qid in mole_map and mole_map[qid] == val: # Match answer
-                p_points_change += 50
-                mole_points_change += 35
-        
-        cur.execute("UPDATE players SET score = score + ? WHERE id = ?", (p_points_change, p['id']))
+    # 2. Innocents and moles in one statement each, whatever the lobby size
+    cur.execute(f"""
+        UPDATE players SET score = score + q.points
+        FROM ({QUIZ_POINTS_SQL}) AS q
+        WHERE players.id = q.player_id
+    """, params)
+    cur.execute(f"""
+        UPDATE players SET score = score + q.points
+        FROM (SELECT mole_id, SUM(mole_points) AS points FROM ({QUIZ_POINTS_SQL}) GROUP BY mole_id) AS q
+        WHERE players.id = q.mole_id
+    """, params)
 
-    cur.execute("UPDATE players SET score = score + ? WHERE id = ?", (mole_points_change, mole_id))
-    snapshot_scores(cur, round_idx + 1.0)
-    cur.execute("DELETE FROM quiz_answers")
+    snapshot_scores(cur, room_id, round_idx + 1.0)
+    cur.execute("DELETE FROM quiz_answers WHERE room_id = ?", (room_id,))
 
 # --- CONTROL HANDLERS ---
 
-def handle_start_game(cur):
-    players = cur.execute("SELECT id FROM players").fetchall()
+def handle_start_game(cur, room_id, table_size=None):
+    players = cur.execute("SELECT id FROM players WHERE room_id = ?", (room_id,)).fetchall()
     if len(players) < 2:
         raise HTTPException(status_code=400, detail="Need at least 2 players")
-    cur.execute("UPDATE players SET is_mole = 0")
-    mole_id = random.choice(players)['id']
-    cur.execute("UPDATE players SET is_mole = 1 WHERE id = ?", (mole_id,))
-    cur.execute("UPDATE game_state SET phase = 'REVEAL' WHERE id = 1")
-
-def handle_start_timer(cur, current_game):
+    # With a table_size large lobbies play at several tables, each with its own mole
+    rows = []
+    dealt = tables.deal_tables([p['id'] for p in players], table_size)
+    for table_idx, ids in enumerate(dealt):
+        mole_id = random.choice(ids)
+        rows += [(table_idx, pid == mole_id, pid) for pid in ids]
+    cur.executemany("UPDATE players SET table_idx = ?, is_mole = ? WHERE id = ?", rows)
+    cur.execute("UPDATE game_state SET phase = 'REVEAL', table_count = ? WHERE room_id = ?", (len(dealt), room_id))
+
+def handle_start_timer(cur, room_id, current_game):
     duration = int(current_game.duration)
-    end_time = time.time() + duration
-    cur.execute("UPDATE game_state SET phase = 'GAME_RUNNING', timer_end = ? WHERE id = 1", (end_time,))
+    # now(), a replay has to end up with the same timer, see events.py
+    end_time = now() + duration
+    cur.execute("UPDATE game_state SET phase = 'GAME_RUNNING', timer_end = ? WHERE room_id = ?", (end_time, room_id))
 
-def handle_explain_round(cur, current_game):
+def handle_explain_round(cur, room_id, current_game):
     # 1. Generate Game Secrets
-    dynamic_data = current_game.generate_secret_state(cur)
-    cur.execute("UPDATE game_state SET phase = 'EXPLANATION', dynamic_secret = ? WHERE id = 1", (json.dumps(dynamic_data),))
+    dynamic_data = current_game.generate_secret_state(cur, room_id)
+    cur.execute("UPDATE game_state SET phase = 'EXPLANATION', dynamic_secret = ? WHERE room_id = ?", (json.dumps(dynamic_data), room_id))
     
     # 2. PRE-GENERATE QUIZ (So we can show hints)
-    pre_generate_quiz(cur)
+    pre_generate_quiz(cur, room_id)
     
-def handle_start_quiz(cur):
+def handle_start_quiz(cur, room_id):
     # Just change phase, questions are already in DB from the Explanation phase
-    cur.execute("UPDATE game_state SET phase = 'QUIZ' WHERE id = 1")
-    cur.execute("UPDATE players SET has_finished_quiz = 0")
+    cur.execute("UPDATE game_state SET phase = 'QUIZ' WHERE room_id = ?", (room_id,))
+    cur.execute("UPDATE players SET has_finished_quiz = 0 WHERE room_id = ?", (room_id,))
 
-def handle_advance_round(cur):
-    row = cur.execute("SELECT current_game_idx FROM game_state WHERE id=1").fetchone()
+def handle_advance_round(cur, room_id):
+    row = cur.execute("SELECT current_game_idx FROM game_state WHERE room_id = ?", (room_id,)).fetchone()
     current_idx = row['current_game_idx']
     
     # 1. Scoring
-    calculate_quiz_and_snapshot(cur, current_idx)
+    calculate_quiz_and_snapshot(cur, room_id, current_idx)
     
     prev_game = get_game_by_index(current_idx)
     if prev_game and hasattr(prev_game, 'calculate_scores'):
-        prev_game.calculate_scores(cur)
+        prev_game.calculate_scores(cur, room_id)
 
     next_idx = current_idx + 1
     
     if next_idx < len(GAME_LIST):
         next_game = get_game_by_index(next_idx)
-        dynamic_data = next_game.generate_secret_state(cur) 
+        dynamic_data = next_game.generate_secret_state(cur, room_id) 
         
         cur.execute("""
             UPDATE game_state 
@@ -194,71 +250,138 @@ def handle_advance_round(cur):
                 current_game_idx = ?, 
                 dynamic_secret = ?,
                 timer_end = 0
-            WHERE id = 1
-        """, (next_idx, json.dumps(dynamic_data)))
-        cur.execute("UPDATE players SET has_finished_quiz = 0")
+            WHERE room_id = ?
+        """, (next_idx, json.dumps(dynamic_data), room_id))
+        cur.execute("UPDATE players SET has_finished_quiz = 0 WHERE room_id = ?", (room_id,))
         
         # 2. PRE-GENERATE QUIZ FOR NEXT ROUND
-        pre_generate_quiz(cur)
+        pre_generate_quiz(cur, room_id)
         
     else:
-        cur.execute("UPDATE game_state SET phase = 'FINAL_REVEAL' WHERE id = 1")
+        cur.execute("UPDATE game_state SET phase = 'FINAL_REVEAL' WHERE room_id = ?", (room_id,))
 
 # --- ENDPOINTS ---
+# Every handler is async and talks to the in-memory database straight from the
+# event loop. Queries take microseconds and the disk is only touched by the
+# write-behind thread, so a hop to the threadpool would cost more than the work.
 
 @app.get("/state")
-def get_game_state(player_id: int = None):
+async def get_game_state(request: Request, player_id: int = None, room: str = DEFAULT_ROOM,
+                         since: str = None):
+    # Read the tag before the state so a concurrent write can only make it stale, never wrong
+    version = hub.version(room)
+    etag = hub.etag(room, player_id)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    state = build_game_state(player_id, room)
+    if since is not None:
+        # Delta mode: {"version", "state"} or {"version", "since", "patch"}, see StateHistory
+        state = state_history.respond(room, version, player_id, state, since)
+    return negotiated_response(request, state, headers={"ETag": etag})
+
+def build_game_state(player_id, room):
     conn = get_db_connection()
-    game = conn.execute("SELECT * FROM game_state WHERE id=1").fetchone()
-    players_db = conn.execute("SELECT id, name, score, is_vip, is_mole, has_finished_quiz FROM players").fetchall()
+    try:
+        return render_game_state(conn, player_id, room)
+    finally:
+        conn.close()
+
+# Players a client is sent, see render_game_state and /players
+ROSTER_COLUMNS = "id, name, score, is_vip, is_mole, has_finished_quiz"
+ROSTER_PAGE = 50
+
+# Static description of every game, clients fetch it once from /games/{id}/meta
+GAME_META = {
+    game.id: {
+        "id": game.id,
+        "title": game.title,
+        "duration": game.duration,
+        "max_points": game.max_points,
+        "team_distribution": game.team_distribution,
+        "description": game.description
+    }
+    for game in GAME_LIST
+}
+GAME_META_HASH = {game_id: content_hash(meta) for game_id, meta in GAME_META.items()}
+
+def hoist_static(room, game, view):
+    """Swaps the round-static fields of a game view for a reference into StaticContent."""
+    for field in getattr(game, 'static_view_fields', ()):
+        if field in view:
+            view[f"{field}_ref"] = static_content.put(room, view.pop(field))
+    return view
+
+def render_game_state(conn, player_id, room):
+    # Before any read, see ViewCache
+    versions = view_cache.versions(room, player_id)
+    game = get_room(conn, room)
+    player = conn.execute(f"SELECT {ROSTER_COLUMNS}, table_idx FROM players WHERE id = ? AND room_id = ?",
+                          (player_id, room)).fetchone() if player_id else None
+    table_idx = player['table_idx'] if player else 0
+
+    # A client only gets its own table, so the response doesn't grow with the room.
+    # Everyone is at table 0 until start_game, there the lobby sends one page.
+    in_lobby = game['phase'] == 'LOBBY'
+    players_db = conn.execute(f"""
+        SELECT {ROSTER_COLUMNS} FROM players WHERE room_id = ? AND table_idx = ? ORDER BY id LIMIT ?
+    """, (room, table_idx, ROSTER_PAGE if in_lobby else -1)).fetchall()
     
     response = {
         "phase": game['phase'],
         "timer_end": game['timer_end'],
         "players": [dict(p) for p in players_db],
+        "table_count": game['table_count'],
         "round_info": { "current": game['current_game_idx'] + 1, "total": len(GAME_LIST) }
     }
+    if in_lobby:
+        # The lobby page is capped, the start flow needs the real count
+        response["suggested_table_size"] = tables.TABLE_SIZE
+        response["player_count"] = conn.execute("SELECT COUNT(*) FROM players WHERE room_id = ?", (room,)).fetchone()[0]
 
     if game['phase'] == 'FINAL_REVEAL':
-        history = conn.execute("SELECT * FROM score_history ORDER BY round_idx").fetchall()
+        history = conn.execute("""
+            SELECT h.round_idx, h.player_id, h.score FROM score_history h
+            JOIN players p ON p.id = h.player_id
+            WHERE h.room_id = ? AND p.table_idx = ?
+            ORDER BY h.round_idx
+        """, (room, table_idx)).fetchall()
         response["history"] = [dict(h) for h in history]
 
     if player_id:
-        player = next((p for p in players_db if p['id'] == player_id), None)
         if player:
             response["me"] = {
                 "id": player['id'],
                 "is_vip": bool(player['is_vip']),
                 "is_mole": bool(player['is_mole']),
-                "has_finished_quiz": bool(player['has_finished_quiz'])
+                "has_finished_quiz": bool(player['has_finished_quiz']),
+                "table": table_idx
             }
 
             # DYNAMIC CONTENT LOADING
             if game['phase'] in ['EXPLANATION', 'GAME_RUNNING', 'SCORING']:
                 current_game = get_game_by_index(game['current_game_idx'])
                 if current_game:
-                    response["game_content"] = {
-                        "id": current_game.id,
-                        "title": current_game.title,
-                        "duration": current_game.duration,
-                        "max_points": current_game.max_points,
-                        "team_distribution": current_game.team_distribution,
-                        "description": current_game.description
-                    }
+                    # Only a reference, the description alone is kilobytes
+                    response["game_ref"] = {"id": current_game.id, "hash": GAME_META_HASH[current_game.id]}
                     
-                    secrets = json.loads(game['dynamic_secret'])
+                    # Games generate their secrets per table, a player only gets their table's
+                    secrets = lambda: view_cache.get_secrets(room, versions[0], game['dynamic_secret']).get(str(table_idx), {})
                     
                     # 1. Get Interactive View Data (for Game Running)
-                    view_data = current_game.get_player_view(conn, player['id'], player['is_mole'], secrets)
+                    view_data = view_cache.get_view(room, player['id'], versions, lambda: hoist_static(room, current_game,
+                        current_game.get_player_view(conn, player['id'], player['is_mole'], secrets())))
                     response["game_specific"] = view_data
 
                     # 2. Get Text Description (for Explanation Screen) <--- ADD THIS BACK
                     # Check if the game class has these methods (Ritual, Chess, WhoAmI all do)
                     if hasattr(current_game, 'get_mole_text'):
                         if player['is_mole']:
-                            response["secret_info"] = current_game.get_mole_text(secrets)
+                            render_text = lambda: current_game.get_mole_text(secrets())
                         else:
-                            response["secret_info"] = current_game.get_innocent_text(secrets)
+                            render_text = lambda: current_game.get_innocent_text(secrets())
+                        # The text is the same all round, send its StaticContent reference
+                        response["secret_ref"] = view_cache.get_secret_text(room, versions[0], (table_idx, bool(player['is_mole'])),
+                                                                            lambda: static_content.put(room, render_text()))
                                 # --- NEW: QUIZ HINT LOGIC ---
                 # 1. Get the pre-generated questions
                 q_ids = json.loads(game['quiz_questions'])
@@ -296,115 +419,532 @@ def get_game_state(player_id: int = None):
                         questions_to_send.append(q_copy)
                 response["quiz_data"] = questions_to_send
 
-    conn.close()
     return response
 
+# --- ROOM COMMANDS ---
+# Every mutation of a room runs as a command of its RoomWriter, in arrival order.
+# A command gets the batch's cursor and must not commit, the writer does that.
+
+# Phase a room has to be in for each control, so a double tap can't run a transition twice
+CONTROL_PHASES = {
+    "start_game": "LOBBY",
+    "explain_round": "REVEAL",
+    "start_timer": "EXPLANATION",
+    "end_game_early": "GAME_RUNNING",
+    "submit_score": "SCORING",
+    "start_quiz": "QUIZ_INTRO",
+    "advance_round": "QUIZ",
+}
+
+# Action labels of /metrics, see Metrics.begin
+metrics.actions = set(CONTROL_PHASES) | {action for game in GAME_LIST for action in getattr(game, 'actions', ())}
+
+def apply_game_action(cur, room, player_id, action, payload):
+    # Determine current game
+    row = get_room(cur, room)
+    if not cur.execute("SELECT 1 FROM players WHERE id = ? AND room_id = ?", (player_id, room)).fetchone():
+        raise HTTPException(status_code=404, detail="Player not in room")
+    current_game = get_game_by_index(row['current_game_idx'])
+
+    # Delegate to game class
+    return current_game.handle_action(cur, player_id, action, payload)
+
+def apply_control(cur, room, action, payload):
+    state = get_room(cur, room)
+    current_game = get_game_by_index(state['current_game_idx'])
+
+    expected = CONTROL_PHASES.get(action)
+    if expected and state['phase'] != expected:
+        raise HTTPException(status_code=409, detail=f"{action} is only allowed in {expected}, the room is in {state['phase']}")
+
+    if action == "start_game":
+        # Opt-in: without a table_size everyone plays at one table
+        table_size = payload.get('table_size')
+        if table_size in (None, "", 0):
+            table_size = None
+        else:
+            try:
+                table_size = int(table_size)
+            except (TypeError, ValueError):
+                table_size = 0
+            if table_size < 2:
+                raise HTTPException(status_code=400, detail="table_size must be a whole number of at least 2")
+        handle_start_game(cur, room, table_size)
+    elif action == "explain_round":
+        handle_explain_round(cur, room, current_game)
+    elif action == "start_timer":
+        handle_start_timer(cur, room, current_game)
+    elif action == "end_game_early":
+        cur.execute("UPDATE game_state SET phase = 'SCORING' WHERE room_id = ?", (room,))
+    elif action == "submit_score":
+        current_idx = state['current_game_idx']
+        
+        # 1. Apply Manual Points (Group Pot)
+        if current_game.id in ['ritual', 'dictionary-dudes', 'risky-business']:
+            max_pts = current_game.max_points
+            if isinstance(max_pts, str): max_pts = 1600 # Fallback for Risk
+
+            # Every table played its own game: {"table_points": {"0": 900, ...}},
+            # tables left out get "points"
+            table_points = payload.get('table_points') or {}
+            for table_idx in range(state['table_count']):
+                points = int(table_points.get(str(table_idx), payload.get('points', 0)))
+                mole_pts = max_pts - points
+                cur.execute("""
+                    UPDATE players SET score = score + CASE WHEN is_mole THEN ? ELSE ? END
+                    WHERE room_id = ? AND table_idx = ?
+                """, (mole_pts, points, room, table_idx))
+        
+        # 2. Apply Automated Task Bonuses (Risk, WhoAmI, Chess)
+        # Note: We use 'if' instead of 'elif' here so Risk runs BOTH blocks
+        if hasattr(current_game, 'calculate_scores'):
+            current_game.calculate_scores(cur, room)
+
+        snapshot_scores(cur, room, current_idx + 0.5)
+        cur.execute("UPDATE game_state SET phase = 'QUIZ_INTRO' WHERE room_id = ?", (room,))
+        
+    elif action == "start_quiz":
+        handle_start_quiz(cur, room)
+
+    elif action == "advance_round":
+        handle_advance_round(cur, room)
+
+    return {"status": "ok"}
+
+def apply_timer_end(cur, room, timer_end):
+    # Only the timer that was scheduled, the game may have been ended or restarted since
+    cur.execute("""
+        UPDATE game_state SET phase = 'SCORING'
+        WHERE room_id = ? AND phase = 'GAME_RUNNING' AND timer_end = ?
+    """, (room, timer_end))
+
+async def expire_timer(room, timer_end):
+    await writer.submit(room, apply_timer_end, room, timer_end, event=("timer", None, {"timer_end": timer_end}))
+    checkpoints.mark(room, urgent=True)
+
+scheduler.expire = expire_timer
+
+@app.on_event("startup")
+async def reattach_rooms():
+    # Rooms survive restarts in the database file, every phase resumes where it was.
+    # Rooms the file lost (a crash, a new host) come back from their checkpoints.
+    # Only running games need something from us: their timers, expired ones end right away
+    conn = get_db_connection()
+    try:
+        existing = {row['room_id'] for row in conn.execute("SELECT room_id FROM game_state")}
+    finally:
+        conn.close()
+    # A shared backend has the newer copy of every room, never overwrite it with a local file
+    restored = []
+    if store.backend.durable:
+        if not store.backend.shared:
+            restored = checkpoints.load_all(clear_room, skip=existing)
+        checkpoints.start()
+
+    conn = get_db_connection()
+    try:
+        running = conn.execute("SELECT room_id, timer_end FROM game_state WHERE phase = 'GAME_RUNNING'").fetchall()
+    finally:
+        conn.close()
+    for row in running:
+        scheduler.schedule(row['room_id'], row['timer_end'])
+    expiry.start()
+    print(f"Reattached {len(existing)} rooms, restored {len(restored)} from checkpoints ({len(running)} running), "
+          f"loaded from {store.backend.name} in {store.load_ms:.0f} ms")
+
+def apply_quiz_answers(cur, room, player_id, answers):
+    player = cur.execute("SELECT has_finished_quiz FROM players WHERE id = ? AND room_id = ?", (player_id, room)).fetchone()
+    if not player:
+        raise HTTPException(status_code=404, detail="Player not in room")
+    # A second submit would count every answer twice
+    if player['has_finished_quiz']:
+        raise HTTPException(status_code=409, detail="Quiz already submitted")
+    cur.executemany("INSERT INTO quiz_answers (room_id, player_id, question_id, answer) VALUES (?,?,?,?)",
+                    [(room, player_id, q_id, ans_text) for q_id, ans_text in answers.items()])
+    cur.execute("UPDATE players SET has_finished_quiz = 1 WHERE id = ? AND room_id = ?", (player_id, room))
+    return {"status": "submitted"}
+
 # NEW ENDPOINT FOR GAME ACTIONS (GUESSES, ETC)
+# Retries sent with the same Idempotency-Key header get the first result, see ReplayCache
 @app.post("/game_action")
-def game_action(player_id: int, action: str, payload: dict = {}):
-    conn = get_db_connection()
-    cur = conn.cursor()
+async def game_action(player_id: int, action: str, payload: dict = {}, room: str = DEFAULT_ROOM,
+                      idempotency_key: str = Header(None)):
     try:
-        # Determine current game
-        row = cur.execute("SELECT current_game_idx FROM game_state WHERE id=1").fetchone()
-        current_game = get_game_by_index(row['current_game_idx'])
-        
-        # Delegate to game class
-        result = current_game.handle_action(cur, player_id, action, payload)
-        
-        conn.commit()
-        return result
+        # Game actions only ever touch the acting player's rows
+        # The socket runs actions through here too, its HTTP fallback retries with the same key
+        return await replays.run(room, "/game_action", player_id, idempotency_key, lambda: writer.submit(
+            room, apply_game_action, room, player_id, action, payload, player_id=player_id,
+            event=("action", action, payload)))
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Game Action Error: {e}")
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 # Existing control endpoint
 @app.post("/control")
-def game_control(action: str, payload: dict = {}):
-    conn = get_db_connection()
-    cur = conn.cursor()
+async def game_control(action: str, payload: dict = {}, room: str = DEFAULT_ROOM,
+                       idempotency_key: str = Header(None)):
     try:
-        state = cur.execute("SELECT current_game_idx FROM game_state WHERE id=1").fetchone()
-        current_game = get_game_by_index(state['current_game_idx'])
-
-        if action == "start_game":
-            handle_start_game(cur)
-        elif action == "explain_round":
-            handle_explain_round(cur, current_game)
-        elif action == "start_timer":
-            handle_start_timer(cur, current_game)
-        elif action == "end_game_early":
-            cur.execute("UPDATE game_state SET phase = 'SCORING' WHERE id = 1")
-        elif action == "submit_score":
-            row = cur.execute("SELECT current_game_idx FROM game_state WHERE id=1").fetchone()
-            current_idx = row['current_game_idx']
-            
-            # 1. Apply Manual Points (Group Pot)
-            if current_game.id in ['ritual', 'dictionary-dudes', 'risky-business']:
-                points = int(payload.get('points', 0))
-                max_pts = current_game.max_points
-                if isinstance(max_pts, str): max_pts = 1600 # Fallback for Risk
-                
-                mole_pts = max_pts - points
-                
-                cur.execute("UPDATE players SET score = score + ? WHERE is_mole = 0", (points,))
-                cur.execute("UPDATE players SET score = score + ? WHERE is_mole = 1", (mole_pts,))
-            
-            # 2. Apply Automated Task Bonuses (Risk, WhoAmI, Chess)
-            # Note: We use 'if' instead of 'elif' here so Risk runs BOTH blocks
-            if hasattr(current_game, 'calculate_scores'):
-                current_game.calculate_scores(cur)
-
-            snapshot_scores(cur, current_idx + 0.5)
-            cur.execute("UPDATE game_state SET phase = 'QUIZ_INTRO' WHERE id = 1")
-            
-        elif action == "start_quiz":
-            handle_start_quiz(cur)
-
-        elif action == "advance_round":
-            handle_advance_round(cur)
-
-        conn.commit()
-        return {"status": "ok"}
+        result = await replays.run(room, "/control", None, idempotency_key, lambda: writer.submit(
+            room, apply_control, room, action, payload, event=("control", action, payload)))
+        if action == "start_timer":
+            schedule_timer(room)
+        # Controls change the phase, checkpoint the room right away
+        checkpoints.mark(room, urgent=True)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         print(f"Control Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+def apply_join(cur, room, name, player_id=None):
+    """(player id, whether they are new). A replay passes the id the player got."""
+    # Rooms are created by their first player
+    cur.execute("INSERT OR IGNORE INTO game_state (room_id, phase) VALUES (?, 'LOBBY')", (room,))
+    existing = cur.execute("SELECT id FROM players WHERE room_id = ? AND name = ?", (room, name)).fetchone()
+    if existing:
+        return existing['id'], False
+    count = cur.execute("SELECT count(*) FROM players WHERE room_id = ?", (room,)).fetchone()[0]
+    is_vip = (count == 0)
+    if player_id is None:
+        player_id = store.backend.new_player_id()
+    cur.execute("INSERT INTO players (id, room_id, name, is_vip) VALUES (?, ?, ?, ?)", (player_id, room, name, is_vip))
+    return cur.lastrowid, True
 
 @app.post("/join")
-def join_game(name: str):
+async def join_game(name: str, room: str = DEFAULT_ROOM):
     conn = get_db_connection()
-    cur = conn.cursor()
-    existing = cur.execute("SELECT id FROM players WHERE name = ?", (name,)).fetchone()
-    if existing:
+    try:
+        new_id, joined = apply_join(conn.cursor(), room, name)
+        conn.commit()
+    finally:
         conn.close()
-        return {"player_id": existing['id']}
-    count = cur.execute("SELECT count(*) FROM players").fetchone()[0]
-    is_vip = (count == 0)
-    cur.execute("INSERT INTO players (name, is_vip) VALUES (?, ?)", (name, is_vip))
-    new_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    if not joined:
+        return {"player_id": new_id}
+    event_log.append(room, "join", player_id=new_id, payload={"name": name})
+    store.touch(room)
+    hub.notify(room)
+    checkpoints.mark(room)
     return {"player_id": new_id}
 
 @app.post("/submit_quiz")
-def submit_quiz(player_id: int, answers: dict):
+async def submit_quiz(player_id: int, answers: dict, room: str = DEFAULT_ROOM,
+                      idempotency_key: str = Header(None)):
+    return await replays.run(room, "/submit_quiz", player_id, idempotency_key, lambda: writer.submit(
+        room, apply_quiz_answers, room, player_id, answers, player_id=player_id, event=("quiz", None, answers)))
+
+def immutable_response(request, ref, content):
+    etag = f'"{ref}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return negotiated_response(request, content, headers=headers)
+
+@app.get("/games/{game_id}/meta")
+async def get_game_meta(request: Request, game_id: str):
+    # Clients add ?v=<hash> from game_ref so a changed description gets a new URL
+    meta = GAME_META.get(game_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"Unknown game '{game_id}'")
+    return immutable_response(request, GAME_META_HASH[game_id], meta)
+
+@app.get("/static/{ref}")
+async def get_static_content(request: Request, ref: str, room: str = DEFAULT_ROOM):
+    content = static_content.get(room, ref)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Unknown content")
+    return immutable_response(request, ref, content)
+
+@app.get("/players")
+async def list_players(room: str = DEFAULT_ROOM, offset: int = 0, limit: int = ROSTER_PAGE, sort: str = "id"):
+    # The whole room a page at a time (join order or leaderboard), /state only has the player's table
+    order = {"id": "id", "score": "score DESC, id"}.get(sort)
+    if order is None:
+        raise HTTPException(status_code=400, detail="sort must be 'id' or 'score'")
+    limit = max(1, min(limit, ROSTER_PAGE))
     conn = get_db_connection()
-    cur = conn.cursor()
-    for q_id, ans_text in answers.items():
-        cur.execute("INSERT INTO quiz_answers (player_id, question_id, answer) VALUES (?,?,?)", 
-                    (player_id, q_id, ans_text))
-    cur.execute("UPDATE players SET has_finished_quiz = 1 WHERE id = ?", (player_id,))
-    conn.commit()
-    conn.close()
-    return {"status": "submitted"}
+    try:
+        get_room(conn, room)
+        total = conn.execute("SELECT COUNT(*) FROM players WHERE room_id = ?", (room,)).fetchone()[0]
+        rows = conn.execute(f"""
+            SELECT id, name, score, is_vip, has_finished_quiz, table_idx FROM players
+            WHERE room_id = ? ORDER BY {order} LIMIT ? OFFSET ?
+        """, (room, limit, max(0, offset))).fetchall()
+    finally:
+        conn.close()
+    return {"total": total, "offset": max(0, offset), "players": [dict(r) for r in rows]}
+
+@app.get("/cache_stats")
+async def cache_stats():
+    return {**view_cache.hit_rates(), "idempotency": dict(replays.stats), "checkpoints": dict(checkpoints.stats),
+            "events": dict(event_log.stats), "expiry": dict(expiry.stats)}
+
+@app.get("/profile")
+async def get_profile(top: int = 20, sort: str = "total_ms"):
+    """Slowest statements with their plans, only when started with GAME_PROFILE=1."""
+    if store.profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is off, start the server with GAME_PROFILE=1")
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_KEYS)}")
+    conn = get_db_connection()
+    try:
+        return store.profiler.report(conn, top, sort)
+    finally:
+        conn.close()
+
+@app.post("/profile/reset")
+async def reset_profile():
+    if store.profiler is not None:
+        store.profiler.reset()
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/reset")
-def reset_game():
-    init_system()
-    return {"message": "Game reset"}
\ No newline at end of file
+async def reset_game(room: str = DEFAULT_ROOM):
+    remove_room(room)
+    event_log.reset(room)
+    return {"message": "Game reset"}
+
+def remove_room(room, persist=True):
+    """
+    Deletes the room's rows and everything kept about it. Without persist only
+    from memory: the state backend keeps the room.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        clear_room(cur, room)
+        conn.commit()
+    finally:
+        conn.close()
+    if persist:
+        store.touch(room)
+    forget_room(room)
+    checkpoints.forget(room)
+    hub.notify(room)
+
+def expire_room(room):
+    """Removes a room nobody played for a while, see RoomExpiry."""
+    if store.backend.shared:
+        # Only this worker's copy, others may still play the room. A request
+        # for it loads it from the server again.
+        remove_room(room, persist=False)
+        store.backend.forget(room)
+        return
+    remove_room(room)
+    # The log keeps the game for /events and /replay
+    event_log.expire(room)
+
+expiry.remove = expire_room
+
+def forget_room(room):
+    """Drops everything the process remembers about a room besides its rows."""
+    view_cache.invalidate_room(room)
+    replays.clear_room(room)
+    static_content.clear_room(room)
+    state_history.clear_room(room)
+
+# CHECKPOINTS: a whole room in one compact file, see checkpoint.py
+@app.get("/checkpoint")
+async def get_checkpoint(room: str = DEFAULT_ROOM):
+    try:
+        data = checkpoints.snapshot(room)
+    except CheckpointError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(data, media_type="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="{room}.ckpt"'})
+
+def apply_restore(cur, room, data):
+    restore_room(cur, decode(data), clear_room, room)
+
+async def restore_live_room(room, data):
+    """Replaces a running room with an encoded checkpoint, logged as the room's new snapshot."""
+    try:
+        await writer.submit(room, apply_restore, room, data, event=("snapshot", None, data))
+    except CheckpointError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    forget_room(room)
+    checkpoints.mark(room, urgent=True)
+    phase = schedule_timer(room)
+    return {"status": "restored", "room": room, "phase": phase}
+
+def schedule_timer(room):
+    """Schedules the room's timer if a game is running, returns the phase."""
+    conn = get_db_connection()
+    try:
+        game = get_room(conn, room)
+    finally:
+        conn.close()
+    if game['phase'] == 'GAME_RUNNING':
+        scheduler.schedule(room, game['timer_end'])
+    return game['phase']
+
+def reload_room(room):
+    """After a shared backend loaded a newer version of the room, written by another worker."""
+    forget_room(room)
+    hub.notify(room)
+    try:
+        schedule_timer(room)
+    except HTTPException:
+        pass  # Reset over there
+
+def dump_shared_room(conn, room):
+    try:
+        return encode(dump_room(conn, room))
+    except CheckpointError:
+        return None  # Reset
+
+# Shared backends store whole rooms, as checkpoints
+if store.backend.shared:
+    store.backend.dump = dump_shared_room
+    store.backend.restore = apply_restore
+    store.backend.clear = clear_room
+
+@app.post("/restore")
+async def restore_checkpoint(request: Request, room: str = None):
+    # Replaces the room with the uploaded checkpoint, room renames it (e.g. on a new host)
+    data = await request.body()
+    try:
+        checkpoint = decode(data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid checkpoint: {e}")
+    return await restore_live_room(room or checkpoint["room_id"], data)
+
+# EVENT LOG: every mutation of a room, in commit order, see events.py
+def apply_event(cur, event):
+    """Applies one logged event again, for EventLog.replay."""
+    room, kind, payload = event['room_id'], event['kind'], event['payload']
+    if kind == "join":
+        apply_join(cur, room, payload['name'], event['player_id'])
+    elif kind == "control":
+        apply_control(cur, room, event['action'], payload)
+    elif kind == "action":
+        apply_game_action(cur, room, event['player_id'], event['action'], payload)
+    elif kind == "quiz":
+        apply_quiz_answers(cur, room, event['player_id'], payload)
+    elif kind == "timer":
+        apply_timer_end(cur, room, payload['timer_end'])
+    elif kind == "snapshot":
+        apply_restore(cur, room, payload)
+    elif kind == "reset":
+        clear_room(cur, room)
+    # An expire event changes nothing, the room stays as it was
+
+@app.get("/events")
+async def list_events(room: str = DEFAULT_ROOM, since: int = 0, limit: int = 500):
+    # Post-game analysis, a page at a time. Snapshots only show their size.
+    # Reading flushes the log to its file, off the event loop
+    rows = await asyncio.to_thread(event_log.events, room, since, limit=max(1, min(limit, 5000)))
+    events = []
+    for row in rows:
+        event = dict(row)
+        if event['kind'] == "snapshot":
+            event['payload'] = {"bytes": len(event['payload'])}
+        else:
+            event['payload'] = json.loads(event['payload'])
+        events.append(event)
+    return {"room": room, "events": events}
+
+def replay_room(room, seq):
+    """
+    Rows of the room right after event seq, rebuilt from the log. Runs in a
+    thread: reading the log and applying its events take far longer than a
+    request, and the scratch database doesn't share the in-memory connection.
+    """
+    scratch, last = event_log.replay(room, apply_event, seq)
+    try:
+        if not last:
+            raise HTTPException(status_code=404, detail=f"No events for room '{room}'")
+        return dump_room(scratch, room), last
+    except CheckpointError as e:
+        # Reset at that point
+        raise HTTPException(status_code=404, detail=str(e))
+    finally:
+        scratch.close()
+
+@app.get("/replay")
+async def replay_state(room: str = DEFAULT_ROOM, seq: int = None):
+    # Time travel: the room as it was after any event
+    checkpoint, last = await asyncio.to_thread(replay_room, room, seq)
+    return {"room": room, "seq": last, "tables": checkpoint['tables']}
+
+@app.post("/rewind")
+async def rewind_room(room: str = DEFAULT_ROOM, seq: int = None):
+    # Puts the live room back to how it was after event seq
+    checkpoint, last = await asyncio.to_thread(replay_room, room, seq)
+    return {**await restore_live_room(room, encode(checkpoint)), "seq": last}
+
+# PUSH CHANNEL: replaces polling /state, also accepts game actions
+@app.websocket("/ws")
+async def state_socket(websocket: WebSocket, player_id: int, room: str = DEFAULT_ROOM):
+    await websocket.accept()
+    changed = hub.subscribe(room)
+    send_lock = asyncio.Lock()
+
+    async def push_state():
+        last_sent = None
+        last_version = None
+        while True:
+            changed.clear()
+            version = hub.version(room)
+            if version == last_version:
+                await changed.wait()
+                continue
+            last_version = version
+            view = build_game_state(player_id, room)
+            # Only send when this player's view actually differs from what they have
+            if view != last_sent:
+                # After the first full state, only what changed since the last one sent
+                if last_sent is None:
+                    message = {"type": "state", "data": view}
+                else:
+                    message = {"type": "patch", "data": diff(last_sent, view)}
+                async with send_lock:
+                    await websocket.send_text(dumps(message).decode())
+                last_sent = view
+            await changed.wait()
+
+    async def receive_actions():
+        while True:
+            try:
+                msg = await websocket.receive_json()
+                action, payload, key = msg.get('action'), msg.get('payload', {}), msg.get('key')
+            except (ValueError, AttributeError) as e:
+                # Not JSON, or not an object: answer it and keep the socket open
+                async with send_lock:
+                    await websocket.send_text(dumps({"type": "action_result", "error": f"Malformed message: {e}"}).decode())
+                continue
+            labels = metrics.begin(action)
+            start = time.perf_counter()
+            status = 500
+            try:
+                result = await game_action(player_id, action, payload, room, key)
+                status = 200
+                reply = {"type": "action_result", "id": msg.get('id'), "result": result}
+            except HTTPException as e:
+                status = e.status_code
+                reply = {"type": "action_result", "id": msg.get('id'), "error": e.detail}
+            finally:
+                metrics.observe(labels, "/ws", "WS", status, time.perf_counter() - start)
+            async with send_lock:
+                await websocket.send_text(dumps(reply).decode())
+
+    workers = [asyncio.create_task(push_state()), asyncio.create_task(receive_actions())]
+    try:
+        done, _ = await asyncio.wait(workers, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    except HTTPException as e:
+        # Room was reset or never existed
+        await websocket.close(code=4404, reason=str(e.detail))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in workers:
+            task.cancel()
+        hub.unsubscribe(room, changed)
\ No newline at end of file
@@ -0,0 +1,125 @@
+import contextvars
+import threading
+
+# Labels of the request being handled. The endpoint runs with a copy of the
+# middleware's context, so it fills in the same dict the middleware created.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Request metrics for /metrics, in the Prometheus text format.
+
+    - requests and errors per route, method and status
+    - latency per route, action, game and phase (the phase the room was in
+      when the request arrived, so /control shows which transition was slow)
+    - SQL statements per request, counted with the trace callback of the
+      in-memory connection
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}    # (route, method, status) -> int
+        self.errors = {}      # (route, action, status) -> int
+        self.latency = {}     # (route, action, game, phase) -> Histogram
+        self.statements = {}  # (route, action) -> Histogram
+        # Actions come from the query string: only these get series of their
+        # own, the rest are "other". Set by main, None labels every action.
+        self.actions = None
+
+    # --- RECORDING ---
+    def begin(self, action=""):
+        if action and self.actions is not None and action not in self.actions:
+            action = "other"
+        labels = {"action": action or "", "game": "", "phase": "", "statements": 0}
+        current_request.set(labels)
+        return labels
+
+    def label(self, **values):
+        """Fills in labels that are still empty, the first value wins."""
+        labels = current_request.get()
+        if labels is None:
+            return
+        for name, value in values.items():
+            if not labels[name]:
+                labels[name] = value
+
+    def count_statement(self, sql):
+        labels = current_request.get()
+        if labels is not None:
+            labels["statements"] += 1
+
+    def watch(self, conn):
+        conn.set_trace_callback(self.count_statement)
+
+    def observe(self, labels, route, method, status, seconds):
+        action = labels["action"]
+        with self.lock:
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if status >= 400:
+                key = (route, action, str(status))
+                self.errors[key] = self.errors.get(key, 0) + 1
+            key = (route, action, labels["game"], labels["phase"])
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.statements.setdefault((route, action), Histogram(STATEMENT_BUCKETS)).observe(labels["statements"])
+
+    # --- EXPOSITION ---
+    def render(self):
+        with self.lock:
+            lines = []
+            counter(lines, "mole_requests_total", "Requests handled.",
+                    ("route", "method", "status"), self.requests)
+            counter(lines, "mole_request_errors_total", "Requests answered with a 4xx or 5xx status.",
+                    ("route", "action", "status"), self.errors)
+            histogram(lines, "mole_request_duration_seconds", "Time spent handling a request.",
+                      ("route", "action", "game", "phase"), self.latency)
+            histogram(lines, "mole_request_sql_statements", "SQL statements run by a request.",
+                      ("route", "action"), self.statements)
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def counter(lines, name, help_text, names, values):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for key, value in sorted(values.items()):
+        lines.append(f"{name}{format_labels(names, key)} {value}")
+
+
+def histogram(lines, name, help_text, names, values):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, hist in sorted(values.items()):
+        for bound, count in zip(hist.buckets, hist.counts):
+            lines.append(f"{name}_bucket{format_labels(names, key, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{format_labels(names, key, [('le', '+Inf')])} {hist.count}")
+        lines.append(f"{name}_sum{format_labels(names, key)} {round(hist.sum, 6)}")
+        lines.append(f"{name}_count{format_labels(names, key)} {hist.count}")
+
+
+metrics = Metrics()
@@ -0,0 +1,127 @@
+"""
+Versioned schema of the game database.
+
+The schema used to be dropped and recreated on every import of main, which
+wiped every live room on a reload or a worker start. Now each change is a
+numbered migration that runs once: schema_migrations records the applied
+versions and lives in the database file next to the rooms, so a restart only
+checks one table and reattaches to whatever was running.
+
+Migrations are additive (new tables, columns and indexes) and must be safe to
+run again. A database written before this module existed has no
+schema_migrations yet: the baseline rebuilds its tables, the old code did that
+on every start anyway, so none of their rows outlived a restart. To change the
+schema append a migration, never edit an applied one.
+"""
+import time
+
+from games import tasks
+from games.registry import GAME_LIST
+
+
+def add_column(cur, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN, unless the column is already there."""
+    columns = [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# Every table the code before migrations dropped or recreated on start, including
+# ones no game uses anymore. Their old layouts (no room_id, players.name UNIQUE)
+# can't be migrated and hold nothing worth keeping.
+LEGACY_TABLES = ["game_state", "players", "quiz_answers", "score_history",
+                 "whoami_state", "chess_state", "risk_state", "player_tasks"]
+
+
+def create_baseline(cur):
+    for table in LEGACY_TABLES:
+        cur.execute(f"DROP TABLE IF EXISTS {table}")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS game_state (
+            room_id TEXT PRIMARY KEY,
+            phase TEXT DEFAULT 'LOBBY',
+            current_game_idx INTEGER DEFAULT 0,
+            dynamic_secret TEXT DEFAULT '{}',
+            timer_end REAL DEFAULT 0,
+            quiz_questions TEXT DEFAULT '[]',
+            used_questions TEXT DEFAULT '[]'
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS players (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_id TEXT,
+            name TEXT,
+            score INTEGER DEFAULT 0,
+            is_mole BOOLEAN DEFAULT 0,
+            is_vip BOOLEAN DEFAULT 0,
+            has_finished_quiz BOOLEAN DEFAULT 0,
+            UNIQUE (room_id, name)
+        )
+    """)
+    cur.execute("CREATE TABLE IF NOT EXISTS quiz_answers (room_id TEXT, player_id INTEGER, question_id INTEGER, answer TEXT)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS score_history (
+            room_id TEXT,
+            round_idx REAL,  -- Changed to REAL for decimals (0.5, 1.0)
+            player_id INTEGER,
+            score INTEGER
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_quiz_answers_room ON quiz_answers (room_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_quiz_answers_player ON quiz_answers (player_id, question_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_score_history_round ON score_history (room_id, round_idx)")
+
+    # Tasks shared by the games, then game specific setups
+    tasks.setup_db(cur)
+    for game in GAME_LIST:
+        game.setup_db(cur)
+
+
+def add_lobby_tables(cur):
+    # Large lobbies, see games/tables.py
+    add_column(cur, "game_state", "table_count", "INTEGER DEFAULT 1")
+    add_column(cur, "players", "table_idx", "INTEGER DEFAULT 0")  # dealt at start_game
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_players_table ON players (room_id, table_idx)")
+
+
+# (version, name, apply), in order
+MIGRATIONS = [
+    (1, "baseline schema", create_baseline),
+    (2, "large-lobby tables", add_lobby_tables),
+]
+
+
+def schema_version(cur):
+    return cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Applies the migrations the database doesn't have yet, each in its own
+    transaction. Returns the list of versions applied.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at REAL
+        )
+    """)
+    current = schema_version(cur)
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        cur.execute("BEGIN")
+        try:
+            apply(cur)
+            cur.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                        (version, name, time.time()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
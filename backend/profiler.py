@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import sys
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SKIP_FILES = {os.path.join(BACKEND_DIR, "database.py"), os.path.abspath(__file__)}
+
+SORT_KEYS = ("total_ms", "calls", "max_ms", "rows", "max_per_borrow")
+
+# A statement run this often from one place in one borrow of the connection (or
+# one command of a RoomWriter batch) is reported as an N+1 pattern
+N_PLUS_ONE = 5
+
+
+def normalize(sql):
+    return " ".join(sql.split())
+
+
+def caller():
+    """file:function of the backend code that ran the statement."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(BACKEND_DIR) and filename not in SKIP_FILES:
+            return f"{os.path.relpath(filename, BACKEND_DIR)}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class QueryProfiler:
+    """
+    Per-statement statistics of everything run on the in-memory connection,
+    enabled with GAME_PROFILE=1.
+
+    Recording is a dict update per statement. The plans are only looked up
+    with EXPLAIN QUERY PLAN when report() is called, so it's fine to leave on
+    during a real game.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}     # (sql, caller) -> dict
+        self.borrow = {}    # (sql, caller) -> executions in the current borrow
+
+    def record(self, sql, params, seconds, rows, executions=1):
+        key = (normalize(sql), caller())
+        with self.lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = {
+                    "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+                    "max_per_borrow": 0, "n_plus_one_borrows": 0, "params": params,
+                }
+            entry["calls"] += executions
+            entry["total_ms"] += seconds * 1000
+            entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+            entry["rows"] += max(rows, 0)
+            # An executemany is one round trip, not an N+1
+            self.borrow[key] = self.borrow.get(key, 0) + 1
+        return key
+
+    def add_rows(self, key, rows):
+        with self.lock:
+            self.stats[key]["rows"] += rows
+
+    def end_borrow(self):
+        """
+        Closes the N+1 window: called when the connection is given back, and by
+        the RoomWriter after each command of a batch.
+        """
+        with self.lock:
+            for key, count in self.borrow.items():
+                entry = self.stats[key]
+                entry["max_per_borrow"] = max(entry["max_per_borrow"], count)
+                if count >= N_PLUS_ONE:
+                    entry["n_plus_one_borrows"] += 1
+            self.borrow = {}
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+            self.borrow = {}
+
+    def report(self, conn, top=20, sort="total_ms"):
+        """The top statements by `sort`, with their plan and what looks wrong."""
+        with self.lock:
+            items = sorted(self.stats.items(), key=lambda item: item[1][sort], reverse=True)[:top]
+            items = [(key, dict(entry)) for key, entry in items]
+
+        rows = []
+        for (sql, where), entry in items:
+            plan = explain(conn, sql, entry.pop("params"))
+            flags = []
+            if entry["n_plus_one_borrows"]:
+                flags.append("n+1")
+            if full_scans(plan):
+                flags.append("full scan")
+            entry["total_ms"] = round(entry["total_ms"], 3)
+            entry["max_ms"] = round(entry["max_ms"], 3)
+            entry["avg_ms"] = round(entry["total_ms"] / entry["calls"], 4)
+            rows.append({"sql": sql, "caller": where, **entry, "plan": plan, "flags": flags})
+        return rows
+
+
+def explain(conn, sql, params):
+    try:
+        # A plain cursor, so the EXPLAIN itself is not profiled
+        return [row[3] for row in conn.cursor(sqlite3.Cursor).execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    except Exception as e:
+        return [f"unavailable: {e}"]
+
+
+def full_scans(plan):
+    """Tables read from start to end. json_each and materialized subqueries don't count."""
+    subqueries = {step.split()[-1] for step in plan if step.startswith(("MATERIALIZE", "CO-ROUTINE"))}
+    return [
+        step for step in plan
+        if step.startswith("SCAN ")
+        and "VIRTUAL TABLE" not in step
+        and "CONSTANT ROW" not in step
+        and step.split()[1] not in subqueries
+    ]
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import uuid
+
+# Versions only live in memory, so tags from before a restart must never match
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+class RoomHub:
+    """
+    Keeps track of the state version and the open WebSockets per room.
+    Write endpoints call notify(room_id) after they commit, which bumps the version
+    and wakes every socket of that room so it can re-render its player's view.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.rooms = {}  # room_id -> set of asyncio.Event (one per socket)
+        self.versions = {}  # room_id -> int, increases on every committed write
+        self.lock = threading.Lock()
+
+    def version(self, room_id):
+        return self.versions.get(room_id, 0)
+
+    def etag(self, room_id, player_id):
+        return f'"{BOOT_ID}-{self.version(room_id)}-{player_id}"'
+
+    def subscribe(self, room_id):
+        # Sockets live on the event loop, notify() may still come from other threads
+        self.loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        with self.lock:
+            self.rooms.setdefault(room_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, room_id, event):
+        with self.lock:
+            listeners = self.rooms.get(room_id)
+            if listeners is None:
+                return
+            listeners.discard(event)
+            if not listeners:
+                del self.rooms[room_id]
+
+    def notify(self, room_id):
+        """Safe to call from any thread."""
+        with self.lock:
+            self.versions[room_id] = self.versions.get(room_id, 0) + 1
+            listeners = list(self.rooms.get(room_id, ()))
+        if not listeners or self.loop is None or self.loop.is_closed():
+            return
+        for event in listeners:
+            self.loop.call_soon_threadsafe(event.set)
+
+
+hub = RoomHub()
@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+
+from checkpoint import checkpoints
+from database import get_db_connection, store
+from events import event_log, run_command, stamp
+from realtime import hub
+from view_cache import view_cache
+
+# Commands applied in one transaction at most, so a flood can't starve a batch
+MAX_BATCH = 64
+
+
+class RoomWriter:
+    """
+    One writer per room: a task on the event loop that applies every mutation
+    of that room (controls, game actions, quiz answers) in arrival order.
+
+    Commands queued while a batch is running are applied together in the next
+    one, each in its own savepoint so a failing command only undoes itself, and
+    committed in a single transaction. Callers get the result, or the
+    exception, of their own command once the batch is committed.
+
+    The task stops as soon as its queue is empty, idle rooms cost nothing.
+    """
+
+    def __init__(self):
+        self.queues = {}  # room_id -> asyncio.Queue of (command, args, player_id, event, context, future)
+        self.tasks = set()  # running writers, the loop only keeps weak references
+
+    async def submit(self, room_id, command, *args, player_id=None, event=None):
+        """
+        Runs command(cur, *args) in the room's next batch.
+        Commands with a player_id only invalidate that player's cached view,
+        the others invalidate the whole room.
+        event: (kind, action, payload) to log once the command is committed, see
+        EventLog. The command then gets a seeded random and events.now().
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.get(room_id)
+        if queue is None:
+            queue = self.queues[room_id] = asyncio.Queue()
+            task = asyncio.create_task(self.run(room_id, queue))
+            self.tasks.add(task)
+            task.add_done_callback(lambda t: self.stopped(room_id, queue, t))
+        # The caller's context, so metrics labels and statement counts land on its request
+        queue.put_nowait((command, args, player_id, event, contextvars.copy_context(), future))
+        return await future
+
+    async def run(self, room_id, queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < MAX_BATCH and not queue.empty():
+                batch.append(queue.get_nowait())
+            self.apply(room_id, batch)
+            # Give the callers and readers a turn before the next batch
+            await asyncio.sleep(0)
+            if queue.empty():
+                del self.queues[room_id]
+                return
+
+    def stopped(self, room_id, queue, task):
+        self.tasks.discard(task)
+        if task.cancelled() or not task.exception():
+            return
+        print(f"Room Writer Error ({room_id}): {task.exception()}")
+        # The next command starts a new writer, the ones still queued would wait forever
+        if self.queues.get(room_id) is queue:
+            del self.queues[room_id]
+        while not queue.empty():
+            future = queue.get_nowait()[-1]
+            if not future.done():
+                future.set_exception(task.exception())
+
+    def apply(self, room_id, batch):
+        outcomes = []
+        conn = get_db_connection()
+        try:
+            conn.execute("BEGIN")
+            for command, args, player_id, event, context, future in batch:
+                mark = conn.savepoint()
+                try:
+                    logged = None
+                    if event:
+                        seed, at = stamp()
+                        result = context.run(run_command, seed, at, command, conn.cursor(), *args)
+                        logged = (*event, player_id, seed, at)
+                    else:
+                        result = context.run(command, conn.cursor(), *args)
+                    conn.release_savepoint()
+                    outcomes.append((future, result, None, player_id, logged))
+                except Exception as e:
+                    conn.rollback_savepoint(mark)
+                    outcomes.append((future, None, e, player_id, None))
+                finally:
+                    # Every command is a request of its own, not a loop of the batch
+                    if store.profiler:
+                        store.profiler.end_borrow()
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            outcomes = [(future, None, e, player_id, None) for _, _, player_id, _, _, future in batch]
+        finally:
+            conn.close()
+
+        # In commit order, failed commands changed nothing
+        for _, _, error, _, logged in outcomes:
+            if logged:
+                kind, action, payload, player_id, seed, at = logged
+                event_log.append(room_id, kind, action, player_id, payload, seed, at)
+
+        applied = [player_id for _, _, error, player_id, _ in outcomes if error is None]
+        if applied:
+            if None in applied:
+                view_cache.invalidate_room(room_id)
+            else:
+                for player_id in set(applied):
+                    view_cache.invalidate_player(room_id, player_id)
+            store.touch(room_id)
+            hub.notify(room_id)
+            checkpoints.mark(room_id)
+
+        for future, result, error, _, _ in outcomes:
+            if future.cancelled():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+writer = RoomWriter()
@@ -0,0 +1,55 @@
+import asyncio
+import heapq
+import time
+
+
+class PhaseScheduler:
+    """
+    Ends running games when their timer_end passes, for every room.
+
+    Deadlines sit in one heap (O(log n) to add), watched by a single task that
+    sleeps until the earliest one. An expired deadline is handed to `expire`,
+    which has to check the room is still running that same timer: restarted
+    or ended timers are never removed from the heap, just ignored.
+    """
+
+    def __init__(self):
+        self.heap = []       # (timer_end, room_id)
+        self.expire = None   # async callable(room_id, timer_end)
+        self.task = None
+        self.wakeup = None
+        self.firing = set()  # expire tasks still running, the loop only keeps weak references
+
+    def schedule(self, room_id, timer_end):
+        """Call on the event loop. Starts the watcher on first use."""
+        heapq.heappush(self.heap, (timer_end, room_id))
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        elif self.heap[0] == (timer_end, room_id):
+            # New earliest deadline, the watcher is sleeping for a later one
+            self.wakeup.set()
+
+    async def run(self):
+        while self.heap:
+            timer_end, room_id = self.heap[0]
+            delay = timer_end - time.time()
+            if delay > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.heap)
+            task = asyncio.create_task(self.expire(room_id, timer_end))
+            self.firing.add(task)
+            task.add_done_callback(lambda t: self.fired(room_id, t))
+
+    def fired(self, room_id, task):
+        self.firing.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Timer Error ({room_id}): {task.exception()}")
+
+
+scheduler = PhaseScheduler()
@@ -0,0 +1,78 @@
+import gzip
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+try:
+    import msgpack
+except ImportError:  # Optional, clients that ask for it get JSON
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is offered instead
+    brotli = None
+
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+
+# Smaller bodies go out as they are, compressing them saves less than it costs
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 3  # As fast as gzip at level 6 on our bodies and smaller, 11 is for static files
+
+
+def dumps(content):
+    """JSON bytes, straight from dicts and lists (no jsonable_encoder pass)."""
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, the app's default response class."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def pack(content):
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def accepts(header, value):
+    """Whether a comma separated Accept(-Encoding) header lists value, ignoring q=0."""
+    for item in (header or "").split(","):
+        token, *params = [part.strip() for part in item.split(";")]
+        if token.lower() == value and "q=0" not in params:
+            return True
+    return False
+
+
+def compress(body, coding):
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def negotiated_response(request, content, status_code=200, headers=None):
+    """
+    Response for content in the encoding the client asked for: MessagePack when
+    Accept lists it (and msgpack is installed), JSON otherwise. Bodies of
+    MIN_COMPRESS_SIZE and up are compressed with brotli or gzip, whichever
+    Accept-Encoding allows, brotli first.
+    """
+    accept = request.headers.get("accept")
+    if msgpack is not None and any(accepts(accept, media_type) for media_type in MSGPACK_TYPES):
+        media_type, body = MSGPACK, pack(content)
+    else:
+        media_type, body = "application/json", dumps(content)
+
+    headers = {**(headers or {}), "Vary": "Accept, Accept-Encoding"}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        accept_encoding = request.headers.get("accept-encoding")
+        codings = ("br", "gzip") if brotli is not None else ("gzip",)
+        coding = next((c for c in codings if accepts(accept_encoding, c)), None)
+        if coding:
+            body = compress(body, coding)
+            headers["Content-Encoding"] = coding
+    return Response(body, status_code=status_code, headers=headers, media_type=media_type)
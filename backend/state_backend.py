@@ -0,0 +1,281 @@
+"""
+Where the game state lives outside the process.
+
+Requests and game hooks always work on the in-memory SQLite database of
+database.MemoryStore, set-based SQL is what keeps scoring and views fast. The
+state backend is what that database is loaded from and written behind to:
+
+    sqlite   the GAME_DB file, committed statements replayed into it (default)
+    memory   nothing, state ends with the process (no room checkpoints
+             either). For tests and benchmarks
+    redis    a Redis server (or anything speaking its protocol): one key per
+             room with its checkpoint and a version counter, shared by every
+             worker and host pointed at it
+
+Pick one with GAME_BACKEND=sqlite|memory|redis://host:port[/prefix].
+
+With redis, rooms are loaded when a request for them comes in, and reloaded when
+another worker wrote a newer version. Writes are a check-and-set on the room's
+version: when another worker wrote the room since this one loaded it, theirs
+is kept and this worker reloads the room on its next request, dropping its own
+writes. Route each room to one worker at a time (e.g. by its room parameter) to
+keep that rare; rooms can move freely between workers and hosts.
+"""
+import socket
+import sqlite3
+import threading
+from urllib.parse import urlparse
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",   # WAL only needs to fsync on checkpoints
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -8000",     # 8 MB page cache per connection
+    "PRAGMA temp_store = MEMORY",
+]
+
+
+class SQLiteBackend:
+    """The database file, kept in sync with memory by replaying committed statements."""
+    name = "sqlite"
+    shared = False
+    durable = True
+
+    def __init__(self, path):
+        self.path = path
+        self.disk = None
+
+    def load(self, conn):
+        self.disk = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in PRAGMAS:
+            self.disk.execute(pragma)
+        self.disk.backup(conn)
+
+    def persist(self, store, batch, rooms):
+        # One transaction (and one fsync) per batch
+        try:
+            self.disk.execute("BEGIN")
+            for sql, seq_of_params in batch:
+                if len(seq_of_params) == 1:
+                    self.disk.execute(sql, seq_of_params[0])
+                else:
+                    self.disk.executemany(sql, seq_of_params)
+            self.disk.execute("COMMIT")
+        except sqlite3.Error:
+            if self.disk.in_transaction:
+                self.disk.execute("ROLLBACK")
+            raise
+
+    def refresh(self, store, room_id):
+        return False
+
+    def new_player_id(self):
+        return None  # AUTOINCREMENT
+
+
+class MemoryBackend:
+    """Keeps nothing: the in-memory database is all there is."""
+    name = "memory"
+    shared = False
+    durable = False
+
+    def load(self, conn):
+        pass
+
+    def persist(self, store, batch, rooms):
+        pass
+
+    def refresh(self, store, room_id):
+        return False
+
+    def new_player_id(self):
+        return None  # AUTOINCREMENT
+
+
+class RedisError(Exception):
+    pass
+
+
+class RespClient:
+    """
+    Just enough of the Redis protocol (RESP2) for RedisBackend: commands and
+    pipelines over one socket, reconnecting after errors. Thread-safe.
+    """
+
+    def __init__(self, host, port, timeout=5.0):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.lock = threading.RLock()  # Hold it across pipelines to keep a WATCH to yourself
+        self.sock = None
+        self.reader = None
+
+    def connect(self):
+        self.sock = socket.create_connection(self.address, self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+        self.sock = self.reader = None
+
+    @staticmethod
+    def encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else self.reader.read(size + 2)[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self.read_reply() for _ in range(size)]
+        raise ConnectionError(f"Bad reply {line!r}")
+
+    def pipeline(self, commands):
+        """Sends every command in one write and returns their replies, in order."""
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self.connect()
+                self.sock.sendall(b"".join(self.encode(args) for args in commands))
+                replies = [self.read_reply() for _ in commands]
+            except (OSError, ConnectionError):
+                self.close()
+                raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def call(self, *args):
+        return self.pipeline([args])[0]
+
+
+class RedisBackend:
+    """
+    Every room as one key holding its checkpoint (see checkpoint.py) next to a
+    version counter. Rooms written since the last flush are sent in one
+    transaction, WATCHing their versions: a room is only written when the
+    server still has the version this worker loaded.
+
+    main sets dump, restore and clear: this module can't import the app.
+    """
+    name = "redis"
+    shared = True
+    durable = True
+
+    def __init__(self, host, port, prefix="mole:"):
+        self.client = RespClient(host, port)
+        self.prefix = prefix
+        self.seen = {}      # room_id -> version this worker has in memory
+        self.dump = None    # callable(conn, room_id) -> checkpoint bytes, None when the room is gone
+        self.restore = None  # callable(cur, room_id, checkpoint bytes)
+        self.clear = None   # callable(cur, room_id)
+
+    def room_key(self, room_id):
+        return f"{self.prefix}room:{room_id}"
+
+    def version_key(self, room_id):
+        return f"{self.prefix}version:{room_id}"
+
+    def load(self, conn):
+        # Rooms are loaded on their first request, see refresh
+        self.client.call("PING")
+
+    def persist(self, store, batch, rooms):
+        if not rooms:
+            return
+        rooms = sorted(rooms)
+        conn = store.acquire()
+        try:
+            data = [self.dump(conn, room_id) for room_id in rooms]
+        finally:
+            store.release()
+        keys = [self.version_key(room_id) for room_id in rooms]
+        with self.client.lock:
+            versions = self.client.pipeline([("WATCH", *keys)] + [("GET", key) for key in keys])[1:]
+            commands, written = [("MULTI",)], []
+            for room_id, checkpoint, version in zip(rooms, data, versions):
+                if int(version or 0) != self.seen.get(room_id, 0):
+                    self.conflict(room_id, int(version or 0))
+                    continue
+                if checkpoint is None:
+                    commands.append(("DEL", self.room_key(room_id)))
+                else:
+                    commands.append(("SET", self.room_key(room_id), checkpoint))
+                commands.append(("INCR", self.version_key(room_id)))
+                written.append(room_id)
+            if not written:
+                self.client.call("UNWATCH")
+                return
+            replies = self.client.pipeline(commands + [("EXEC",)])[-1]
+        if replies is None:
+            # One of the rooms was written between WATCH and EXEC, nothing was.
+            # The store keeps the rooms, the next flush checks them again.
+            raise RedisError("Rooms changed on the server during the write, retrying")
+        for room_id, version in zip(written, replies[1::2]):
+            self.seen[room_id] = version
+
+    def conflict(self, room_id, version):
+        # Another worker wrote the room since this one loaded it: theirs wins,
+        # refresh reloads it on the next request for the room
+        print(f"Redis Conflict ({room_id}): server has version {version}, "
+              f"this worker {self.seen.get(room_id, 0)}, reloading")
+        self.seen[room_id] = -1
+
+    def forget(self, room_id):
+        """This worker dropped its copy of the room, the next refresh loads it again."""
+        self.seen.pop(room_id, None)
+
+    def new_player_id(self):
+        # Player ids are unique across every worker sharing the server
+        return self.client.call("INCR", f"{self.prefix}player_id")
+
+    def refresh(self, store, room_id):
+        """Loads the room when the server has a newer version than memory. True when it did."""
+        version = int(self.client.call("GET", self.version_key(room_id)) or 0)
+        if version <= self.seen.get(room_id, 0):
+            return False
+        checkpoint = self.client.call("GET", self.room_key(room_id))
+        conn = store.acquire()
+        try:
+            conn.execute("BEGIN")
+            if checkpoint is None:
+                self.clear(conn.cursor(), room_id)
+            else:
+                self.restore(conn.cursor(), room_id, checkpoint)
+            conn.commit()
+        finally:
+            store.release()
+        self.seen[room_id] = version
+        return True
+
+
+def make_backend(spec, db_name):
+    """Backend for a GAME_BACKEND value."""
+    if spec in ("", "sqlite"):
+        return SQLiteBackend(db_name)
+    if spec == "memory":
+        return MemoryBackend()
+    url = urlparse(spec)
+    if url.scheme == "redis":
+        prefix = url.path.strip("/")
+        return RedisBackend(url.hostname or "localhost", url.port or 6379, f"{prefix}:" if prefix else "mole:")
+    raise ValueError(f"Unknown GAME_BACKEND '{spec}', use sqlite, memory or redis://host:port")
@@ -0,0 +1,54 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# Round-static content kept per room, oldest dropped first. A round needs up to
+# three entries per table (the mole and innocent texts, a word list), so this
+# spans a few rounds even at 20+ tables.
+MAX_PER_ROOM = 256
+
+# Sent with content that can never change under its hash
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def content_hash(content):
+    """Stable hash of any JSON-serializable value, used as its name and ETag."""
+    data = json.dumps(content, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class StaticContent:
+    """
+    Content that stays the same for a whole round (secret texts, Dictionary
+    Dudes' word list), served once from /static/{hash} and referenced by hash
+    from every /state after that.
+
+    The hash is also what makes the mole's text safe to serve without a
+    player check: it can't be requested without knowing the content.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rooms = {}  # room_id -> OrderedDict(hash -> content)
+
+    def put(self, room_id, content):
+        ref = content_hash(content)
+        with self.lock:
+            entries = self.rooms.setdefault(room_id, OrderedDict())
+            entries[ref] = content
+            entries.move_to_end(ref)
+            while len(entries) > MAX_PER_ROOM:
+                entries.popitem(last=False)
+        return ref
+
+    def get(self, room_id, ref):
+        with self.lock:
+            return self.rooms.get(room_id, {}).get(ref)
+
+    def clear_room(self, room_id):
+        with self.lock:
+            self.rooms.pop(room_id, None)
+
+
+static_content = StaticContent()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Tests import the backend's modules the way main does, from backend/
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+# Importing database starts the global store, keep it off the game.db file
+os.environ.setdefault("GAME_BACKEND", "memory")
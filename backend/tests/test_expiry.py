@@ -0,0 +1,55 @@
+"""Expired rooms are removed, their history stays in the event log, see expiry.py."""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+EXPIRE = """
+import json
+import time
+from fastapi.testclient import TestClient
+import main
+
+with TestClient(main.app) as client:
+    for name in ("alice", "bob"):
+        client.post("/join", params={"name": name, "room": "r"}).raise_for_status()
+    client.post("/control", params={"action": "start_game", "room": "r"}).raise_for_status()
+    before = client.get("/replay", params={"room": "r"}).json()
+
+    # Nobody played the room for a day
+    main.event_log.last_active["r"] = time.time() - 24 * 3600
+    main.expiry.sweep()
+
+    result = {
+        "state": client.get("/state", params={"player_id": 1, "room": "r"}).status_code,
+        "stats": client.get("/cache_stats").json()["expiry"],
+        "events": [e["kind"] for e in client.get("/events", params={"room": "r"}).json()["events"]],
+        "before": before,
+        "after": client.get("/replay", params={"room": "r"}).json(),
+    }
+
+    # A new game under the same name doesn't replay the old one
+    client.post("/join", params={"name": "carol", "room": "r"}).raise_for_status()
+    result["again"] = client.get("/replay", params={"room": "r"}).json()
+    print(json.dumps(result))
+"""
+
+
+def test_expired_room_keeps_its_events(tmp_path):
+    env = {**os.environ, "GAME_DB": str(tmp_path / "game.db"), "GAME_BACKEND": "sqlite"}
+    result = subprocess.run([sys.executable, "-c", EXPIRE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    out = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert out["state"] == 404
+    assert out["stats"]["expired"] == 1
+    assert out["events"] == ["join", "join", "control", "expire"]
+    # The room replays as it was when it expired
+    assert out["after"]["tables"] == out["before"]["tables"]
+    assert out["after"]["seq"] == out["before"]["seq"] + 1
+    players = out["again"]["tables"]["players"]
+    names = [dict(zip(players["columns"], row))["name"] for row in players["rows"]]
+    assert names == ["carol"]
@@ -0,0 +1,72 @@
+"""The app starts on databases written by older versions, see migrations.py."""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+# The schema from before rooms, as the tracked game.db still has it
+LEGACY_SCHEMA = """
+CREATE TABLE game_state (id INTEGER PRIMARY KEY, phase TEXT DEFAULT 'LOBBY', current_game_idx INTEGER DEFAULT 0,
+                         dynamic_secret TEXT DEFAULT '{}', timer_end REAL DEFAULT 0,
+                         quiz_questions TEXT DEFAULT '[]', used_questions TEXT DEFAULT '[]');
+CREATE TABLE players (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, score INTEGER DEFAULT 0,
+                      is_mole BOOLEAN DEFAULT 0, is_vip BOOLEAN DEFAULT 0, has_finished_quiz BOOLEAN DEFAULT 0);
+CREATE TABLE quiz_answers (player_id INTEGER, question_id INTEGER, answer TEXT);
+CREATE TABLE score_history (round_idx REAL, player_id INTEGER, score INTEGER);
+CREATE TABLE whoami_state (player_id INTEGER PRIMARY KEY, character TEXT, easy_task TEXT, hard_task TEXT,
+                           easy_complete BOOLEAN DEFAULT 0, hard_complete BOOLEAN DEFAULT 0,
+                           questions_asked INTEGER DEFAULT 0, wrong_guesses INTEGER DEFAULT 0,
+                           is_solved BOOLEAN DEFAULT 0, points_earned INTEGER DEFAULT 0);
+CREATE TABLE chess_state (player_id INTEGER PRIMARY KEY, group_tasks TEXT, indiv_tasks TEXT, group_complete TEXT,
+                          indiv_complete TEXT, moves_made INTEGER DEFAULT 0, game_won BOOLEAN DEFAULT 0);
+CREATE TABLE risk_state (player_id INTEGER PRIMARY KEY, tasks TEXT, complete TEXT);
+INSERT INTO game_state (id, phase) VALUES (1, 'QUIZ');
+INSERT INTO players (name, is_vip) VALUES ('old', 1);
+"""
+
+START = """
+import json
+from fastapi.testclient import TestClient
+import main
+
+with TestClient(main.app) as client:
+    player_id = client.post("/join", params={"name": "alice", "room": "r"}).json()["player_id"]
+    state = client.get("/state", params={"player_id": player_id, "room": "r"})
+    state.raise_for_status()
+    print(json.dumps(state.json()))
+"""
+
+
+def start_app(db_path):
+    env = {**os.environ, "GAME_DB": db_path, "GAME_BACKEND": "sqlite"}
+    return subprocess.run([sys.executable, "-c", START], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+
+def test_starts_on_pre_room_database(tmp_path):
+    db_path = str(tmp_path / "game.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+
+    result = start_app(db_path)
+    assert result.returncode == 0, result.stderr
+    state = json.loads(result.stdout.strip().splitlines()[-1])
+    assert state["phase"] == "LOBBY"
+    assert [p["name"] for p in state["players"]] == ["alice"]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert [r[0] for r in conn.execute("SELECT version FROM schema_migrations ORDER BY version")] == [1, 2]
+        assert not conn.execute("SELECT name FROM sqlite_master WHERE name = 'risk_state'").fetchone()
+    finally:
+        conn.close()
+
+    # And again on the migrated file, the room is still there
+    result = start_app(db_path)
+    assert result.returncode == 0, result.stderr
+    state = json.loads(result.stdout.strip().splitlines()[-1])
+    assert [p["name"] for p in state["players"]] == ["alice"]
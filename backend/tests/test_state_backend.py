@@ -0,0 +1,160 @@
+"""RespClient and RedisBackend against the stand-in server of bench/resp_server.py."""
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from database import MemoryStore
+from resp_server import RespServer
+from state_backend import RedisBackend, RedisError, RespClient, make_backend
+
+
+@pytest.fixture(scope="module")
+def stand_in():
+    # On an event loop thread of its own for the whole module, like bench/backends.py
+    loop = asyncio.new_event_loop()
+    stand_in = RespServer()
+    port = loop.run_until_complete(stand_in.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return stand_in, port
+
+
+@pytest.fixture
+def server(stand_in):
+    server, port = stand_in
+    RespClient("127.0.0.1", port).call("FLUSHALL")
+    return server, port
+
+
+def worker(port):
+    """A worker's store on the shared server. Rooms are one row of a notes table."""
+    backend = make_backend(f"redis://127.0.0.1:{port}/test", None)
+    store = MemoryStore(backend)
+    store.conn.execute("CREATE TABLE notes (room_id TEXT PRIMARY KEY, text TEXT)")
+    backend.load(store.conn)
+
+    def dump(conn, room_id):
+        row = conn.execute("SELECT text FROM notes WHERE room_id = ?", (room_id,)).fetchone()
+        return row["text"].encode() if row else None
+
+    backend.dump = dump
+    backend.restore = lambda cur, room_id, data: cur.execute(
+        "INSERT OR REPLACE INTO notes (room_id, text) VALUES (?, ?)", (room_id, data.decode()))
+    backend.clear = lambda cur, room_id: cur.execute("DELETE FROM notes WHERE room_id = ?", (room_id,))
+    return store
+
+
+def write(store, room_id, text):
+    store.conn.execute("INSERT OR REPLACE INTO notes (room_id, text) VALUES (?, ?)", (room_id, text))
+    store.touch(room_id)
+
+
+def read(store, room_id):
+    row = store.conn.execute("SELECT text FROM notes WHERE room_id = ?", (room_id,)).fetchone()
+    return row["text"] if row else None
+
+
+def test_client_commands(server):
+    _, port = server
+    client = RespClient("127.0.0.1", port)
+    assert client.call("PING") == "PONG"
+    assert client.call("GET", "missing") is None
+    assert client.pipeline([("SET", "k", b"\x00bytes\r\n"), ("GET", "k"), ("INCR", "n"), ("INCR", "n")]) == \
+        ["OK", b"\x00bytes\r\n", 1, 2]
+    assert client.call("DEL", "k", "n") == 2
+    with pytest.raises(RedisError):
+        client.call("NOPE")
+    # The connection is still usable after an error reply
+    assert client.call("PING") == "PONG"
+
+
+def test_client_reconnects(server):
+    _, port = server
+    client = RespClient("127.0.0.1", port)
+    client.call("SET", "k", "v")
+    # The connection drops: that call fails, the next one connects again
+    client.sock.shutdown(socket.SHUT_RDWR)
+    with pytest.raises(OSError):
+        client.call("GET", "k")
+    assert client.call("GET", "k") == b"v"
+
+
+def test_transaction_aborts_when_a_watched_key_changes(server):
+    _, port = server
+    first, second = RespClient("127.0.0.1", port), RespClient("127.0.0.1", port)
+    first.call("WATCH", "k")
+    second.call("SET", "k", "theirs")
+    assert first.pipeline([("MULTI",), ("SET", "k", "mine"), ("EXEC",)]) == ["OK", "QUEUED", None]
+    assert first.call("GET", "k") == b"theirs"
+
+    first.call("WATCH", "k")
+    assert first.pipeline([("MULTI",), ("SET", "k", "mine"), ("EXEC",)])[-1] == ["OK"]
+    assert second.call("GET", "k") == b"mine"
+
+
+def test_rooms_move_between_workers(server):
+    _, port = server
+    a, b = worker(port), worker(port)
+    write(a, "r1", "from a")
+    a.flush()
+
+    assert b.refresh("r1") is True
+    assert read(b, "r1") == "from a"
+    assert b.refresh("r1") is False
+
+    write(b, "r1", "from b")
+    b.flush()
+    assert a.refresh("r1") is True
+    assert read(a, "r1") == "from b"
+
+
+def test_reset_room_is_cleared_on_other_workers(server):
+    _, port = server
+    a, b = worker(port), worker(port)
+    write(a, "r1", "from a")
+    a.flush()
+    b.refresh("r1")
+
+    a.conn.execute("DELETE FROM notes WHERE room_id = 'r1'")
+    a.touch("r1")
+    a.flush()
+    assert b.refresh("r1") is True
+    assert read(b, "r1") is None
+
+
+def test_concurrent_write_does_not_overwrite(server, capsys):
+    stand_in, port = server
+    a, b = worker(port), worker(port)
+    write(a, "r1", "v1")
+    a.flush()
+    b.refresh("r1")
+
+    # Both change the room, a saves first
+    write(a, "r1", "from a")
+    write(b, "r1", "from b")
+    a.flush()
+    b.flush()
+    assert stand_in.data[b"test:room:r1"] == b"from a"
+    assert "Redis Conflict (r1)" in capsys.readouterr().out
+
+    # b drops its write on the next request for the room, then writes again
+    assert b.refresh("r1") is True
+    assert read(b, "r1") == "from a"
+    write(b, "r1", "from b again")
+    b.flush()
+    assert stand_in.data[b"test:room:r1"] == b"from b again"
+
+
+def test_player_ids_are_unique_across_workers(server):
+    _, port = server
+    a, b = worker(port), worker(port)
+    ids = [a.backend.new_player_id(), b.backend.new_player_id(), a.backend.new_player_id()]
+    assert len(set(ids)) == 3
+
+
+def test_make_backend_prefix():
+    backend = make_backend("redis://example:7000/party", None)
+    assert isinstance(backend, RedisBackend)
+    assert backend.client.address == ("example", 7000)
+    assert backend.room_key("r") == "party:room:r"
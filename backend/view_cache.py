@@ -0,0 +1,90 @@
+import json
+import threading
+
+
+class ViewCache:
+    """
+    Rendered game views (get_player_view) and secret texts (get_mole_text /
+    get_innocent_text) per room, so polls that follow an unrelated change don't
+    rebuild them.
+
+    Entries are stored with the versions they were rendered at:
+    - the room version, bumped by invalidate_room() on every /control and /reset
+    - the player version, bumped by invalidate_player() on that player's /game_action
+    Capture versions() before reading the database, an entry rendered while a
+    write was committing then carries an old version and is never served.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.room_versions = {}    # room_id -> int
+        self.player_versions = {}  # (room_id, player_id) -> int
+        self.views = {}            # room_id -> {player_id: (versions, view)}
+        self.secrets = {}          # room_id -> (room_version, parsed dynamic_secret, {(table_idx, is_mole): text})
+        self.stats = {"view_hits": 0, "view_misses": 0, "secret_hits": 0, "secret_misses": 0}
+
+    def versions(self, room_id, player_id):
+        return (self.room_versions.get(room_id, 0), self.player_versions.get((room_id, player_id), 0))
+
+    # --- INVALIDATION ---
+    def invalidate_room(self, room_id):
+        with self.lock:
+            self.room_versions[room_id] = self.room_versions.get(room_id, 0) + 1
+            self.views.pop(room_id, None)
+            self.secrets.pop(room_id, None)
+
+    def invalidate_player(self, room_id, player_id):
+        with self.lock:
+            key = (room_id, player_id)
+            self.player_versions[key] = self.player_versions.get(key, 0) + 1
+            self.views.get(room_id, {}).pop(player_id, None)
+
+    # --- LOOKUPS ---
+    def get_secrets(self, room_id, room_version, raw_secret):
+        """Parsed dynamic_secret of the room, decoded once per room version."""
+        with self.lock:
+            entry = self.secrets.get(room_id)
+            if entry and entry[0] == room_version:
+                return entry[1]
+            parsed = json.loads(raw_secret)
+            self.secrets[room_id] = (room_version, parsed, {})
+            return parsed
+
+    def get_secret_text(self, room_id, room_version, key, render):
+        """key: (table_idx, is_mole), every table's mole has their own text."""
+        with self.lock:
+            entry = self.secrets.get(room_id)
+            if entry and entry[0] == room_version and key in entry[2]:
+                self.stats["secret_hits"] += 1
+                return entry[2][key]
+            self.stats["secret_misses"] += 1
+        text = render()
+        with self.lock:
+            entry = self.secrets.get(room_id)
+            if entry and entry[0] == room_version:
+                entry[2][key] = text
+        return text
+
+    def get_view(self, room_id, player_id, versions, render):
+        with self.lock:
+            entry = self.views.get(room_id, {}).get(player_id)
+            if entry and entry[0] == versions:
+                self.stats["view_hits"] += 1
+                return entry[1]
+            self.stats["view_misses"] += 1
+        view = render()
+        with self.lock:
+            self.views.setdefault(room_id, {})[player_id] = (versions, view)
+        return view
+
+    def hit_rates(self):
+        with self.lock:
+            stats = dict(self.stats)
+        for kind in ("view", "secret"):
+            total = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = round(stats[f"{kind}_hits"] / total, 4) if total else None
+        stats["cached_views"] = sum(len(room) for room in self.views.values())
+        return stats
+
+
+view_cache = ViewCache()
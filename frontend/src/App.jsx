@@ -7,6 +7,8 @@ import ChessView from './components/ChessView'
 import DictionaryView from './components/DictionaryView'
 import RiskView from './components/RiskView'
 import ScoreGraph from './components/ScoreGraph'
+import { useStaticContent } from './staticContent'
+import { applyPatch } from './delta'
 
 // --- AUDIO HELPER ---
 // Plays a beep sound. 
@@ -30,9 +32,32 @@ const playAlarm = () => {
   osc.stop(ctx.currentTime + 0.5);
 }
 
+// --- RETRYING POST ---
+// Every attempt carries the same Idempotency-Key, so the server applies a
+// retried action once and replays its first answer for the others.
+const newIdempotencyKey = () =>
+  window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+
+const postWithRetry = async (url, body, key = newIdempotencyKey(), retries = 3) => {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const res = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+        body: JSON.stringify(body)
+      })
+      if (res.status < 500 || attempt >= retries) return res
+    } catch (e) {
+      if (attempt >= retries) throw e
+    }
+    await new Promise(resolve => setTimeout(resolve, 200 * 2 ** attempt))
+  }
+}
+
 function App() {
   // Local User State
   const [myName, setMyName] = useState("")
+  const [roomCode, setRoomCode] = useState("")
   const [isJoined, setIsJoined] = useState(false)
   const [myId, setMyId] = useState(null)
   
@@ -41,8 +66,8 @@ function App() {
     phase: "LOBBY", // LOBBY, REVEAL, EXPLANATION, GAME_RUNNING, SCORING, QUIZ_INTRO, QUIZ
     players: [],
     me: { is_vip: false, is_mole: false, has_finished_quiz: false },
-    game_content: null,
-    secret_info: "",
+    game_ref: null,
+    secret_ref: null,
     timer_end: 0,
     quiz_data: [],
     round_info: { current: 1, total: 1 },
@@ -55,16 +80,76 @@ function App() {
   const [teamScoreInput, setTeamScoreInput] = useState("")
   const [quizAnswers, setQuizAnswers] = useState({})
   const [revealStep, setRevealStep] = useState(0) // 0=Rankings, 1=Mole, 2=Graph
+  const [splitTables, setSplitTables] = useState(false) // Large lobbies: one mole per table
+  const [tableSize, setTableSize] = useState("")
 
+  // Push Channel State
+  const [socketOpen, setSocketOpen] = useState(false)
+  const socketRef = useRef(null)
+  const pendingActions = useRef({}) // action id -> { resolve, fallback }
+  const actionSeq = useRef(0)
+  const stateEtag = useRef(null) // Lets the server answer 304 when nothing changed
+  const stateVersion = useRef(null) // Version of the last polled state, the server patches from it
 
   const API_URL = `http://${window.location.hostname}:8000`
+  const WS_URL = `ws://${window.location.hostname}:8000`
+  // Every request is scoped to the room we joined ("default" when left empty)
+  const room = encodeURIComponent(roomCode.trim() || "default")
 
-  // 1. Polling the Server
+  // Round-static content is referenced by hash and fetched once per hash
+  const gameContent = useStaticContent(gameState.game_ref && `${API_URL}/games/${gameState.game_ref.id}/meta?v=${gameState.game_ref.hash}`)
+  const secretInfo = useStaticContent(gameState.secret_ref && `${API_URL}/static/${gameState.secret_ref}?room=${room}`)
+  const wordList = useStaticContent(gameState.game_specific?.word_list_ref && `${API_URL}/static/${gameState.game_specific.word_list_ref}?room=${room}`)
+
+  // 1. Push Channel: the server sends our view whenever it changes
   useEffect(() => {
     if (!isJoined) return;
+    let stopped = false;
+    let retryTimer = null;
+
+    const connect = () => {
+      const ws = new WebSocket(`${WS_URL}/ws?player_id=${myId}&room=${room}`)
+      ws.onopen = () => setSocketOpen(true)
+      ws.onmessage = (e) => {
+        const msg = JSON.parse(e.data)
+        stateVersion.current = null // Our state no longer matches the polled version
+        if (msg.type === 'state') {
+          setGameState(msg.data)
+        } else if (msg.type === 'patch') {
+          setGameState(prev => applyPatch(prev, msg.data))
+        } else if (msg.type === 'action_result') {
+          const pending = pendingActions.current[msg.id]
+          delete pendingActions.current[msg.id]
+          if (pending) pending.resolve(msg.error ? { error: msg.error } : msg.result)
+        }
+      }
+      ws.onclose = () => {
+        setSocketOpen(false)
+        socketRef.current = null
+        // Actions that never got an answer go over HTTP with the same key,
+        // the server applies them once whichever attempt arrived
+        Object.values(pendingActions.current).forEach(({ resolve, fallback }) =>
+          fallback().then(resolve, () => resolve({ error: "disconnected" })))
+        pendingActions.current = {}
+        if (!stopped) retryTimer = setTimeout(connect, 2000)
+      }
+      socketRef.current = ws
+    }
+
+    connect()
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      if (socketRef.current) socketRef.current.close();
+    }
+  }, [isJoined, myId]);
+
+  // 2. Polling the Server (only while the socket is down)
+  useEffect(() => {
+    if (!isJoined || socketOpen) return;
     const interval = setInterval(fetchGameState, 1000); // Poll every second for timer sync
     return () => clearInterval(interval);
-  }, [isJoined, myId]);
+  }, [isJoined, myId, socketOpen]);
 
   useEffect(() => {
     if (gameState.phase === "SCORING") {
@@ -72,7 +157,7 @@ function App() {
     }
   }, [gameState.phase]);
 
-  // 2. Timer Countdown Logic
+  // 3. Timer Countdown Logic
   useEffect(() => {
     if (gameState.phase === 'GAME_RUNNING' && gameState.timer_end) {
       const timerInterval = setInterval(() => {
@@ -91,9 +176,15 @@ function App() {
 
   const fetchGameState = async () => {
     try {
-      const res = await fetch(`${API_URL}/state?player_id=${myId}`)
+      const headers = stateEtag.current ? { 'If-None-Match': stateEtag.current } : {}
+      const since = encodeURIComponent(stateVersion.current || '')
+      const res = await fetch(`${API_URL}/state?player_id=${myId}&room=${room}&since=${since}`, { headers, cache: 'no-store' })
+      if (res.status === 304) return;
+      stateEtag.current = res.headers.get('ETag')
       const data = await res.json()
-      setGameState(data)
+      stateVersion.current = data.version
+      // A patch when the server still knows our version, the full state otherwise
+      setGameState(prev => data.patch ? applyPatch(prev, data.patch) : data.state)
     } catch (e) {
       console.error("Polling error", e)
     }
@@ -102,7 +193,7 @@ function App() {
   const handleJoin = async () => {
     if (!myName) return;
     try {
-      const res = await fetch(`${API_URL}/join?name=${myName}`, { method: 'POST' })
+      const res = await fetch(`${API_URL}/join?name=${encodeURIComponent(myName)}&room=${room}`, { method: 'POST' })
       const data = await res.json()
       setMyId(data.player_id)
       setIsJoined(true)
@@ -115,12 +206,8 @@ function App() {
   // Unified Action Sender
   const sendAction = async (action, payload = {}) => {
     try {
-        await fetch(`${API_URL}/control?action=${action}`, { 
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(payload)
-        })
-        fetchGameState() // Instant update
+        await postWithRetry(`${API_URL}/control?action=${action}&room=${room}`, payload)
+        if (!socketOpen) fetchGameState() // Instant update (the socket pushes it otherwise)
     } catch (e) {
         alert("Action failed: " + action)
     }
@@ -128,14 +215,24 @@ function App() {
 
   // Helper for game-specific actions (like guessing)
   const sendGameAction = async (action, payload = {}) => {
-    const res = await fetch(`${API_URL}/game_action?player_id=${myId}&action=${action}`, { 
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(payload)
-    })
-    const data = await res.json()
-    fetchGameState() // Refresh immediately
-    return data; 
+    // One key for every attempt, over the socket and over HTTP
+    const key = newIdempotencyKey()
+    const post = async () => {
+        const res = await postWithRetry(`${API_URL}/game_action?player_id=${myId}&action=${action}&room=${room}`, payload, key)
+        const data = await res.json()
+        fetchGameState() // Refresh immediately
+        return data;
+    }
+
+    const ws = socketRef.current
+    if (ws && ws.readyState === WebSocket.OPEN) {
+        const id = ++actionSeq.current
+        return new Promise(resolve => {
+            pendingActions.current[id] = { resolve, fallback: post }
+            ws.send(JSON.stringify({ id, key, action, payload }))
+        })
+    }
+    return post()
   }
 
   const submitQuiz = async () => {
@@ -144,11 +241,7 @@ function App() {
         alert("Please answer all questions before submitting.");
         return;
     }
-    await fetch(`${API_URL}/submit_quiz?player_id=${myId}`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(quizAnswers)
-    })
+    await postWithRetry(`${API_URL}/submit_quiz?player_id=${myId}&room=${room}`, quizAnswers)
     // Optimistic update
     setGameState(prev => ({...prev, me: {...prev.me, has_finished_quiz: true}}))
   }
@@ -163,6 +256,7 @@ function App() {
   const ProgressBar = ({ current, total }) => (
   <div style={{ padding: '5px', fontSize: '12px', color: '#666', borderBottom: '1px solid #eee', marginBottom: '10px' }}>
     ROUND {current} OF {total}
+    {gameState.table_count > 1 && ` · TABLE ${(gameState.me.table ?? 0) + 1} OF ${gameState.table_count}`}
   </div>
 )
 
@@ -174,6 +268,8 @@ function App() {
       <JoinView 
         myName={myName} 
         setMyName={setMyName} 
+        roomCode={roomCode} 
+        setRoomCode={setRoomCode} 
         handleJoin={handleJoin} 
       />
     )
@@ -181,23 +277,50 @@ function App() {
 
   // 2. Lobby (Restored "Waiting" text & Button Text)
   if (gameState.phase === "LOBBY") {
+    // The list only has the first page of a large lobby
+    const playerCount = gameState.player_count ?? gameState.players.length
+    const size = parseInt(tableSize || gameState.suggested_table_size, 10)
+    const startGame = () => sendAction('start_game', splitTables && size ? { table_size: size } : {})
     return (
       <div style={styles.container}>
         <h2>Lobby</h2>
-        <p>Waiting for everyone to join...</p>
+        <p>Waiting for everyone to join... ({playerCount} joined)</p>
         <ul style={styles.list}>
           {gameState.players.map(p => (
             <li key={p.id} style={styles.listItem}>{p.name} {p.is_vip ? "👑" : "🐱"}</li>
           ))}
         </ul>
         
+        {/* Large lobbies: the VIP can split everyone into tables, each with its own mole */}
+        {gameState.me.is_vip && playerCount >= 4 && (
+          <div>
+            <label>
+              <input type="checkbox" checked={splitTables} onChange={e => setSplitTables(e.target.checked)} />
+              {' '}Split into tables, one mole each
+            </label>
+            {splitTables && (
+              <div>
+                <input
+                  style={styles.input}
+                  type="number"
+                  min="2"
+                  placeholder={`${gameState.suggested_table_size || 10} players per table`}
+                  value={tableSize}
+                  onChange={e => setTableSize(e.target.value)}
+                />
+                <p style={{color: '#999'}}>{Math.min(Math.ceil(playerCount / Math.max(size || 2, 2)), Math.floor(playerCount / 2))} tables</p>
+              </div>
+            )}
+          </div>
+        )}
+
         {/* Logic: Only VIP can start, need 2+ players */}
-        {gameState.me.is_vip && gameState.players.length > 1 && (
-          <button style={styles.vipButton} onClick={() => sendAction('start_game')}>
-            Start Game & Assign Mole
+        {gameState.me.is_vip && playerCount > 1 && (
+          <button style={styles.vipButton} onClick={startGame}>
+            {splitTables ? "Start Game & Assign Moles" : "Start Game & Assign Mole"}
           </button>
         )}
-        {gameState.me.is_vip && gameState.players.length < 2 && (
+        {gameState.me.is_vip && playerCount < 2 && (
           <p style={{color: '#999'}}>Need at least 2 players to start.</p>
         )}
       </div>
@@ -233,7 +356,7 @@ function App() {
 
   // Explanation Phase (with Secret Intel and Quiz Hint)
   if (gameState.phase === "EXPLANATION") {
-    const content = gameState.game_content || {}
+    const content = gameContent || {}
     return (
       <div style={styles.container}>
         <ProgressBar current={gameState.round_info?.current} total={gameState.round_info?.total} />
@@ -253,9 +376,9 @@ function App() {
                         <strong>{gameState.game_specific.role_text}</strong>
                     </p>
                 )}
-                {gameState.secret_info && (
+                {secretInfo && (
                     <div style={{ whiteSpace: 'pre-line', lineHeight: '1.6', color: '#333' }}>
-                        {gameState.secret_info}
+                        {secretInfo}
                     </div>
                 )}
             </div>
@@ -296,7 +419,7 @@ function App() {
   // 5. Game Running (Simplified Timer Visuals)
   if (gameState.phase === "GAME_RUNNING") {
     // 1. Check if it's the Who Am I game
-    if (gameState.game_content?.id === 'who-am-i') {
+    if (gameState.game_ref?.id === 'who-am-i') {
         return (
             <div style={styles.container}>
                 <WhoAmIView 
@@ -313,7 +436,7 @@ function App() {
         )
     }
 
-    if (gameState.game_content?.id === 'chess-challenges') {
+    if (gameState.game_ref?.id === 'chess-challenges') {
         return (
             <div style={styles.container}>
                 <ChessView 
@@ -330,12 +453,12 @@ function App() {
         )
     }
 
-    if (gameState.game_content?.id === 'dictionary-dudes') {
+    if (gameState.game_ref?.id === 'dictionary-dudes') {
         return (
             <div style={styles.container}>
                 <DictionaryView 
                     timeLeft={timeLeft} 
-                    gameSpecific={gameState.game_specific || {}} 
+                    gameSpecific={{...gameState.game_specific, word_list: wordList || []}} 
                 />
                 {gameState.me.is_vip && (
                     <button style={{...styles.vipButton, marginTop: '30px', background: '#c0392b'}} onClick={() => sendAction('end_game_early')}>
@@ -347,7 +470,7 @@ function App() {
     }
 
     // Risk Game (NEW)
-    if (gameState.game_content?.id === 'risky-business') {
+    if (gameState.game_ref?.id === 'risky-business') {
         return (
             <div style={styles.container}>
                 <RiskView 
@@ -395,10 +518,10 @@ function App() {
   if (gameState.phase === "SCORING") {
     // Defines which games use AUTOMATIC scoring (no input needed)
     // Removed 'risky-business' from here because it needs manual input for Troops
-    const isFullyAutomated = ['who-am-i', 'chess-challenges'].includes(gameState.game_content?.id);
+    const isFullyAutomated = ['who-am-i', 'chess-challenges'].includes(gameState.game_ref?.id);
     
     // Defines which games need MANUAL input
-    const isManual = ['ritual', 'dictionary-dudes', 'risky-business'].includes(gameState.game_content?.id);
+    const isManual = ['ritual', 'dictionary-dudes', 'risky-business'].includes(gameState.game_ref?.id);
 
     return (
         <div style={styles.container}>
@@ -412,7 +535,7 @@ function App() {
                 )}
 
                 {/* Specific Text for Risk */}
-                {gameState.game_content?.id === 'risky-business' && (
+                {gameState.game_ref?.id === 'risky-business' && (
                      <>
                         <p>Count total troops alive on board.</p>
                         <p>Calculate: <strong>(Troops × 5)</strong></p>
@@ -421,7 +544,7 @@ function App() {
                 )}
 
                 {/* Specific Text for Standard Manual Games */}
-                {(gameState.game_content?.id === 'ritual' || gameState.game_content?.id === 'dictionary-dudes') && (
+                {(gameState.game_ref?.id === 'ritual' || gameState.game_ref?.id === 'dictionary-dudes') && (
                      <>
                         <p>Please count the points earned by the team.</p>
                         <p><em>(Max possible: {gameState.max_points})</em></p>
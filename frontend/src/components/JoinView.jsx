@@ -1,7 +1,7 @@
 import { styles } from '../styles'
 import SecretSection from './SecretSection'
 
-const JoinView = ({ myName, setMyName, handleJoin }) => {
+const JoinView = ({ myName, setMyName, roomCode, setRoomCode, handleJoin }) => {
     
     const MOLE_NAME = "The Lars";
     const MOLE_ONLY_NAME = "Lars";
@@ -67,6 +67,14 @@ const JoinView = ({ myName, setMyName, handleJoin }) => {
                     onChange={(e) => setMyName(e.target.value)}
                     onKeyDown={(e) => e.key === 'Enter' && handleJoin()}
                 />
+                <input 
+                    style={{...styles.input, width: '100%', boxSizing: 'border-box', marginTop: '10px'}} 
+                    type="text" 
+                    placeholder="Room code (optional)" 
+                    value={roomCode} 
+                    onChange={(e) => setRoomCode(e.target.value)}
+                    onKeyDown={(e) => e.key === 'Enter' && handleJoin()}
+                />
                 <button style={{...styles.button, width: '100%', marginTop: '10px'}} onClick={handleJoin}>
                     Join Game
                 </button>
@@ -0,0 +1,16 @@
+// Applies a patch from the server (see backend/delta.py) without mutating
+// state: every object or list on a changed path is copied, the rest is shared.
+// Each op is [path] (remove) or [path, value] (set).
+const applyOp = (node, path, op) => {
+  if (path.length === 0) return op[1]
+  const [key, ...rest] = path
+  const copy = Array.isArray(node) ? [...node] : { ...node }
+  if (rest.length === 0 && op.length === 1) {
+    delete copy[key]
+  } else {
+    copy[key] = applyOp(node?.[key], rest, op)
+  }
+  return copy
+}
+
+export const applyPatch = (state, ops) => ops.reduce((node, op) => applyOp(node, op[0], op), state)
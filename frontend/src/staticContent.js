@@ -0,0 +1,49 @@
+import { useEffect, useState } from 'react'
+
+// Content the server references by hash (game descriptions, round secrets).
+// A URL always returns the same content, so each one is fetched only once.
+const loaded = new Map() // url -> content
+const loading = new Map() // url -> Promise
+
+const load = (url) => {
+  if (!loading.has(url)) {
+    const request = fetch(url)
+      .then(res => {
+        if (!res.ok) throw new Error(`${res.status} ${url}`)
+        return res.json()
+      })
+      .then(content => {
+        loaded.set(url, content)
+        return content
+      })
+      .catch(e => {
+        loading.delete(url) // Let the next render try again
+        throw e
+      })
+    loading.set(url, request)
+  }
+  return loading.get(url)
+}
+
+// Returns the content at url, or null while it loads (or when url is empty)
+export const useStaticContent = (url) => {
+  const [content, setContent] = useState(() => (url ? loaded.get(url) ?? null : null))
+
+  useEffect(() => {
+    if (!url) {
+      setContent(null)
+      return
+    }
+    if (loaded.has(url)) {
+      setContent(loaded.get(url))
+      return
+    }
+    let current = true
+    load(url)
+      .then(value => { if (current) setContent(value) })
+      .catch(() => {})
+    return () => { current = false }
+  }, [url])
+
+  return url ? content : null
+}